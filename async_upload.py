@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import base64
+import asyncio
+import hashlib
+import argparse
+import mimetypes
+from dotenv import load_dotenv
+from gcs_config import load_config
+from datetime import datetime
+from urllib.parse import quote
+from google.auth.transport.requests import Request
+from gcs_client import get_bucket, get_storage_client
+from url_signer import get_url_signer, URL_LIFETIME
+from url_store import open_record_store
+from hash_cache import is_unchanged, skip_unchanged_enabled
+from metrics import span, increment, profile_run
+from resumable_upload import get_resumable_threshold
+from compressed_upload import get_compression, should_compress
+from retry_scheduler import get_max_attempts, is_retryable, is_throttled, backoff_delay
+from gcs_upload_and_sign import build_blob_path, ensure_folder_marker, upload_file, collect_files, split_colliding_entries
+
+try:
+    import aiohttp
+except ImportError:
+    # Without aiohttp the upload stage runs the blocking client in worker threads
+    aiohttp = None
+
+DEFAULT_API_ENDPOINT = 'https://storage.googleapis.com'
+
+def get_async_concurrency():
+    """Number of transfers kept in flight by the async pipeline"""
+    return max(1, int(os.getenv('GCS_ASYNC_CONCURRENCY', '64')))
+
+def _read_file(file_path):
+    """Read a small file and return its bytes and base64 MD5"""
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    return data, base64.b64encode(hashlib.md5(data).digest()).decode('ascii')
+
+class AsyncUploader:
+    """
+    asyncio counterpart of upload_and_sign(). File reads, uploads, signing and
+    record commits run as pipeline stages connected by bounded queues, so a single
+    event loop keeps many transfers in flight and memory stays bounded.
+
+    Small files are sent with aiohttp to the GCS JSON API when it is installed;
+    files above GCS_RESUMABLE_THRESHOLD (or every file without aiohttp) go through
+    the blocking chunked upload in a worker thread.
+
+        async with AsyncUploader(bucket_name, credentials_path) as uploader:
+            signed_url, blob_path = await uploader.upload_and_sign('report.pdf', 'folder1')
+    """
+
+    def __init__(self, bucket_name, credentials_path, concurrency=None, records_file=None, skip_unchanged=None):
+        self.bucket_name = bucket_name
+        self.credentials_path = credentials_path
+        self.concurrency = concurrency or get_async_concurrency()
+        self.records_file = records_file
+        self.skip_unchanged = skip_unchanged_enabled() if skip_unchanged is None else skip_unchanged
+        self.api_endpoint = (os.getenv('STORAGE_EMULATOR_HOST') or DEFAULT_API_ENDPOINT).rstrip('/')
+        # Files whose upload was skipped because the bucket already holds their content
+        self.skipped = set()
+        self._session = None
+
+    async def __aenter__(self):
+        # Clients, signer and store are created once, off the event loop
+        self.bucket = await asyncio.to_thread(get_bucket, self.bucket_name, self.credentials_path)
+        self.signer = await asyncio.to_thread(get_url_signer, self.credentials_path)
+        self.store = await asyncio.to_thread(open_record_store, self.records_file)
+        self._credentials = get_storage_client(self.credentials_path)._credentials
+        self._token_lock = asyncio.Lock()
+        if aiohttp is not None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.concurrency),
+                timeout=aiohttp.ClientTimeout(total=120)
+            )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _auth_headers(self):
+        async with self._token_lock:
+            if not self._credentials.valid:
+                await asyncio.to_thread(self._credentials.refresh, Request())
+        headers = {}
+        self._credentials.apply(headers)
+        return headers
+
+    async def _upload_bytes(self, file_path, blob_path, data, md5_hash):
+        """Upload a file held in memory with a single media request and check its MD5"""
+        url = f"{self.api_endpoint}/upload/storage/v1/b/{quote(self.bucket_name, safe='')}/o"
+        headers = await self._auth_headers()
+        headers['Content-Type'] = mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+        params = {'uploadType': 'media', 'name': blob_path}
+        async with self._session.post(url, params=params, data=data, headers=headers) as response:
+            if response.status >= 400:
+                from google.api_core.exceptions import from_http_status
+                message = (await response.text())[:200]
+                raise from_http_status(response.status, f"Upload of {blob_path} failed: {message}")
+            resource = await response.json(content_type=None)
+        if resource.get('md5Hash') and resource['md5Hash'] != md5_hash:
+            raise ValueError(f"MD5 mismatch after upload of {blob_path}")
+        increment('gcs_uploads_total', help='Files handled by upload mode', mode='media')
+        increment('gcs_upload_bytes_total', len(data), help='Bytes uploaded', mode='media')
+
+    async def _read(self, file_path, folder_path):
+        """Read stage: resolve the blob path, create the folder marker and load small files"""
+        blob_path, folder_prefix = build_blob_path(file_path, folder_path)
+        if folder_prefix:
+            await asyncio.to_thread(ensure_folder_marker, self.bucket, folder_prefix)
+        if (self._session is None or os.path.getsize(file_path) > get_resumable_threshold()
+                or (get_compression() and should_compress(file_path))):
+            # Compressible files go through upload_file, which compresses them on the fly
+            return blob_path, None
+        data = await asyncio.to_thread(_read_file, file_path)
+        return blob_path, data
+
+    def _is_unchanged(self, file_path, blob_path):
+        """Whether the blob already holds the content of the file, as in upload_and_sign()"""
+        with span('unchanged_check'):
+            return is_unchanged(self.bucket.get_blob(blob_path, timeout=120), file_path)
+
+    async def _upload_and_sign(self, file_path, blob_path, data):
+        """Upload stage, skipped for unchanged files, followed by local signing"""
+        if self.skip_unchanged and await asyncio.to_thread(self._is_unchanged, file_path, blob_path):
+            increment('gcs_uploads_total', help='Files handled by upload mode', mode='skipped')
+            self.skipped.add(file_path)
+            return self.signer.sign(self.bucket_name, blob_path, expiration=URL_LIFETIME)
+        with span('upload'):
+            if data is None:
+                await asyncio.to_thread(upload_file, self.bucket.blob(blob_path), file_path)
+            else:
+                await self._upload_bytes(file_path, blob_path, *data)
+        return self.signer.sign(self.bucket_name, blob_path, expiration=URL_LIFETIME)
+
+    async def _upload_with_retry(self, file_path, blob_path, data):
+        """Upload stage retrying transient errors with jittered exponential backoff"""
+        attempt = 1
+        while True:
+            try:
+                return await self._upload_and_sign(file_path, blob_path, data)
+            except Exception as e:
+                if attempt >= get_max_attempts() or not is_retryable(e):
+                    raise
+                increment('gcs_retries_total', help='Operations resumed or retried', operation='upload',
+                          reason='throttled' if is_throttled(e) else 'error')
+                await asyncio.sleep(backoff_delay(attempt, e))
+                attempt += 1
+
+    async def upload_and_sign(self, file_path, folder_path=None):
+        """Upload one file, sign it and save its record. Returns (signed_url, blob_path)."""
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"File {file_path} does not exist")
+        expiration_date = datetime.now() + URL_LIFETIME
+        blob_path, data = await self._read(file_path, folder_path)
+        signed_url = await self._upload_and_sign(file_path, blob_path, data)
+        await asyncio.to_thread(self.store.save, blob_path, signed_url, expiration_date)
+        return signed_url, blob_path
+
+    async def upload_and_sign_many(self, entries, progress=None):
+        """
+        Run the pipeline over (file_path, folder_path) pairs
+        Returns:
+            (results, failures) where results is a list of (file_path, blob_path, signed_url)
+            and failures a list of (file_path, error message)
+        """
+        read_queue = asyncio.Queue(maxsize=self.concurrency)
+        upload_queue = asyncio.Queue(maxsize=self.concurrency)
+        commit_queue = asyncio.Queue(maxsize=self.concurrency * 4)
+        results = []
+        failures = []
+        readers = max(1, min(8, self.concurrency))
+
+        async def produce():
+            for entry in entries:
+                await read_queue.put(entry)
+            for _ in range(readers):
+                await read_queue.put(None)
+
+        async def read():
+            while (entry := await read_queue.get()) is not None:
+                file_path, folder_path = entry
+                try:
+                    blob_path, data = await self._read(file_path, folder_path)
+                    await upload_queue.put((file_path, blob_path, data))
+                except Exception as e:
+                    failures.append((file_path, str(e)))
+
+        async def upload():
+            while (item := await upload_queue.get()) is not None:
+                file_path, blob_path, data = item
+                try:
+                    signed_url = await self._upload_with_retry(file_path, blob_path, data)
+                    await commit_queue.put((file_path, blob_path, signed_url))
+                    if progress:
+                        progress(os.path.getsize(file_path))
+                except Exception as e:
+                    failures.append((file_path, str(e)))
+
+        async def commit():
+            done = False
+            while not done:
+                batch = [await commit_queue.get()]
+                while not commit_queue.empty() and len(batch) < 500:
+                    batch.append(commit_queue.get_nowait())
+                if batch[-1] is None:
+                    batch.pop()
+                    done = True
+                if not batch:
+                    continue
+                expiration_date = datetime.now() + URL_LIFETIME
+                # Records are committed in batches: one transaction or journal append each
+                try:
+                    with span('record'):
+                        await asyncio.to_thread(self.store.save_many, [
+                            (blob_path, signed_url, expiration_date) for _, blob_path, signed_url in batch
+                        ])
+                except Exception as e:
+                    # Keep draining the queue so the uploaders never block on a full one
+                    failures.extend((file_path, f"Saving the record failed: {e}") for file_path, _, _ in batch)
+                    continue
+                results.extend(batch)
+
+        committer = asyncio.create_task(commit())
+        uploaders = [asyncio.create_task(upload()) for _ in range(self.concurrency)]
+        await asyncio.gather(produce(), *[read() for _ in range(readers)])
+        for _ in uploaders:
+            await upload_queue.put(None)
+        await asyncio.gather(*uploaders)
+        await commit_queue.put(None)
+        await committer
+        return results, failures
+
+async def upload_batch_async(patterns, bucket_name, credentials_path, folder_path=None, concurrency=None,
+                             skip_unchanged=None):
+    """Async equivalent of upload_batch(): same inputs, same (results, failures) output"""
+    files = collect_files(patterns)
+    entries, collisions = split_colliding_entries([
+        (file_path, '/'.join(part for part in (folder_path, sub_folder) if part) or None)
+        for file_path, sub_folder in files
+    ])
+    total_bytes = sum(os.path.getsize(file_path) for file_path, _ in entries)
+    async with AsyncUploader(bucket_name, credentials_path, concurrency, skip_unchanged=skip_unchanged) as uploader:
+        print(f"\nUploading {len(entries)} files ({total_bytes / 1024 / 1024:.1f} MiB) "
+              f"with {uploader.concurrency} transfers in flight...")
+        start = time.monotonic()
+        results, failures = await uploader.upload_and_sign_many(entries)
+    elapsed = time.monotonic() - start
+    failures = collisions + failures
+    # Files that were only re-signed do not count towards the throughput
+    uploaded_files = [file_path for file_path, _, _ in results if file_path not in uploader.skipped]
+    uploaded = len(uploaded_files)
+    skipped = len(results) - uploaded
+    throughput = sum(os.path.getsize(file_path) for file_path in uploaded_files) / elapsed if elapsed > 0 else 0
+    print(f"\nUploaded {uploaded}/{len(files)} files in {elapsed:.1f}s "
+          f"({throughput / 1024 / 1024:.2f} MiB/s, {uploaded / elapsed if elapsed > 0 else 0:.1f} files/s)")
+    if skipped:
+        print(f"{skipped} unchanged files skipped and only re-signed")
+    return results, failures
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description='Upload and sign many files with the asyncio pipeline')
+    parser.add_argument('paths', nargs='+', help='Files, directories or glob patterns')
+    parser.add_argument('--folder', dest='folder_path', help='Folder path within the bucket used as the batch root')
+    parser.add_argument('--concurrency', type=int, default=None,
+                        help='Transfers in flight (default: GCS_ASYNC_CONCURRENCY or 64)')
+    parser.add_argument('--force', action='store_true', help='Upload files even if the bucket already has the same content')
+    args = parser.parse_args()
+
+    bucket_name, credentials_path = load_config()
+    try:
+        get_compression()
+    except ValueError as e:
+        sys.exit(f"Error: {e}")
+
+    results, failures = asyncio.run(
+        upload_batch_async(args.paths, bucket_name, credentials_path, args.folder_path, args.concurrency,
+                           skip_unchanged=False if args.force else None)
+    )
+    print("\nSigned URLs (valid for 7 days):")
+    for file_path, blob_path, signed_url in sorted(results, key=lambda result: result[1]):
+        print(f"{blob_path}\t{signed_url}")
+    if failures:
+        print(f"\n{len(failures)} file(s) failed:")
+        for file_path, error in failures:
+            print(f"- {file_path}: {error}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    with profile_run():
+        main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+"""
+Measure how long each script takes to import, in fresh interpreters.
+
+Every module is imported --runs times with `python -X importtime`; the median
+self-reported import time and the median wall time of the whole process are
+printed next to an empty interpreter. With --budget-ms the exit status is 1
+when a module listed in CHEAP_MODULES imports slower than the budget.
+
+    python benchmarks/bench_import_time.py --runs 7 --budget-ms 60
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+
+# Modules behind commands that only read or write records; they must not load google-cloud
+CHEAP_MODULES = ['url_store', 'url_signer', 'gcs_upload_and_sign', 'check_expired_urls',
+                 'manage_urls', 'gcs_cli', 'renew_urls', 'bucket_index', 'retry_scheduler',
+                 'watch_folder']
+# Modules that load the storage client at import time by design
+HEAVY_MODULES = ['gcs_client', 'async_upload']
+
+def measure(module, runs):
+    """Median (import time in ms, process wall time in ms) of importing a module"""
+    import_times = []
+    wall_times = []
+    code = f"import {module}" if module else "pass"
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                                cwd=REPO_DIR, capture_output=True, text=True, check=True)
+        wall_times.append((time.perf_counter() - start) * 1000)
+        if module:
+            # The last line reporting the module itself holds its cumulative time in microseconds
+            lines = [line for line in result.stderr.splitlines() if line.rstrip().endswith(f"| {module}")]
+            import_times.append(int(lines[-1].split('|')[1]) / 1000)
+    return (statistics.median(import_times) if import_times else 0.0), statistics.median(wall_times)
+
+def main():
+    parser = argparse.ArgumentParser(description='Import time of every script')
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters per module')
+    parser.add_argument('--budget-ms', type=float, default=None,
+                        help='Fail when a cheap module takes longer than this to import')
+    parser.add_argument('modules', nargs='*', help='Modules to measure (default: all scripts)')
+    args = parser.parse_args()
+
+    modules = args.modules or CHEAP_MODULES + HEAVY_MODULES
+    _, baseline = measure(None, args.runs)
+    print(f"{'Module':<22} {'Import ms':>10} {'Process ms':>11}")
+    print(f"{'(empty interpreter)':<22} {'':>10} {baseline:>11.1f}")
+
+    over_budget = []
+    for module in modules:
+        import_ms, wall_ms = measure(module, args.runs)
+        print(f"{module:<22} {import_ms:>10.1f} {wall_ms:>11.1f}")
+        if args.budget_ms is not None and module in CHEAP_MODULES and import_ms > args.budget_ms:
+            over_budget.append(module)
+
+    if over_budget:
+        print(f"\nOver the {args.budget_ms:g} ms budget: {', '.join(over_budget)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
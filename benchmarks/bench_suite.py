@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark suite for the upload, signing, listing and record store paths.
+
+Each scenario drives the public functions of the scripts against an in-process
+fake GCS server (or the emulator in STORAGE_EMULATOR_HOST) and sweeps one
+parameter: file sizes for upload_and_sign(), object counts for
+list_bucket_files(), and record store sizes (JSON and SQLite) for
+save_url_record() and check_all_urls(). p50/p99 latency and throughput are
+printed for every case.
+
+Results can be saved as a baseline and later runs compared against it; a case
+whose p50 is slower than the baseline by more than --tolerance fails the run:
+
+    python benchmarks/bench_suite.py --save-baseline benchmarks/baseline.json
+    python benchmarks/bench_suite.py --compare benchmarks/baseline.json
+
+Baselines are only comparable on the same machine and with the same parameters.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import contextlib
+from datetime import datetime, timedelta
+from contextlib import nullcontext
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from fake_gcs import FakeGCSServer
+from bench_upload_pipelines import write_service_account_key
+
+BUCKET = 'benchmark'
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+def summarize(name, latencies, total_bytes=0):
+    """Result entry of one benchmark case"""
+    elapsed = sum(latencies)
+    result = {
+        'name': name,
+        'operations': len(latencies),
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'ops_per_second': len(latencies) / elapsed if elapsed > 0 else 0,
+    }
+    if total_bytes:
+        result['mib_per_second'] = total_bytes / 1024 / 1024 / elapsed if elapsed > 0 else 0
+    return result
+
+def timed(function, *args, **kwargs):
+    """Run a function with its console output discarded; return its duration in seconds"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), \
+            contextlib.redirect_stderr(devnull):
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        return time.perf_counter() - start
+
+def populate_bucket(server, bucket, prefix, count):
+    """Create count small objects below prefix, directly in the fake when it runs in-process"""
+    names = [f"{prefix}object_{index:07d}.txt" for index in range(count)]
+    if server is not None:
+        for name in names:
+            server.storage.put(BUCKET, name, b'x')
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            list(executor.map(lambda name: bucket.blob(name).upload_from_string(b'x'), names))
+
+def populate_store(records_file, count, expired_every=0):
+    """Fill a record store with count records; every expired_every-th one is already expired"""
+    from url_store import open_record_store
+    now = datetime.now()
+    items = []
+    for index in range(count):
+        expired = expired_every and index % expired_every == 0
+        expiration = now - timedelta(hours=1) if expired else now + timedelta(days=7)
+        items.append((f"records/file_{index:07d}.bin", f"https://example.invalid/{index}", expiration))
+    store = open_record_store(records_file)
+    for start in range(0, len(items), 10000):
+        store.save_many(items[start:start + 10000])
+
+def bench_upload(args):
+    from gcs_upload_and_sign import upload_and_sign
+    results = []
+    os.makedirs('upload', exist_ok=True)
+    # The first upload creates the client and its connections; it is not measured
+    with open(os.path.join('upload', 'warmup.bin'), 'wb') as f:
+        f.write(b'warmup')
+    timed(upload_and_sign, os.path.join('upload', 'warmup.bin'), BUCKET, 'key.json', 'upload', skip_unchanged=False)
+    for size in args.sizes:
+        latencies = []
+        for index in range(args.count):
+            path = os.path.join('upload', f"file_{size}_{index:05d}.bin")
+            with open(path, 'wb') as f:
+                f.write(os.urandom(size))
+            latencies.append(timed(upload_and_sign, path, BUCKET, 'key.json', 'upload', skip_unchanged=False))
+            os.remove(path)
+        results.append(summarize(f"upload_and_sign[size={size}]", latencies, size * args.count))
+    return results
+
+def bench_sign(args):
+    from gcs_client import get_bucket
+    from url_signer import get_url_signer
+    from gcs_sign_existing import generate_signed_url
+    bucket = get_bucket(BUCKET, 'key.json')
+    signer = get_url_signer('key.json')
+    latencies = []
+    for index in range(args.count * 20):
+        blob = bucket.blob(f"sign/file_{index:06d}.bin")
+        start = time.perf_counter()
+        generate_signed_url(blob, signer)
+        latencies.append(time.perf_counter() - start)
+    return [summarize('generate_signed_url', latencies)]
+
+def bench_list(args, server):
+    from gcs_client import get_bucket
+    from gcs_sign_existing import list_bucket_files
+    bucket = get_bucket(BUCKET, 'key.json')
+    results = []
+    for count in args.object_counts:
+        prefix = f"list_{count}/"
+        populate_bucket(server, bucket, prefix, count)
+        latencies = [timed(list_bucket_files, bucket, prefix) for _ in range(args.repeat)]
+        results.append(summarize(f"list_bucket_files[objects={count}]", latencies))
+    return results
+
+def bench_store(args):
+    from gcs_upload_and_sign import save_url_record
+    from check_expired_urls import check_all_urls
+    results = []
+    for backend, extension in (('json', '.json'), ('sqlite', '.db')):
+        for size in args.store_sizes:
+            records_file = f"store_{backend}_{size}{extension}"
+            populate_store(records_file, size)
+            expiration = datetime.now() + timedelta(days=7)
+            latencies = [
+                timed(save_url_record, f"records/file_{index * 7 % size:07d}.bin",
+                      f"https://example.invalid/new/{index}", expiration, records_file)
+                for index in range(args.count * 5)
+            ]
+            results.append(summarize(f"save_url_record[{backend},records={size}]", latencies))
+
+            latencies = []
+            for _ in range(args.repeat):
+                # A hundredth of the records is expired before each run, which then removes them
+                populate_store(records_file, size, expired_every=100)
+                latencies.append(timed(check_all_urls, records_file))
+            results.append(summarize(f"check_all_urls[{backend},records={size}]", latencies))
+    return results
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    """Print the change of every case against the baseline; return the names of regressions"""
+    previous = {result['name']: result for result in baseline['results']}
+    regressions = []
+    print(f"\n{'Case':<44} {'Baseline p50':>13} {'p50':>10} {'Change':>8}")
+    for result in results:
+        before = previous.get(result['name'])
+        if before is None:
+            print(f"{result['name']:<44} {'-':>13} {result['p50_ms']:>10.3f} {'new':>8}")
+            continue
+        change = result['p50_ms'] / before['p50_ms'] - 1 if before['p50_ms'] else 0
+        flag = ''
+        # Cases of a few milliseconds vary by more than the tolerance from run to run
+        if change > tolerance and result['p50_ms'] - before['p50_ms'] > min_delta_ms:
+            regressions.append(result['name'])
+            flag = '  REGRESSION'
+        print(f"{result['name']:<44} {before['p50_ms']:>13.3f} {result['p50_ms']:>10.3f} {change:>+8.0%}{flag}")
+    return regressions
+
+def parse_sizes(value):
+    return [int(item) for item in value.split(',') if item]
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark suite against a fake GCS server')
+    parser.add_argument('--sizes', type=parse_sizes, default=[4096, 1024 * 1024, 16 * 1024 * 1024],
+                        help='Comma separated upload sizes in bytes')
+    parser.add_argument('--count', type=int, default=20, help='Uploads per size (signing and saves scale with it)')
+    parser.add_argument('--object-counts', type=parse_sizes, default=[100, 1000, 10000],
+                        help='Comma separated bucket sizes for the listing benchmark')
+    parser.add_argument('--store-sizes', type=parse_sizes, default=[1000, 10000, 100000],
+                        help='Comma separated record store sizes')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs of the listing and expiration checks')
+    parser.add_argument('--only', choices=('upload', 'sign', 'list', 'store'), action='append',
+                        help='Run only these scenarios (repeatable)')
+    parser.add_argument('--save-baseline', metavar='FILE', help='Write the results to a baseline file')
+    parser.add_argument('--compare', metavar='FILE', help='Compare the results with a baseline file')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed p50 slowdown against the baseline (0.25 = 25%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=2.0,
+                        help='Ignore p50 slowdowns smaller than this many milliseconds')
+    args = parser.parse_args()
+    scenarios = args.only or ['upload', 'sign', 'list', 'store']
+
+    # Paths given on the command line stay relative to where the suite was started
+    baseline_out = os.path.abspath(args.save_baseline) if args.save_baseline else None
+    baseline_in = os.path.abspath(args.compare) if args.compare else None
+    start_dir = os.getcwd()
+    work_dir = tempfile.mkdtemp(prefix='gcs_bench_suite_')
+    os.chdir(work_dir)
+    write_service_account_key('key.json')
+    os.environ.update({
+        'SIGNED_URLS_FILE': 'signed_urls.db',
+        'GCS_HASH_CACHE_FILE': os.path.join(work_dir, 'hash_cache.db'),
+        'GCS_UPLOAD_SESSIONS_FILE': os.path.join(work_dir, 'upload_sessions.json'),
+    })
+
+    results = []
+    external = os.getenv('STORAGE_EMULATOR_HOST')
+    server = None if external else FakeGCSServer()
+    try:
+        with server or nullcontext():
+            if server is not None:
+                os.environ['STORAGE_EMULATOR_HOST'] = server.url
+            for scenario in scenarios:
+                if scenario == 'upload':
+                    results += bench_upload(args)
+                elif scenario == 'sign':
+                    results += bench_sign(args)
+                elif scenario == 'list':
+                    results += bench_list(args, server)
+                else:
+                    results += bench_store(args)
+    finally:
+        os.chdir(start_dir)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print(f"\n{'Case':<44} {'Ops':>6} {'p50 ms':>10} {'p99 ms':>10} {'Ops/s':>10} {'MiB/s':>8}")
+    for result in results:
+        mib = f"{result['mib_per_second']:.2f}" if 'mib_per_second' in result else ''
+        print(f"{result['name']:<44} {result['operations']:>6} {result['p50_ms']:>10.3f} "
+              f"{result['p99_ms']:>10.3f} {result['ops_per_second']:>10.1f} {mib:>8}")
+
+    if baseline_out:
+        with open(baseline_out, 'w') as f:
+            json.dump({
+                'created_at': datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'emulator': external or 'in-process fake',
+                'results': results,
+            }, f, indent=2)
+        print(f"\nBaseline written to {args.save_baseline}")
+
+    if baseline_in:
+        with open(baseline_in, 'r') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance, args.min_delta_ms)
+        if regressions:
+            print(f"\n{len(regressions)} case(s) slower than the baseline by more than {args.tolerance:.0%}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+"""
+Compare the thread-pool batch upload with the asyncio pipeline.
+
+By default an in-process fake GCS server is started; set STORAGE_EMULATOR_HOST
+to benchmark against another emulator (for example fake-gcs-server) instead.
+
+    python benchmarks/bench_upload_pipelines.py --files 500 --size 65536 --workers 16
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import argparse
+import tempfile
+from contextlib import nullcontext
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+from fake_gcs import FakeGCSServer
+
+def write_service_account_key(path):
+    """Write a throwaway service account key used only for local signing"""
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_key = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    ).decode('ascii')
+    with open(path, 'w') as f:
+        json.dump({
+            'type': 'service_account',
+            'project_id': 'benchmark',
+            'private_key_id': 'benchmark',
+            'private_key': private_key,
+            'client_email': 'benchmark@benchmark.iam.gserviceaccount.com',
+            'client_id': '0',
+            'token_uri': 'https://oauth2.googleapis.com/token'
+        }, f)
+
+def write_files(directory, count, size):
+    os.makedirs(directory, exist_ok=True)
+    for index in range(count):
+        with open(os.path.join(directory, f"file_{index:06d}.bin"), 'wb') as f:
+            f.write(os.urandom(size))
+
+def main():
+    parser = argparse.ArgumentParser(description='Thread pool vs asyncio upload pipeline benchmark')
+    parser.add_argument('--files', type=int, default=200)
+    parser.add_argument('--size', type=int, default=64 * 1024, help='Bytes per file')
+    parser.add_argument('--workers', type=int, default=16, help='Thread pool workers and async transfers in flight')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='gcs_bench_')
+    os.chdir(work_dir)
+    write_service_account_key('key.json')
+    os.environ.update({
+        'SIGNED_URLS_FILE': 'signed_urls.db',
+        'GCS_SKIP_UNCHANGED': '0',
+        'GCS_HTTP_POOL_SIZE': str(args.workers),
+    })
+
+    server = nullcontext() if os.getenv('STORAGE_EMULATOR_HOST') else FakeGCSServer()
+    with server:
+        if isinstance(server, FakeGCSServer):
+            os.environ['STORAGE_EMULATOR_HOST'] = server.url
+
+        # Imported once the environment points at the emulator
+        from gcs_upload_and_sign import upload_batch
+        from async_upload import upload_batch_async, aiohttp
+
+        write_files('threads', args.files, args.size)
+        write_files('asyncio', args.files, args.size)
+
+        start = time.monotonic()
+        results, failures = upload_batch(['threads'], 'benchmark', 'key.json', 'threads', args.workers)
+        thread_elapsed = time.monotonic() - start
+
+        start = time.monotonic()
+        async_results, async_failures = asyncio.run(
+            upload_batch_async(['asyncio'], 'benchmark', 'key.json', 'asyncio', args.workers)
+        )
+        async_elapsed = time.monotonic() - start
+
+    os.chdir(BENCH_DIR)
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+    total_mib = args.files * args.size / 1024 / 1024
+    print(f"\n{'Pipeline':<22} {'Files':>6} {'Failed':>7} {'Seconds':>8} {'Files/s':>9} {'MiB/s':>8}")
+    for name, ok, failed, elapsed in (
+        ('thread pool', len(results), len(failures), thread_elapsed),
+        (f"asyncio ({'aiohttp' if aiohttp else 'threads'})", len(async_results), len(async_failures), async_elapsed),
+    ):
+        print(f"{name:<22} {ok:>6} {failed:>7} {elapsed:>8.2f} {ok / elapsed:>9.1f} {total_mib / elapsed:>8.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+
+import re
+import sys
+import json
+import time
+import uuid
+import base64
+import hashlib
+import threading
+from datetime import datetime, timezone
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, unquote, quote
+
+import google_crc32c
+
+def _b64(data):
+    return base64.b64encode(data).decode('ascii')
+
+def _now():
+    return datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+class FakeStorage:
+    """In-memory buckets and objects served by FakeGCSServer"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.objects = {}
+        self.sessions = {}
+        self.generation = int(time.time() * 1000000)
+        self.request_count = 0
+
+    def put(self, bucket, name, data, metadata=None):
+        metadata = metadata or {}
+        with self.lock:
+            self.generation += 1
+            resource = {
+                'kind': 'storage#object',
+                'bucket': bucket,
+                'name': name,
+                'id': f"{bucket}/{name}/{self.generation}",
+                'size': str(len(data)),
+                'md5Hash': _b64(hashlib.md5(data).digest()),
+                'crc32c': _b64(google_crc32c.value(data).to_bytes(4, 'big')),
+                'generation': str(self.generation),
+                'metageneration': '1',
+                'contentType': metadata.get('contentType') or 'application/octet-stream',
+                'timeCreated': _now(),
+                'updated': _now(),
+                'etag': _b64(str(self.generation).encode()),
+            }
+            for field in ('contentEncoding', 'contentDisposition', 'cacheControl', 'metadata'):
+                if metadata.get(field) is not None:
+                    resource[field] = metadata[field]
+            self.objects[(bucket, name)] = (resource, data)
+            return resource
+
+    def get(self, bucket, name):
+        with self.lock:
+            return self.objects.get((bucket, name))
+
+    def delete(self, bucket, name):
+        with self.lock:
+            return self.objects.pop((bucket, name), None) is not None
+
+    def list(self, bucket, prefix='', delimiter=None, start_after=None, max_results=1000):
+        with self.lock:
+            names = sorted(name for (bucket_name, name) in self.objects if bucket_name == bucket and name.startswith(prefix))
+        items, prefixes = [], []
+        next_token = None
+        for name in names:
+            if start_after is not None and name <= start_after:
+                continue
+            if delimiter:
+                rest = name[len(prefix):]
+                if delimiter in rest:
+                    folder = prefix + rest.split(delimiter, 1)[0] + delimiter
+                    if folder not in prefixes:
+                        if len(items) + len(prefixes) >= max_results:
+                            next_token = name
+                            break
+                        prefixes.append(folder)
+                    continue
+            if len(items) + len(prefixes) >= max_results:
+                next_token = items[-1]['name'] if items else name
+                break
+            items.append(self.objects[(bucket, name)][0])
+        return items, prefixes, next_token
+
+class FakeGCSHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately; without TCP_NODELAY small responses wait for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def storage(self):
+        return self.server.storage
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _send(self, status, body=b'', headers=None, content_type='application/json'):
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        if body or status not in (204, 308):
+            self.send_header('Content-Type', content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _error(self, status, message):
+        self._send(status, {'error': {'code': status, 'message': message}})
+
+    def _route(self):
+        self.storage.request_count += 1
+        hook = getattr(self.server, 'fault_hook', None)
+        if hook is not None:
+            status = hook(self)
+            if status:
+                self._read_body()
+                return self._error(status, 'Injected fault')
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query, keep_blank_values=True).items()}
+        path = url.path
+        for pattern, handler in self.ROUTES:
+            match = re.fullmatch(pattern, path)
+            if match and handler[0] == self.command:
+                return getattr(self, handler[1])(query, *[unquote(group) for group in match.groups()])
+        if self.command in ('GET', 'HEAD'):
+            match = re.fullmatch(r'/([^/]+)/(.+)', path)
+            if match:
+                return self.xml_get(query, unquote(match.group(1)), unquote(match.group(2)))
+        self._read_body()
+        self._error(404, f"No route for {self.command} {path}")
+
+    do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = do_PATCH = _route
+
+    ROUTES = [
+        (r'/upload/storage/v1/b/([^/]+)/o', ('POST', 'upload_start')),
+        (r'/upload/storage/v1/b/([^/]+)/o', ('PUT', 'upload_chunk')),
+        (r'/storage/v1/b/([^/]+)/o', ('GET', 'list_objects')),
+        (r'/storage/v1/b/([^/]+)/o/(.+)/compose', ('POST', 'compose')),
+        (r'/storage/v1/b/([^/]+)/o/(.+)', ('GET', 'get_object')),
+        (r'/storage/v1/b/([^/]+)/o/(.+)', ('DELETE', 'delete_object')),
+        (r'/storage/v1/b/([^/]+)/o/(.+)', ('PATCH', 'patch_object')),
+        (r'/download/storage/v1/b/([^/]+)/o/(.+)', ('GET', 'download_object')),
+    ]
+
+    def _precondition_failed(self, query, bucket, name):
+        if 'ifGenerationMatch' not in query:
+            return False
+        current = self.storage.get(bucket, name)
+        expected = query['ifGenerationMatch']
+        actual = current[0]['generation'] if current else '0'
+        return expected != actual
+
+    def upload_start(self, query, bucket):
+        body = self._read_body()
+        upload_type = query.get('uploadType', 'media')
+        if upload_type == 'multipart':
+            content_type = self.headers.get('Content-Type')
+            message = BytesParser(policy=HTTP).parsebytes(
+                f"Content-Type: {content_type}\r\n\r\n".encode() + body
+            )
+            parts = list(message.iter_parts())
+            metadata = json.loads(parts[0].get_payload(decode=True))
+            data = parts[1].get_payload(decode=True)
+            metadata.setdefault('contentType', parts[1].get_content_type())
+        elif upload_type == 'resumable':
+            metadata = json.loads(body or b'{}')
+            metadata.setdefault('name', query.get('name'))
+            if self.headers.get('X-Upload-Content-Type'):
+                metadata.setdefault('contentType', self.headers['X-Upload-Content-Type'])
+            if self._precondition_failed(query, bucket, metadata['name']):
+                return self._error(412, 'Precondition Failed')
+            upload_id = uuid.uuid4().hex
+            self.storage.sessions[upload_id] = {'bucket': bucket, 'metadata': metadata, 'data': bytearray()}
+            host = self.headers.get('Host')
+            location = f"http://{host}/upload/storage/v1/b/{quote(bucket)}/o?uploadType=resumable&upload_id={upload_id}"
+            return self._send(200, b'', {'Location': location})
+        else:
+            metadata = {'name': query.get('name'), 'contentType': self.headers.get('Content-Type')}
+            data = body
+        name = metadata.get('name') or query.get('name')
+        if self._precondition_failed(query, bucket, name):
+            return self._error(412, 'Precondition Failed')
+        self._send(200, self.storage.put(bucket, name, data, metadata))
+
+    def upload_chunk(self, query, bucket):
+        body = self._read_body()
+        session = self.storage.sessions.get(query.get('upload_id'))
+        if session is None:
+            return self._error(404, 'No such upload session')
+        content_range = self.headers.get('Content-Range', '')
+        match = re.fullmatch(r'bytes (\*|(\d+)-(\d+))/(\*|\d+)', content_range.strip())
+        if match is None:
+            return self._error(400, f"Bad Content-Range {content_range}")
+        data = session['data']
+        if match.group(2) is not None:
+            start = int(match.group(2))
+            if start != len(data):
+                return self._error(400, 'Non contiguous chunk')
+            data.extend(body)
+        total = match.group(4)
+        if total != '*' and int(total) == len(data):
+            del self.storage.sessions[query['upload_id']]
+            metadata = session['metadata']
+            return self._send(200, self.storage.put(session['bucket'], metadata['name'], bytes(data), metadata))
+        headers = {'Range': f"bytes=0-{len(data) - 1}"} if data else {}
+        self._send(308, b'', headers)
+
+    def list_objects(self, query, bucket):
+        items, prefixes, next_token = self.storage.list(
+            bucket,
+            prefix=query.get('prefix', ''),
+            delimiter=query.get('delimiter') or None,
+            start_after=query.get('pageToken'),
+            max_results=int(query.get('maxResults', 1000))
+        )
+        fields = query.get('fields', '')
+        if 'items(name)' in fields:
+            items = [{'name': item['name']} for item in items]
+        response = {'kind': 'storage#objects', 'items': items}
+        if prefixes:
+            response['prefixes'] = prefixes
+        if next_token:
+            response['nextPageToken'] = next_token
+        self._send(200, response)
+
+    def get_object(self, query, bucket, name):
+        found = self.storage.get(bucket, name)
+        if found is None:
+            return self._error(404, 'No such object')
+        if query.get('alt') == 'media':
+            return self._send(200, found[1], content_type=found[0]['contentType'])
+        self._send(200, found[0])
+
+    def download_object(self, query, bucket, name):
+        return self.get_object({'alt': 'media'}, bucket, name)
+
+    def delete_object(self, query, bucket, name):
+        if not self.storage.delete(bucket, name):
+            return self._error(404, 'No such object')
+        self._send(204)
+
+    def patch_object(self, query, bucket, name):
+        patch = json.loads(self._read_body() or b'{}')
+        found = self.storage.get(bucket, name)
+        if found is None:
+            return self._error(404, 'No such object')
+        with self.storage.lock:
+            found[0].update(patch)
+        self._send(200, found[0])
+
+    def compose(self, query, bucket, name):
+        request = json.loads(self._read_body())
+        sources = request.get('sourceObjects', [])
+        if not 1 <= len(sources) <= 32:
+            return self._error(400, 'Compose needs between 1 and 32 source objects')
+        data = bytearray()
+        for source in sources:
+            found = self.storage.get(bucket, source['name'])
+            if found is None:
+                return self._error(404, f"No such object {source['name']}")
+            data.extend(found[1])
+        metadata = dict(request.get('destination') or {})
+        resource = self.storage.put(bucket, name, bytes(data), metadata)
+        # Composite objects have no MD5 hash
+        resource.pop('md5Hash', None)
+        resource['componentCount'] = len(sources)
+        self._send(200, resource)
+
+    def xml_get(self, query, bucket, name):
+        found = self.storage.get(bucket, name)
+        if found is None:
+            return self._send(404, b'<Error><Code>NoSuchKey</Code></Error>', content_type='application/xml')
+        if 'X-Goog-Date' in query and 'X-Goog-Expires' in query:
+            signed_at = datetime.strptime(query['X-Goog-Date'], '%Y%m%dT%H%M%SZ').replace(tzinfo=timezone.utc)
+            if time.time() > signed_at.timestamp() + int(query['X-Goog-Expires']):
+                return self._send(400, b'<Error><Code>ExpiredToken</Code></Error>', content_type='application/xml')
+        resource, data = found
+        headers = {
+            'ETag': f'"{resource["etag"]}"',
+            'x-goog-generation': resource['generation'],
+            'Last-Modified': datetime.strptime(resource['updated'], '%Y-%m-%dT%H:%M:%S.%fZ').strftime('%a, %d %b %Y %H:%M:%S GMT'),
+        }
+        match = re.fullmatch(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        if match and data:
+            start = int(match.group(1))
+            end = int(match.group(2)) if match.group(2) else len(data) - 1
+            headers['Content-Range'] = f"bytes {start}-{end}/{len(data)}"
+            return self._send(206, data[start:end + 1], headers, resource['contentType'])
+        self._send(200, data, headers, resource['contentType'])
+
+class FakeGCSServer(ThreadingHTTPServer):
+    """
+    Minimal in-process stand-in for the GCS JSON/XML API.
+    Point the client library at it with STORAGE_EMULATOR_HOST=server.url.
+    """
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0):
+        super().__init__((host, port), FakeGCSHandler)
+        self.storage = FakeStorage()
+        self.fault_hook = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+def main():
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 4443
+    server = FakeGCSServer(port=port)
+    print(f"Fake GCS listening on {server.url} (export STORAGE_EMULATOR_HOST={server.url})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
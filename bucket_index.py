@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import glob
+import base64
+import sqlite3
+import threading
+from datetime import datetime
+
+# Rows written per transaction while refreshing
+BATCH_SIZE = 5000
+
+def _event_time(message, attributes):
+    """Unix time of a notification: its eventTime attribute, else its publish time, else now"""
+    for value in (attributes.get('eventTime'), message.get('publishTime'), message.get('publish_time')):
+        if value:
+            try:
+                return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+            except ValueError:
+                continue
+    return time.time()
+
+class BucketIndex:
+    """
+    Persistent local index of object metadata (name, generation, size, updated),
+    stored in SQLite. It is refreshed from a listing that only requests those
+    fields and only writes new or changed rows, or from replayed Pub/Sub notification
+    dumps, and answers substring and glob searches without calling GCS.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS objects (
+            bucket TEXT NOT NULL,
+            name TEXT NOT NULL,
+            generation INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            updated TEXT,
+            refreshed INTEGER NOT NULL,
+            PRIMARY KEY (bucket, name)
+        );
+        CREATE TABLE IF NOT EXISTS refreshes (
+            bucket TEXT NOT NULL,
+            prefix TEXT NOT NULL,
+            refreshed_at REAL NOT NULL,
+            PRIMARY KEY (bucket, prefix)
+        );
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv('GCS_BUCKET_INDEX_FILE', '.gcs_bucket_index.db')
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(self.SCHEMA)
+
+    def _upsert(self, rows):
+        """Insert or update (bucket, name, generation, size, updated, refreshed) rows"""
+        self._conn.executemany(
+            'INSERT INTO objects (bucket, name, generation, size, updated, refreshed) VALUES (?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT (bucket, name) DO UPDATE SET generation = excluded.generation, size = excluded.size, '
+            'updated = excluded.updated, refreshed = excluded.refreshed',
+            rows
+        )
+
+    def refreshed_at(self, bucket_name, prefix=''):
+        """Time of the last full refresh covering the prefix, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(refreshed_at) FROM refreshes WHERE bucket = ? AND substr(?, 1, length(prefix)) = prefix",
+                (bucket_name, prefix)
+            ).fetchone()
+        return row[0] if row else None
+
+    def is_stale(self, bucket_name, prefix='', max_age=None):
+        if max_age is None:
+            max_age = int(os.getenv('GCS_BUCKET_INDEX_MAX_AGE', '3600'))
+        refreshed_at = self.refreshed_at(bucket_name, prefix)
+        return refreshed_at is None or time.time() - refreshed_at > max_age
+
+    def refresh(self, bucket, prefix=''):
+        """
+        Refresh the objects below a prefix from a name-ordered listing. Each batch
+        is compared with the indexed rows of the same name range: only new and
+        changed rows are written, and indexed objects missing from the listing
+        are removed. Returns (objects listed, objects removed).
+        """
+        stamp = time.time_ns()
+        listed = removed = 0
+        after = None
+        blobs = bucket.client.list_blobs(
+            bucket,
+            prefix=prefix or None,
+            page_size=1000,
+            fields='items(name,generation,size,updated),nextPageToken'
+        )
+        rows = []
+        for blob in blobs:
+            rows.append((bucket.name, blob.name, blob.generation or 0, blob.size or 0,
+                         blob.updated.isoformat() if blob.updated else None, stamp))
+            if len(rows) >= BATCH_SIZE:
+                removed += self._write_batch(bucket.name, prefix, after, rows)
+                listed += len(rows)
+                after = rows[-1][1]
+                rows = []
+        listed += len(rows)
+        # The last batch also covers the indexed names after the end of the listing
+        removed += self._write_batch(bucket.name, prefix, after, rows, last=True)
+        return listed, removed
+
+    def _write_batch(self, bucket_name, prefix, after, rows, last=False):
+        """
+        Write the rows of a listing batch that differ from the index and remove the
+        indexed objects of its name range that were not listed. The range starts
+        after the previous batch and ends with the batch, or with the prefix for
+        the last one. Returns the number of objects removed.
+        """
+        sql = ('SELECT name, generation, size, updated FROM objects '
+               'WHERE bucket = ? AND name >= ? AND substr(name, 1, ?) = ?')
+        params = [bucket_name, prefix, len(prefix), prefix]
+        if after is not None:
+            sql += ' AND name > ?'
+            params.append(after)
+        if not last:
+            sql += ' AND name <= ?'
+            params.append(rows[-1][1])
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                indexed = {name: tuple(values) for name, *values in self._conn.execute(sql, params)}
+                # Rows are (bucket, name, generation, size, updated, refreshed)
+                self._upsert([row for row in rows if indexed.pop(row[1], None) != row[2:5]])
+                self._conn.executemany('DELETE FROM objects WHERE bucket = ? AND name = ?',
+                                       [(bucket_name, name) for name in indexed])
+                if last:
+                    self._conn.execute(
+                        'INSERT OR REPLACE INTO refreshes (bucket, prefix, refreshed_at) VALUES (?, ?, ?)',
+                        (bucket_name, prefix, time.time())
+                    )
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+        return len(indexed)
+
+    def apply_notifications(self, lines):
+        """
+        Replay Pub/Sub notifications (one JSON message per line, pulled or push
+        format) into the index. Older generations never overwrite newer ones.
+        The refresh times of the buckets they cover move up to the latest event
+        time, so is_stale() does not ask for a listing while notifications keep
+        the index current. Buckets that were never listed stay stale: notifications
+        say nothing of the objects that existed before them.
+        Returns the number of notifications applied.
+        """
+        applied = 0
+        stamp = time.time_ns()
+        event_times = {}  # bucket -> latest event time of its notifications
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                for line in lines:
+                    if not line.strip():
+                        continue
+                    message = json.loads(line)
+                    message = message.get('message', message)
+                    attributes = message.get('attributes', {})
+                    event_type = attributes.get('eventType')
+                    bucket_name = attributes.get('bucketId')
+                    name = attributes.get('objectId')
+                    generation = int(attributes.get('objectGeneration') or 0)
+                    if not (event_type and bucket_name and name):
+                        continue
+                    event_time = _event_time(message, attributes)
+                    event_times[bucket_name] = max(event_times.get(bucket_name, event_time), event_time)
+                    current = self._conn.execute(
+                        'SELECT generation FROM objects WHERE bucket = ? AND name = ?',
+                        (bucket_name, name)
+                    ).fetchone()
+                    if event_type in ('OBJECT_FINALIZE', 'OBJECT_METADATA_UPDATE'):
+                        if current and current[0] > generation:
+                            continue
+                        resource = {}
+                        if message.get('data'):
+                            resource = json.loads(base64.b64decode(message['data']))
+                        self._upsert([(bucket_name, name, generation, int(resource.get('size') or 0),
+                                       resource.get('updated'), stamp)])
+                    elif event_type in ('OBJECT_DELETE', 'OBJECT_ARCHIVE'):
+                        if current is None or current[0] > generation:
+                            continue
+                        self._conn.execute('DELETE FROM objects WHERE bucket = ? AND name = ?', (bucket_name, name))
+                    else:
+                        continue
+                    applied += 1
+                self._conn.executemany(
+                    'UPDATE refreshes SET refreshed_at = MAX(refreshed_at, ?) WHERE bucket = ?',
+                    [(event_time, bucket_name) for bucket_name, event_time in event_times.items()]
+                )
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+        return applied
+
+    def search(self, bucket_name, query='', prefix='', limit=100, offset=0):
+        """
+        Names of indexed files matching a query, in name order. A query containing
+        *, ? or [ is a glob matched against the whole name; anything else is a
+        case-insensitive substring.
+        """
+        sql = "SELECT name FROM objects WHERE bucket = ? AND substr(name, -1) != '/'"
+        params = [bucket_name]
+        if prefix:
+            sql += ' AND name >= ? AND name < ?'
+            params += [prefix, prefix + '\U0010ffff']
+        if query and glob.has_magic(query):
+            sql += ' AND name GLOB ?'
+            params.append(query)
+        elif query:
+            escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            sql += " AND name LIKE ? ESCAPE '\\'"
+            params.append(f"%{escaped}%")
+        sql += ' ORDER BY name LIMIT ? OFFSET ?'
+        params += [limit, offset]
+        with self._lock:
+            return [row[0] for row in self._conn.execute(sql, params)]
+
+    def count(self, bucket_name):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM objects WHERE bucket = ?', (bucket_name,)).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def main():
+    from dotenv import load_dotenv
+    from gcs_config import load_config
+    from gcs_client import get_bucket
+    load_dotenv()
+
+    if len(sys.argv) < 2 or sys.argv[1] not in ('refresh', 'apply', 'search'):
+        print("Usage:")
+        print("  python bucket_index.py refresh [prefix]")
+        print("  python bucket_index.py apply <notifications.ndjson>")
+        print("  python bucket_index.py search <substring|glob>")
+        sys.exit(1)
+
+    command = sys.argv[1]
+    # Only a refresh talks to the bucket, applying and searching work on the index alone
+    bucket_name, credentials_path = load_config(require_credentials=command == 'refresh')
+
+    index = BucketIndex()
+    if command == 'refresh':
+        prefix = sys.argv[2] if len(sys.argv) > 2 else ''
+        listed, removed = index.refresh(get_bucket(bucket_name, credentials_path), prefix)
+        print(f"Indexed {listed} objects ({removed} removed), {index.count(bucket_name)} in index")
+    elif command == 'apply':
+        with open(sys.argv[2], 'r') as f:
+            applied = index.apply_notifications(f)
+        print(f"Applied {applied} notifications, {index.count(bucket_name)} objects in index")
+    else:
+        for name in index.search(bucket_name, sys.argv[2] if len(sys.argv) > 2 else '', limit=1000):
+            print(name)
+
+if __name__ == "__main__":
+    main()
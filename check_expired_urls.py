@@ -1,37 +1,32 @@
 #!/usr/bin/env python3
 
-import json
+import os
 from datetime import datetime
+from url_store import open_record_store, default_records_file
 
-def check_all_urls(records_file='signed_urls.json'):
+def check_all_urls(records_file=None):
     """Check all stored URLs and remove expired ones"""
-    try:
-        with open(records_file, 'r') as f:
-            records = json.load(f)
-    except FileNotFoundError:
+    if records_file is None:
+        records_file = default_records_file()
+    if not os.path.exists(records_file):
         print("No URL records found")
         return
 
+    store = open_record_store(records_file)
     current_time = datetime.now()
-    expired = []
-    valid = []
 
-    # Check each URL
-    for filename, record in records.items():
+    # Expired records come from the expiration index, not from a full rewrite
+    expired = store.expiring_names_before(current_time)
+    valid = []
+    for filename, record in store.items():
         expiration = datetime.fromisoformat(record['expiration'])
-        if current_time > expiration:
-            expired.append(filename)
-        else:
+        if current_time <= expiration:
             days_left = (expiration - current_time).days
             valid.append((filename, days_left))
 
     # Remove expired URLs
-    for filename in expired:
-        del records[filename]
-
-    # Save updated records
-    with open(records_file, 'w') as f:
-        json.dump(records, f, indent=2)
+    if expired:
+        store.delete(expired)
 
     # Print report
     print("\nURL Status Report:")
@@ -46,5 +41,11 @@ def check_all_urls(records_file='signed_urls.json'):
         for filename in expired:
             print(f"- {filename}")
 
+def main():
+    # SIGNED_URLS_FILE may come from .env
+    from dotenv import load_dotenv
+    load_dotenv()
+    check_all_urls()
+
 if __name__ == "__main__":
-    check_all_urls() 
\ No newline at end of file
+    main() 
\ No newline at end of file
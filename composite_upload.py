@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import uuid
+import base64
+import mimetypes
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import google_crc32c
+from resumable_upload import get_chunk_size
+from metrics import span, increment
+
+# GCS compose accepts at most 32 source objects per request
+MAX_COMPOSE_SOURCES = 32
+
+def get_composite_threshold():
+    """Files larger than this many bytes use a parallel composite upload (0 disables it)"""
+    return int(os.getenv('GCS_COMPOSITE_THRESHOLD', str(1024 * 1024 * 1024)))
+
+def get_composite_parts():
+    """Number of byte ranges a composite upload is split into"""
+    return max(1, int(os.getenv('GCS_COMPOSITE_PARTS', '16')))
+
+class FileSlice(io.RawIOBase):
+    """Read-only, seekable view of a byte range of a file"""
+
+    def __init__(self, file_path, start, length, progress=None):
+        self._file = open(file_path, 'rb')
+        self._start = start
+        self._length = length
+        self._position = 0
+        self._progress = progress
+        self._file.seek(start)
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self._length
+        self._position = min(max(0, offset), self._length)
+        self._file.seek(self._start + self._position)
+        return self._position
+
+    def read(self, size=-1):
+        remaining = self._length - self._position
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        data = self._file.read(size)
+        self._position += len(data)
+        if self._progress and data:
+            self._progress(len(data))
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+def file_crc32c(file_path, chunk_size=8 * 1024 * 1024):
+    """Base64 encoded CRC32C of a file, in the format of the blob.crc32c property"""
+    checksum = google_crc32c.Checksum()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            checksum.update(chunk)
+    return base64.b64encode(checksum.digest()).decode('ascii')
+
+def _compose_tree(blob, sources, temp_name, temporary, timeout):
+    """
+    Compose sources into blob. More than 32 sources are first composed in
+    groups of 32 into intermediate temporary objects, level by level. The
+    properties of blob (content type, metadata) are sent with the final compose.
+    """
+    level = 0
+    while len(sources) > MAX_COMPOSE_SOURCES:
+        composed = []
+        for index in range(0, len(sources), MAX_COMPOSE_SOURCES):
+            group = sources[index:index + MAX_COMPOSE_SOURCES]
+            intermediate = blob.bucket.blob(temp_name(f"c{level}-{index // MAX_COMPOSE_SOURCES:05d}"))
+            intermediate.compose(group, timeout=timeout)
+            temporary.append(intermediate)
+            composed.append(intermediate)
+        sources = composed
+        level += 1
+    blob.compose(sources, timeout=timeout)
+
+def composite_upload(blob, file_path, parts=None, max_workers=None, progress=None, timeout=120):
+    """
+    Upload a large file as parallel byte ranges, compose them server side and
+    verify the CRC32C of the result before returning
+    Args:
+        blob: Destination blob
+        file_path: Local file to upload
+        parts: Number of byte ranges (GCS_COMPOSITE_PARTS by default)
+        max_workers: Number of parts uploaded at the same time (all parts by default)
+        progress: Optional callable receiving the number of bytes read for upload
+        timeout: Timeout in seconds of each request
+    """
+    parts = parts or get_composite_parts()
+    total_bytes = os.path.getsize(file_path)
+    part_size = max(1, -(-total_bytes // parts))
+    ranges = [(start, min(part_size, total_bytes - start)) for start in range(0, total_bytes, part_size)] or [(0, 0)]
+
+    token = uuid.uuid4().hex[:12]
+    def temp_name(suffix):
+        return f"{blob.name}.part-{token}-{suffix}"
+
+    bucket = blob.bucket
+    temporary = []
+    temporary_lock = threading.Lock()
+    chunk_size = get_chunk_size()
+
+    def upload_part(index, start, length):
+        part = bucket.blob(temp_name(f"{index:05d}"))
+        # Bounded chunks keep memory at one chunk per worker
+        part.chunk_size = chunk_size
+        with temporary_lock:
+            temporary.append(part)
+        with FileSlice(file_path, start, length, progress) as stream:
+            part.upload_from_file(stream, size=length, timeout=timeout, checksum='crc32c')
+        return part
+
+    try:
+        with ThreadPoolExecutor(max_workers=(max_workers or len(ranges)) + 1) as executor:
+            # The local checksum is computed while the parts are being uploaded
+            local_crc32c = executor.submit(file_crc32c, file_path)
+            futures = [executor.submit(upload_part, index, start, length) for index, (start, length) in enumerate(ranges)]
+            sources = [future.result() for future in futures]
+            expected_crc32c = local_crc32c.result()
+
+        increment('gcs_composite_parts_total', len(sources), help='Parts uploaded by composite uploads')
+        # Composed objects do not inherit the content type of their parts
+        blob.content_type = blob.content_type or mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+        with span('compose'):
+            _compose_tree(blob, sources, temp_name, temporary, timeout)
+            blob.reload(timeout=timeout)
+        if blob.crc32c != expected_crc32c:
+            blob.delete(timeout=timeout)
+            raise ValueError(f"CRC32C mismatch after compose of {blob.name}: "
+                             f"expected {expected_crc32c}, got {blob.crc32c}")
+    finally:
+        if temporary:
+            bucket.delete_blobs(temporary, on_error=lambda part: None, timeout=timeout)
+
+    return blob
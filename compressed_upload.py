@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+import io
+import os
+import zlib
+import mimetypes
+from resumable_upload import get_chunk_size, get_resumable_threshold, open_session_upload
+from hash_cache import source_metadata
+
+ENCODINGS = ('gzip', 'zstd')
+DEFAULT_LEVELS = {'gzip': 6, 'zstd': 3}
+# Accepted levels: zlib takes -1 (its default) to 9, zstd negative (fast) levels up to 22
+LEVEL_RANGES = {'gzip': (-1, 9), 'zstd': (-(1 << 17), 22)}
+
+# Content types worth compressing; images, video, archives and PDFs are already dense
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/xml', 'application/javascript',
+                      'application/x-ndjson', 'application/yaml', 'application/sql', 'image/svg+xml')
+
+# Compressible extensions that mimetypes does not know
+TEXT_TYPES = {
+    '.log': 'text/plain',
+    '.ndjson': 'application/x-ndjson',
+    '.jsonl': 'application/x-ndjson',
+    '.yaml': 'application/yaml',
+    '.yml': 'application/yaml',
+    '.tsv': 'text/tab-separated-values',
+    '.md': 'text/markdown',
+}
+
+# Leading bytes of gzip, zstd, zip, bzip2 and xz data, for compressed files with a text extension
+COMPRESSED_MAGIC = (b'\x1f\x8b', b'\x28\xb5\x2f\xfd', b'PK\x03\x04', b'BZh', b'\xfd7zXZ')
+
+def get_compression(compression=None):
+    """
+    Encoding compressible files are uploaded with: 'gzip', 'zstd' or None
+    (GCS_COMPRESSION, off by default). compression overrides the environment.
+    The configured level is checked against the encoding.
+    """
+    value = (os.getenv('GCS_COMPRESSION', '') if compression is None else compression).lower()
+    if value in ('', '0', 'off', 'none', 'false', 'no'):
+        return None
+    if value not in ENCODINGS:
+        raise ValueError(f"Unknown compression {value!r}, expected gzip, zstd or off")
+    if value == 'zstd':
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            raise ValueError("zstd compression requires the zstandard package (pip install zstandard)")
+    get_compression_level(value)
+    return value
+
+def check_compression_level(encoding, level):
+    """Return level if the encoding accepts it, else raise ValueError"""
+    low, high = LEVEL_RANGES[encoding]
+    if not low <= level <= high:
+        raise ValueError(f"Compression level {level} is outside {low} to {high} for {encoding}")
+    return level
+
+def get_compression_level(encoding):
+    """Compression level (GCS_COMPRESSION_LEVEL, 6 for gzip and 3 for zstd by default)"""
+    level = os.getenv('GCS_COMPRESSION_LEVEL')
+    if not level:
+        return DEFAULT_LEVELS[encoding]
+    try:
+        level = int(level)
+    except ValueError:
+        raise ValueError(f"GCS_COMPRESSION_LEVEL must be an integer, got {level!r}")
+    return check_compression_level(encoding, level)
+
+def get_compression_min_size():
+    """Files smaller than this many bytes are uploaded as they are (GCS_COMPRESSION_MIN_SIZE)"""
+    return int(os.getenv('GCS_COMPRESSION_MIN_SIZE', '1024'))
+
+def guess_content_type(file_path):
+    """Content type of a file from its extension"""
+    content_type, _ = mimetypes.guess_type(file_path)
+    return content_type or TEXT_TYPES.get(os.path.splitext(file_path)[1].lower(), 'application/octet-stream')
+
+def should_compress(file_path):
+    """
+    Whether a file is worth compressing: a text-like content type, at least
+    GCS_COMPRESSION_MIN_SIZE bytes, and not already compressed (.csv.gz, or
+    gzip/zstd/zip/bzip2/xz data behind a text extension)
+    """
+    if os.path.getsize(file_path) < get_compression_min_size():
+        return False
+    if mimetypes.guess_type(file_path)[1] is not None:
+        return False
+    if not guess_content_type(file_path).startswith(COMPRESSIBLE_TYPES):
+        return False
+    with open(file_path, 'rb') as f:
+        return not f.read(6).startswith(COMPRESSED_MAGIC)
+
+def _compressor(encoding, level, size):
+    """Object with compress(data) and flush() producing a gzip or zstd stream"""
+    if encoding == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor(level=level).compressobj(size=size)
+    # wbits=31 writes a gzip header; zlib leaves its timestamp at 0, so the output is reproducible
+    return zlib.compressobj(level, zlib.DEFLATED, 31)
+
+class CompressingReader(io.RawIOBase):
+    """Read-only stream of the compressed bytes of a file, compressed as they are read"""
+
+    def __init__(self, file_path, encoding, level=None, chunk_size=1024 * 1024, progress=None):
+        level = get_compression_level(encoding) if level is None else check_compression_level(encoding, level)
+        self._file = open(file_path, 'rb')
+        self._compressor = _compressor(encoding, level, os.path.getsize(file_path))
+        self._chunk_size = chunk_size
+        self._progress = progress
+        self._buffer = bytearray()
+        self._position = 0
+        self._eof = False
+
+    def readable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = float('inf')
+        while not self._eof and len(self._buffer) < size:
+            data = self._file.read(self._chunk_size)
+            if data:
+                self._buffer += self._compressor.compress(data)
+                if self._progress:
+                    self._progress(len(data))
+            else:
+                self._buffer += self._compressor.flush()
+                self._eof = True
+        size = min(size, len(self._buffer))
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        self._position += len(data)
+        return data
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+def compressed_upload(blob, file_path, encoding, level=None, chunk_size=None, progress=None, timeout=120):
+    """
+    Upload a file compressed on the fly, without a temporary file. The blob keeps
+    the content type of the file and gets a Content-Encoding, so signed URLs
+    serve the original bytes (GCS decompresses gzip for clients that do not
+    accept it). The digests of the source file are stored in the blob metadata
+    for the unchanged check.
+    Files up to GCS_RESUMABLE_THRESHOLD are compressed in memory and sent in one
+    request; larger ones are streamed through a resumable session one chunk at
+    a time, checked with CRC32C when the upload completes.
+    Args:
+        blob: Destination blob
+        file_path: Local file to upload
+        encoding: 'gzip' or 'zstd'
+        level: Compression level (GCS_COMPRESSION_LEVEL by default)
+        chunk_size: Bytes per request of a streamed upload, rounded up to a multiple of 256 KiB
+        progress: Optional callable receiving the number of source bytes compressed
+        timeout: Timeout in seconds of each request
+    Returns:
+        Number of compressed bytes sent
+    """
+    blob.content_type = guess_content_type(file_path)
+    blob.content_encoding = encoding
+    blob.metadata = {**(blob.metadata or {}), **source_metadata(file_path)}
+
+    with CompressingReader(file_path, encoding, level, progress=progress) as reader:
+        if os.path.getsize(file_path) <= get_resumable_threshold():
+            data = reader.read()
+            blob.upload_from_string(data, content_type=blob.content_type, timeout=timeout, checksum='md5')
+            return len(data)
+
+        # The compressed size is unknown until the end: chunks are sent with an open range
+        session_url = blob.create_resumable_upload_session(content_type=blob.content_type, timeout=timeout)
+        upload = open_session_upload(session_url, reader, get_chunk_size(chunk_size), blob.content_type)
+        while not upload.finished:
+            response = upload.transmit_next_chunk(blob.bucket.client._http, timeout=timeout)
+        blob._set_properties(response.json())
+        return reader.tell()
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import argparse
+import contextlib
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from gcs_config import load_config
+from url_store import open_record_store, default_records_file, chunked
+from metrics import profile_run
+
+# Names read from stdin are signed, looked up or deleted this many at a time
+CHUNK_SIZE = 1000
+
+class Output:
+    """
+    Writes results as NDJSON, one line per item as soon as it is known,
+    or as a single JSON array at the end with --format json
+    """
+
+    def __init__(self, stream, output_format='ndjson'):
+        self.stream = stream
+        self.output_format = output_format
+        self.items = []
+        self.errors = 0
+
+    def emit(self, item):
+        if 'error' in item:
+            self.errors += 1
+        if self.output_format == 'json':
+            self.items.append(item)
+        else:
+            self.stream.write(json.dumps(item, separators=(',', ':')) + '\n')
+
+    def flush(self):
+        if self.output_format != 'json':
+            self.stream.flush()
+
+    def close(self):
+        if self.output_format == 'json':
+            json.dump(self.items, self.stream, indent=2)
+            self.stream.write('\n')
+        self.stream.flush()
+
+def read_names(names):
+    """Names given as arguments, or one per line from stdin when there are none (or '-')"""
+    if names and names != ['-']:
+        yield from names
+        return
+    for line in sys.stdin:
+        name = line.rstrip('\r\n')
+        if name.strip():
+            yield name
+
+def record_item(filename, record, now, history=False):
+    """JSON representation of a URL record with its status"""
+    expiration = datetime.fromisoformat(record['expiration'])
+    item = {
+        'name': filename,
+        'status': 'valid' if now <= expiration else 'expired',
+        'seconds_left': max(0, int((expiration - now).total_seconds())),
+        'expiration': record['expiration'],
+        'created_at': record['created_at'],
+        'url': record['url'],
+    }
+    if history:
+        item['history'] = record.get('history', [])
+    else:
+        item['history_count'] = len(record.get('history', []))
+    return item
+
+def command_list(args, output):
+    """List URL records, or objects of the bucket with --bucket"""
+    if args.bucket:
+        from gcs_client import get_bucket
+        from gcs_sign_existing import iter_bucket_pages
+        bucket = get_bucket(*load_config())
+        for _, files in iter_bucket_pages(bucket, args.prefix):
+            for name in files:
+                output.emit({'name': name})
+            output.flush()
+        return
+
+    store = open_record_store(args.records_file)
+    now = datetime.now()
+    if args.expiring_within is not None:
+        records = store.expiring_before(now + timedelta(hours=args.expiring_within))
+    elif args.status == 'expired':
+        records = store.expiring_before(now)
+    else:
+        records = store.items()
+    for filename, record in records:
+        if args.prefix and not filename.startswith(args.prefix):
+            continue
+        item = record_item(filename, record, now, args.history)
+        if args.status and item['status'] != args.status:
+            continue
+        output.emit(item)
+
+def command_show(args, output):
+    """Show the records of the given names, with their history"""
+    store = open_record_store(args.records_file)
+    now = datetime.now()
+    for names in chunked(read_names(args.names), CHUNK_SIZE):
+        records = store.get_many(names)
+        for name in names:
+            record = records.get(name)
+            if record is None:
+                output.emit({'name': name, 'error': 'No URL record found'})
+            else:
+                output.emit(record_item(name, record, now, history=True))
+        output.flush()
+
+def command_sign(args, output):
+    """Sign existing objects offline and save their records"""
+    from url_signer import get_url_signer
+    bucket_name, credentials_path = load_config()
+    signer = get_url_signer(credentials_path)
+    store = open_record_store(args.records_file)
+    lifetime = timedelta(hours=args.hours)
+    for names in chunked(read_names(args.names), CHUNK_SIZE):
+        expiration_date = datetime.now() + lifetime
+        urls = signer.sign_many(bucket_name, names, lifetime, max_workers=args.workers)
+        if not args.no_save:
+            store.save_many([(name, url, expiration_date) for name, url in zip(names, urls)])
+        for name, url in zip(names, urls):
+            output.emit({'name': name, 'url': url, 'expiration': expiration_date.isoformat()})
+        output.flush()
+
+def command_upload(args, output):
+    """Upload files, directories or globs and sign each uploaded object"""
+    from gcs_upload_and_sign import upload_and_sign, collect_files, split_colliding_entries
+    from retry_scheduler import AdaptiveScheduler
+    from compressed_upload import get_compression
+    bucket_name, credentials_path = load_config()
+    skip_unchanged = False if args.force else None
+    try:
+        get_compression(args.compress)
+    except ValueError as e:
+        sys.exit(f"Error: {e}")
+
+    def upload(entry):
+        file_path, target_folder = entry
+        return upload_and_sign(file_path, bucket_name, credentials_path, target_folder,
+                               skip_unchanged=skip_unchanged, compression=args.compress)
+
+    entries, collisions = split_colliding_entries([
+        (file_path, '/'.join(part for part in (args.folder, sub_folder) if part) or None)
+        for file_path, sub_folder in collect_files(read_names(args.paths))
+    ])
+    for file_path, error in collisions:
+        output.emit({'path': file_path, 'error': error})
+    output.flush()
+    scheduler = AdaptiveScheduler(args.workers, operation='upload')
+    for (file_path, _), result, error in scheduler.run(upload, entries):
+        if error is not None:
+            output.emit({'path': file_path, 'error': str(error)})
+        else:
+            signed_url, blob_path = result
+            output.emit({'path': file_path, 'name': blob_path, 'url': signed_url})
+        output.flush()
+
+def command_expire(args, output):
+    """Remove the records of expired URLs (or of URLs expiring within --within hours)"""
+    store = open_record_store(args.records_file)
+    moment = datetime.now() + timedelta(hours=args.within)
+    for expired in chunked(store.expiring_before(moment), CHUNK_SIZE):
+        if not args.dry_run:
+            store.delete([filename for filename, _ in expired])
+        for filename, record in expired:
+            output.emit({'name': filename, 'expiration': record['expiration'], 'deleted': not args.dry_run})
+        output.flush()
+
+def command_delete(args, output):
+    """Delete the records of the given names, and the objects themselves with --objects"""
+    store = open_record_store(args.records_file)
+    bucket = None
+    if args.objects:
+        from gcs_client import get_bucket
+        from retry_scheduler import AdaptiveScheduler
+        bucket = get_bucket(*load_config())
+        scheduler = AdaptiveScheduler(args.workers, operation='delete')
+
+    def delete_object(name):
+        from google.api_core.exceptions import NotFound
+        try:
+            bucket.delete_blob(name, timeout=120)
+            return True
+        except NotFound:
+            return False
+
+    for names in chunked(read_names(args.names), CHUNK_SIZE):
+        existing = store.get_many(names)
+        if existing:
+            store.delete(list(existing))
+        if bucket is None:
+            for name in names:
+                output.emit({'name': name, 'record_deleted': name in existing})
+        else:
+            for name, deleted, error in scheduler.run(delete_object, names):
+                item = {'name': name, 'record_deleted': name in existing, 'object_deleted': bool(deleted)}
+                if error is not None:
+                    item['error'] = str(error)
+                output.emit(item)
+        output.flush()
+
+def command_verify(args, output):
+    """Probe stored URLs and report whether they still serve their object"""
+    from verify_urls import verify_urls
+    store = open_record_store(args.records_file)
+    records = ((filename, record) for filename, record in store.items() if filename.startswith(args.prefix))
+
+    def on_result(result):
+        if not args.problems_only or result['status'] not in ('live', 'expired'):
+            output.emit(result)
+
+    verify_urls(records, not args.current_only, args.concurrency, on_result=on_result)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Scriptable access to signed URL records and uploads. Results are written to stdout '
+                    'as NDJSON; commands taking names read them from stdin, one per line, when none are given.'
+    )
+    parser.add_argument('--records-file', default=None, help='Record store (default: SIGNED_URLS_FILE)')
+    parser.add_argument('--format', dest='output_format', choices=('ndjson', 'json'), default='ndjson',
+                        help='One JSON object per line (default) or a single JSON array')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    workers = int(os.getenv('GCS_UPLOAD_WORKERS', '8'))
+
+    list_parser = subparsers.add_parser('list', help='List URL records (or bucket objects with --bucket)')
+    list_parser.add_argument('--prefix', default='', help='Only names starting with this prefix')
+    list_parser.add_argument('--status', choices=('valid', 'expired'), help='Only valid or expired URLs')
+    list_parser.add_argument('--expiring-within', type=float, metavar='HOURS',
+                             help='Only URLs expiring within this many hours, expired ones included')
+    list_parser.add_argument('--history', action='store_true', help='Include previous URLs')
+    list_parser.add_argument('--bucket', action='store_true', help='List object names in the bucket instead')
+    list_parser.set_defaults(handler=command_list)
+
+    show_parser = subparsers.add_parser('show', help='Show records and history of the given names')
+    show_parser.add_argument('names', nargs='*', help="Blob paths, or '-' / nothing to read stdin")
+    show_parser.set_defaults(handler=command_show)
+
+    sign_parser = subparsers.add_parser('sign', help='Sign existing objects and save their records')
+    sign_parser.add_argument('names', nargs='*', help="Blob paths, or '-' / nothing to read stdin")
+    sign_parser.add_argument('--hours', type=float, default=7 * 24, help='Validity in hours (168 maximum)')
+    sign_parser.add_argument('--no-save', action='store_true', help='Print the URLs without saving records')
+    sign_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Signing threads')
+    sign_parser.set_defaults(handler=command_sign)
+
+    upload_parser = subparsers.add_parser('upload', help='Upload files and sign them')
+    upload_parser.add_argument('paths', nargs='*', help="Files, directories or globs, or '-' / nothing to read stdin")
+    upload_parser.add_argument('--folder', default=None, help='Folder path within the bucket')
+    upload_parser.add_argument('--workers', type=int, default=workers, help='Concurrent uploads')
+    upload_parser.add_argument('--force', action='store_true', help='Upload even if the content is unchanged')
+    upload_parser.add_argument('--compress', choices=('gzip', 'zstd', 'off'), default=None,
+                               help='Compress text, JSON, CSV and log files while uploading (default: GCS_COMPRESSION)')
+    upload_parser.set_defaults(handler=command_upload)
+
+    expire_parser = subparsers.add_parser('expire', help='Remove the records of expired URLs')
+    expire_parser.add_argument('--within', type=float, default=0,
+                               help='Also remove URLs expiring within this many hours')
+    expire_parser.add_argument('--dry-run', action='store_true', help='Only report what would be removed')
+    expire_parser.set_defaults(handler=command_expire)
+
+    delete_parser = subparsers.add_parser('delete', help='Delete the records of the given names')
+    delete_parser.add_argument('names', nargs='*', help="Blob paths, or '-' / nothing to read stdin")
+    delete_parser.add_argument('--objects', action='store_true', help='Also delete the objects from the bucket')
+    delete_parser.add_argument('--workers', type=int, default=workers, help='Concurrent object deletions')
+    delete_parser.set_defaults(handler=command_delete)
+
+    verify_parser = subparsers.add_parser('verify', help='Check that stored URLs still serve their object')
+    verify_parser.add_argument('--prefix', default='', help='Only names starting with this prefix')
+    verify_parser.add_argument('--current-only', action='store_true', help='Skip previous URLs')
+    verify_parser.add_argument('--problems-only', action='store_true',
+                               help='Only report URLs that are modified, missing, denied or failing')
+    verify_parser.add_argument('--concurrency', type=int, default=None,
+                               help='Probes in flight (default: GCS_VERIFY_CONCURRENCY or 64)')
+    verify_parser.set_defaults(handler=command_verify)
+
+    args = parser.parse_args(argv)
+    if getattr(args, 'workers', 1) < 1:
+        parser.error('--workers must be at least 1')
+    if not 0 < getattr(args, 'hours', 1) <= 7 * 24:
+        parser.error('--hours must be between 0 and 168')
+    return args
+
+def main(argv=None):
+    load_dotenv()
+    args = parse_args(argv)
+    if args.records_file is None:
+        args.records_file = default_records_file()
+
+    output = Output(sys.stdout, args.output_format)
+    try:
+        # Progress and status messages of the underlying modules go to stderr, keeping stdout parseable
+        with contextlib.redirect_stdout(sys.stderr):
+            args.handler(args, output)
+        output.close()
+    except BrokenPipeError:
+        # The reader went away (e.g. piped into head): silence the flush at interpreter exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+    if output.errors:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    with profile_run():
+        main()
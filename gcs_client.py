@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+import os
+import threading
+import requests
+from google.auth.credentials import AnonymousCredentials
+from google.auth.transport.requests import AuthorizedSession
+from google.cloud import storage
+from google.oauth2 import service_account
+
+# One client per credentials file, shared by every upload and signature in the process
+_clients = {}
+_buckets = {}
+_lock = threading.Lock()
+
+def get_pool_size():
+    """Number of pooled HTTP connections kept per host"""
+    return max(1, int(os.getenv('GCS_HTTP_POOL_SIZE', '32')))
+
+def _build_client(credentials_path, pool_size):
+    """Create a storage client whose HTTP session keeps a connection pool of the given size"""
+    credentials = service_account.Credentials.from_service_account_file(
+        credentials_path,
+        scopes=storage.Client.SCOPE
+    )
+    project = credentials.project_id
+
+    # A local emulator (STORAGE_EMULATOR_HOST) does not accept OAuth tokens
+    if os.getenv('STORAGE_EMULATOR_HOST'):
+        credentials = AnonymousCredentials()
+
+    session = AuthorizedSession(credentials)
+    adapter = requests.adapters.HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    return storage.Client(
+        project=project,
+        credentials=credentials,
+        _http=session
+    )
+
+def get_storage_client(credentials_path, pool_size=None):
+    """
+    Return the shared storage client for a credentials file, creating it on first use.
+    Credentials are parsed once and TLS connections are reused across calls and threads.
+    """
+    key = os.path.abspath(credentials_path)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _build_client(credentials_path, pool_size or get_pool_size())
+            _clients[key] = client
+        return client
+
+def get_bucket(bucket_name, credentials_path):
+    """Return a shared bucket handle bound to the shared client"""
+    key = (os.path.abspath(credentials_path), bucket_name)
+    bucket = _buckets.get(key)
+    if bucket is None:
+        bucket = get_storage_client(credentials_path).bucket(bucket_name)
+        _buckets[key] = bucket
+    return bucket
+
+def reset_clients():
+    """Drop cached clients and close their HTTP sessions"""
+    with _lock:
+        for client in _clients.values():
+            client._http.close()
+        _clients.clear()
+        _buckets.clear()
@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+
+DEFAULT_CREDENTIALS_PATH = './gcs_storage_key.json'
+
+def load_config(require_credentials=True):
+    """
+    Bucket name and credentials path from the environment, exiting when they are missing.
+    Call load_dotenv() first so values from .env are included.
+
+    Args:
+        require_credentials: Also exit when the credentials file does not exist
+    """
+    bucket_name = os.getenv('GCS_BUCKET_NAME')
+    credentials_path = os.getenv('GCS_CREDENTIALS_PATH', DEFAULT_CREDENTIALS_PATH)
+
+    if not bucket_name:
+        sys.exit("Error: GCS_BUCKET_NAME environment variable is required\n"
+                 "Make sure to copy .env.template to .env and configure it")
+    if require_credentials and not os.path.exists(credentials_path):
+        sys.exit(f"Error: Credentials file not found at {credentials_path}")
+
+    return bucket_name, credentials_path
@@ -1,95 +1,227 @@
 #!/usr/bin/env python3
 
 import os
-from datetime import datetime, timedelta
-from google.cloud import storage
-from google.cloud.storage.blob import Blob
+import argparse
+from bucket_index import BucketIndex
+from url_signer import URL_LIFETIME
 from dotenv import load_dotenv
+from gcs_config import load_config
 import sys
-import pyperclip
 
-def load_config():
-    """Load configuration from environment variables."""
-    load_dotenv()
-    
-    bucket_name = os.getenv('GCS_BUCKET_NAME')
-    credentials_path = os.getenv('GCS_CREDENTIALS_PATH', './gcs_storage_key.json')
-    signed_urls_file = os.getenv('SIGNED_URLS_FILE', 'signed_urls.json')
-    
-    if not bucket_name:
-        sys.exit("Error: GCS_BUCKET_NAME environment variable is required")
-    if not os.path.exists(credentials_path):
-        sys.exit(f"Error: Credentials file not found at {credentials_path}")
-        
-    return bucket_name, credentials_path, signed_urls_file
-
-def list_bucket_files(bucket):
-    """List all files in the bucket, excluding folder markers."""
+def iter_bucket_pages(bucket, prefix=None, delimiter=None, page_size=1000):
+    """
+    Yield (folders, files) one listing page at a time, in name order.
+    Only object names are requested, and with a delimiter the objects below
+    sub folders are returned as folder prefixes instead of being listed.
+    """
+    blobs = bucket.client.list_blobs(
+        bucket,
+        prefix=prefix or None,
+        delimiter=delimiter,
+        page_size=page_size,
+        fields='items(name),prefixes,nextPageToken'
+    )
+    for page in blobs.pages:
+        # Skip folder markers (objects ending with '/')
+        files = [blob.name for blob in page if not blob.name.endswith('/')]
+        folders = sorted(getattr(page, 'prefixes', ()))
+        yield folders, files
+
+def list_bucket_files(bucket, prefix=None):
+    """
+    List all files in the bucket (or below a prefix), excluding folder markers.
+    Errors of the listing are raised to the caller.
+    """
     files = []
-    try:
-        blobs = bucket.list_blobs()
-        for blob in blobs:
-            # Skip folder markers (objects ending with '/')
-            if not blob.name.endswith('/'):
-                files.append(blob.name)
-        return sorted(files)  # Sort files for consistent display
-    except Exception as e:
-        sys.exit(f"Error listing bucket contents: {e}")
+    for _, page_files in iter_bucket_pages(bucket, prefix):
+        files.extend(page_files)
+    return files  # GCS returns names in lexicographic order
 
-def generate_signed_url(blob):
-    """Generate a signed URL valid for 7 days."""
-    try:
-        url = blob.generate_signed_url(
-            version="v4",
-            expiration=timedelta(days=7),
-            method="GET"
-        )
-        return url
-    except Exception as e:
-        sys.exit(f"Error generating signed URL: {e}")
+def select_file(bucket, prefix='', delimiter='/', page_size=100):
+    """
+    Let the user browse the bucket page by page and folder by folder.
+    Pages are fetched only when displayed. Returns the selected blob name or None.
+    """
+    while True:
+        pages = iter_bucket_pages(bucket, prefix, delimiter, page_size)
+        loaded = []
+        page_idx = 0
+        exhausted = False
+        new_prefix = None
+
+        while new_prefix is None:
+            # Fetch the next page lazily, the first time it is displayed
+            while page_idx >= len(loaded) and not exhausted:
+                try:
+                    folders, files = next(pages)
+                    if folders or files or not loaded:
+                        loaded.append(folders + files)
+                except StopIteration:
+                    exhausted = True
+            page_idx = min(page_idx, len(loaded) - 1) if loaded else 0
+            entries = loaded[page_idx] if loaded else []
+            has_next = page_idx + 1 < len(loaded) or not exhausted
+
+            print(f"\nFiles in bucket{f' under {prefix}' if prefix else ''} (page {page_idx + 1}):")
+            if not entries:
+                print("No files found")
+            for idx, name in enumerate(entries, 1):
+                print(f"{idx}) {name[len(prefix):] if delimiter else name}")
+
+            commands = []
+            if has_next:
+                commands.append("'n' next page")
+            if page_idx > 0:
+                commands.append("'p' previous page")
+            if prefix:
+                commands.append("'..' parent folder")
+            commands.append("'q' to quit")
+            choice = input(f"\nEnter the number of the file to sign or folder to open ({', '.join(commands)}): ").strip()
+
+            if choice.lower() == 'q':
+                return None
+            if choice.lower() == 'n' and has_next:
+                page_idx += 1
+            elif choice.lower() == 'p' and page_idx > 0:
+                page_idx -= 1
+            elif choice == '..' and prefix:
+                new_prefix = prefix.rstrip('/').rpartition('/')[0]
+                new_prefix = f"{new_prefix}/" if new_prefix else ''
+            else:
+                try:
+                    entry_idx = int(choice) - 1
+                    if not 0 <= entry_idx < len(entries):
+                        raise ValueError
+                except ValueError:
+                    print("Invalid selection. Please try again.")
+                    continue
+                selected = entries[entry_idx]
+                if delimiter and selected.endswith(delimiter):
+                    new_prefix = selected
+                else:
+                    return selected
+        prefix = new_prefix
+
+def generate_signed_url(blob, signer=None):
+    """
+    Generate a signed URL valid for 7 days, locally when a URLSigner is given.
+    Signing errors are raised to the caller.
+    """
+    if signer is not None:
+        return signer.sign(blob.bucket.name, blob.name, expiration=URL_LIFETIME)
+    return blob.generate_signed_url(
+        version="v4",
+        expiration=URL_LIFETIME,
+        method="GET"
+    )
+
+def search_file(index, bucket_name, query='', prefix='', page_size=100):
+    """
+    Let the user pick a file from local index search results, page by page.
+    Returns the selected blob name or None.
+    """
+    offset = 0
+    while True:
+        # One extra row tells whether there is a next page
+        names = index.search(bucket_name, query, prefix, limit=page_size + 1, offset=offset)
+        has_next = len(names) > page_size
+        names = names[:page_size]
+
+        print(f"\nFiles matching '{query}'{f' under {prefix}' if prefix else ''} "
+              f"(results {offset + 1 if names else 0}-{offset + len(names)}):")
+        if not names:
+            print("No files found")
+        for idx, name in enumerate(names, 1):
+            print(f"{idx}) {name}")
+
+        commands = []
+        if has_next:
+            commands.append("'n' next page")
+        if offset:
+            commands.append("'p' previous page")
+        commands += ["'/text' new search", "'q' to quit"]
+        choice = input(f"\nEnter the number of the file to sign ({', '.join(commands)}): ").strip()
+
+        if choice.lower() == 'q':
+            return None
+        if choice.lower() == 'n' and has_next:
+            offset += page_size
+        elif choice.lower() == 'p' and offset:
+            offset = max(0, offset - page_size)
+        elif choice.startswith('/'):
+            query = choice[1:]
+            offset = 0
+        else:
+            try:
+                file_idx = int(choice) - 1
+                if 0 <= file_idx < len(names):
+                    return names[file_idx]
+            except ValueError:
+                pass
+            print("Invalid selection. Please try again.")
+
+def parse_args():
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description='Browse a bucket and sign an existing file')
+    parser.add_argument('--prefix', default='', help='Start browsing below this prefix (e.g. folder1/)')
+    parser.add_argument('--flat', action='store_true', help='List every object below the prefix instead of folder by folder')
+    parser.add_argument('--page-size', type=int, default=100, help='Entries per page (default: 100)')
+    parser.add_argument('--search', metavar='QUERY',
+                        help='Pick the file from the local bucket index by substring or glob (e.g. "*.pdf")')
+    parser.add_argument('--refresh-index', action='store_true',
+                        help='Refresh the local bucket index before searching')
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
+    
     # Load configuration
-    bucket_name, credentials_path, signed_urls_file = load_config()
+    load_dotenv()
+    bucket_name, credentials_path = load_config()
     
     # Initialize GCS client
+    from gcs_client import get_bucket
+    from url_signer import get_url_signer
     try:
-        client = storage.Client.from_service_account_json(credentials_path)
-        bucket = client.bucket(bucket_name)
+        bucket = get_bucket(bucket_name, credentials_path)
+        signer = get_url_signer(credentials_path)
     except Exception as e:
         sys.exit(f"Error initializing GCS client: {e}")
     
-    # List files
-    files = list_bucket_files(bucket)
-    
-    if not files:
-        sys.exit("No files found in bucket")
-    
-    # Display files with numbers
-    print("\nFiles in bucket:")
-    for idx, file in enumerate(files, 1):
-        print(f"{idx}) {file}")
-    
-    # Get user selection
-    while True:
-        choice = input("\nEnter the number of the file to sign (or 'q' to quit): ").strip()
-        
-        if choice.lower() == 'q':
-            sys.exit(0)
-        
+    # Browse the bucket page by page and pick a file
+    prefix = args.prefix.lstrip('/')
+    if prefix and not args.flat and not prefix.endswith('/'):
+        prefix += '/'
+    if args.search is not None or args.refresh_index:
+        # Search the local index, refreshing it only when it is missing or stale
+        index = BucketIndex()
+        if args.refresh_index or index.is_stale(bucket_name, prefix):
+            print("Refreshing local bucket index...")
+            try:
+                listed, removed = index.refresh(bucket, prefix)
+            except Exception as e:
+                sys.exit(f"Error listing bucket contents: {e}")
+            print(f"Indexed {listed} objects ({removed} removed)")
+        selected_file = search_file(index, bucket_name, args.search or '', prefix, max(1, args.page_size))
+    else:
         try:
-            file_idx = int(choice) - 1
-            if 0 <= file_idx < len(files):
-                selected_file = files[file_idx]
-                break
-            else:
-                print("Invalid selection. Please try again.")
-        except ValueError:
-            print("Please enter a valid number or 'q' to quit.")
+            selected_file = select_file(
+                bucket,
+                prefix=prefix,
+                delimiter=None if args.flat else '/',
+                page_size=max(1, args.page_size)
+            )
+        except Exception as e:
+            sys.exit(f"Error listing bucket contents: {e}")
+    if selected_file is None:
+        sys.exit(0)
     
     # Generate signed URL
     blob = bucket.blob(selected_file)
-    signed_url = generate_signed_url(blob)
+    try:
+        signed_url = generate_signed_url(blob, signer)
+    except Exception as e:
+        sys.exit(f"Error generating signed URL: {e}")
     
     # Output results
     print(f"\nSigned URL for {selected_file} (valid for 7 days):")
@@ -97,6 +229,7 @@ def main():
     
     # Try to copy to clipboard
     try:
+        import pyperclip
         pyperclip.copy(signed_url)
         print("\nURL copied to clipboard!")
     except Exception:
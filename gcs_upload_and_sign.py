@@ -3,21 +3,41 @@
 import os
 import re
 import sys
-import json
-import pyperclip
-from datetime import timedelta, datetime
+import glob
+import time
+import argparse
+import threading
+from datetime import datetime
 from pathlib import Path
-from tqdm import tqdm
-from dotenv import load_dotenv
-from google.cloud import storage
-
-# Load environment variables from .env file
-env_path = Path('.env')
-if env_path.exists():
-    load_dotenv()
-else:
-    print("Warning: .env file not found. Make sure to copy .env.template to .env and configure it.")
-    sys.exit(1)
+from url_store import open_record_store
+from url_signer import URL_LIFETIME
+from metrics import span, increment, profile_run
+
+# google-cloud-storage, tqdm and pyperclip are imported by the functions that use them,
+# so importing this module or checking a record does not pay for them
+
+# Folder markers known to exist in this run, per (bucket, prefix)
+_folder_markers = set()
+_folder_marker_locks = {}
+_folder_markers_lock = threading.Lock()
+
+def load_config():
+    """
+    Load the .env file and return (bucket_name, credentials_path),
+    exiting with an error message when the configuration is incomplete
+    """
+    from dotenv import load_dotenv
+    import gcs_config
+
+    # Load environment variables from .env file
+    env_path = Path('.env')
+    if env_path.exists():
+        load_dotenv()
+    else:
+        print("Warning: .env file not found. Make sure to copy .env.template to .env and configure it.")
+        sys.exit(1)
+
+    return gcs_config.load_config()
 
 def sanitize_filename(filename):
     """
@@ -39,61 +59,20 @@ def sanitize_filename(filename):
     return f"{name}{ext.lower()}"
 
 def load_url_records(records_file=None):
-    """Load existing URL records from JSON file"""
-    if records_file is None:
-        records_file = os.getenv('SIGNED_URLS_FILE', 'signed_urls.json')
-    
-    try:
-        with open(records_file, 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {}
+    """Load existing URL records from the record store"""
+    return open_record_store(records_file).load_all()
 
 def save_url_record(filename, signed_url, expiration_date, records_file=None):
     """Save URL record with expiration date and maintain history"""
-    if records_file is None:
-        records_file = os.getenv('SIGNED_URLS_FILE', 'signed_urls.json')
-    
-    records = load_url_records(records_file)
-    
-    # If file exists, move current URL to history
-    if filename in records:
-        current_record = records[filename]
-        if 'history' not in current_record:
-            current_record['history'] = []
-        
-        # Add current URL to history
-        current_record['history'].append({
-            'url': current_record['url'],
-            'created_at': current_record['created_at'],
-            'expiration': current_record['expiration']
-        })
-        
-        # Keep only last 5 historical URLs
-        current_record['history'] = current_record['history'][-5:]
-    
-    # Create or update the record
-    records[filename] = {
-        'url': signed_url,
-        'expiration': expiration_date.isoformat(),
-        'created_at': datetime.now().isoformat(),
-        'history': records.get(filename, {}).get('history', [])
-    }
-    
-    with open(records_file, 'w') as f:
-        json.dump(records, f, indent=2)
+    return open_record_store(records_file).save(filename, signed_url, expiration_date)
 
 def check_url_expiration(filename, records_file=None):
     """Check if URL for given filename is expired"""
-    if records_file is None:
-        records_file = os.getenv('SIGNED_URLS_FILE', 'signed_urls.json')
+    record = open_record_store(records_file).get(filename)
     
-    records = load_url_records(records_file)
-    
-    if filename not in records:
+    if record is None:
         return None, "No URL record found"
     
-    record = records[filename]
     expiration = datetime.fromisoformat(record['expiration'])
     
     if datetime.now() > expiration:
@@ -102,7 +81,104 @@ def check_url_expiration(filename, records_file=None):
         days_left = (expiration - datetime.now()).days
         return True, f"URL valid for {days_left} more days"
 
-def upload_and_sign(file_path, bucket_name, credentials_path, folder_path=None):
+def build_blob_path(file_path, folder_path=None):
+    """
+    Return (blob_path, folder_prefix) for a local file: the sanitized filename,
+    below the sanitized folder path when one is given (folder_prefix is then
+    'folder1/subfolder2/', otherwise None).
+    """
+    # Sanitize the filename
+    sanitized_filename = sanitize_filename(os.path.basename(file_path))
+    
+    # Construct the full blob path including folder if specified
+    if folder_path and folder_path.strip('/'):
+        # Remove leading/trailing slashes and sanitize folder path
+        folder_parts = [sanitize_filename(part) for part in folder_path.strip('/').split('/')]
+        return '/'.join(folder_parts + [sanitized_filename]), f"{'/'.join(folder_parts)}/"
+    return sanitized_filename, None
+
+def folder_markers_enabled():
+    """Whether empty folder marker objects are created (GCS_FOLDER_MARKERS)"""
+    return os.getenv('GCS_FOLDER_MARKERS', '1').lower() not in ('0', 'false', 'no', 'off')
+
+def ensure_folder_marker(bucket, prefix):
+    """
+    Create the folder marker object for a prefix once per run.
+    The marker is created with if_generation_match=0, so an existing marker costs a
+    single rejected request and later uploads to the same folder cost nothing.
+    """
+    if not folder_markers_enabled():
+        return
+    from google.api_core.exceptions import PreconditionFailed
+    key = (bucket.name, prefix)
+    if key in _folder_markers:
+        return
+    with _folder_markers_lock:
+        prefix_lock = _folder_marker_locks.setdefault(key, threading.Lock())
+    with prefix_lock:
+        if key in _folder_markers:
+            return
+        try:
+            bucket.blob(prefix).upload_from_string('', if_generation_match=0)
+        except PreconditionFailed:
+            pass
+        _folder_markers.add(key)
+
+def upload_file(blob, file_path, progress=None, compression=None):
+    """
+    Upload a file to a blob with the mode suited to its size and content
+    Args:
+        blob: Destination blob
+        file_path: Path to the file to upload
+        progress: Optional callable receiving the number of bytes uploaded as they are sent
+        compression: 'gzip', 'zstd' or 'off' for compressible files (GCS_COMPRESSION by default)
+    """
+    from resumable_upload import resumable_upload, get_resumable_threshold
+    from composite_upload import composite_upload, get_composite_threshold
+    from compressed_upload import compressed_upload, get_compression, should_compress
+
+    file_size = os.path.getsize(file_path)
+    sent = file_size
+    encoding = get_compression(compression)
+    composite_threshold = get_composite_threshold()
+    if encoding and should_compress(file_path):
+        mode = 'compressed'
+    elif composite_threshold and file_size > composite_threshold:
+        mode = 'composite'
+    elif file_size > get_resumable_threshold():
+        mode = 'resumable'
+    else:
+        mode = 'simple'
+    if mode == 'compressed' and file_size <= get_resumable_threshold():
+        sent = compressed_upload(blob, file_path, encoding, progress=progress, timeout=120)
+    elif mode != 'simple':
+        # Large files are streamed in chunks with progress; very large ones in parallel parts
+        from tqdm import tqdm
+        with tqdm(total=file_size, unit='B', unit_scale=True, unit_divisor=1024,
+                  desc=blob.name, leave=progress is None) as file_progress:
+            def on_chunk(sent):
+                file_progress.update(sent)
+                if progress:
+                    progress(sent)
+            if mode == 'compressed':
+                sent = compressed_upload(blob, file_path, encoding, progress=on_chunk, timeout=120)
+            elif mode == 'composite':
+                composite_upload(blob, file_path, progress=on_chunk, timeout=120)
+            else:
+                resumable_upload(blob, file_path, progress=on_chunk, timeout=120)
+    else:
+        blob.upload_from_filename(
+            file_path,
+            timeout=120,  # 2 minutes timeout
+            checksum='md5'
+        )
+        if progress:
+            progress(file_size)
+    increment('gcs_uploads_total', help='Files handled by upload mode', mode=mode)
+    increment('gcs_upload_bytes_total', sent, help='Bytes uploaded', mode=mode)
+
+def upload_and_sign(file_path, bucket_name, credentials_path, folder_path=None, progress=None,
+                    skip_unchanged=None, compression=None, on_unchanged=None):
     """
     Upload a file to GCS bucket and generate a signed URL
     Args:
@@ -110,74 +186,248 @@ def upload_and_sign(file_path, bucket_name, credentials_path, folder_path=None):
         bucket_name: Name of the GCS bucket
         credentials_path: Path to the service account credentials file
         folder_path: Optional folder path within the bucket (e.g., 'folder1/subfolder2')
+        progress: Optional callable receiving the number of bytes uploaded as they are sent
+        skip_unchanged: Skip the upload when the blob already has the same content
+                        (GCS_SKIP_UNCHANGED by default)
+        compression: 'gzip', 'zstd' or 'off' for compressible files (GCS_COMPRESSION by default)
+        on_unchanged: Optional callable called when the upload is skipped because the blob is unchanged
+    Raises:
+        FileNotFoundError: if the file does not exist; errors of the storage client are raised
+        as they are, so callers can retry transient ones
     """
     if not os.path.exists(file_path):
-        print(f"Error: File {file_path} does not exist")
-        sys.exit(1)
+        raise FileNotFoundError(f"File {file_path} does not exist")
 
-    # Initialize the client with credentials
-    storage_client = storage.Client.from_service_account_json(credentials_path)
-    
-    # Get the bucket
-    bucket = storage_client.bucket(bucket_name)
+    from tqdm import tqdm
+    from gcs_client import get_bucket
+    from url_signer import get_url_signer
+    from hash_cache import is_unchanged, skip_unchanged_enabled
+
+    # Get the bucket from the shared client (credentials and connections are reused)
+    with span('credentials'):
+        bucket = get_bucket(bucket_name, credentials_path)
+        signer = get_url_signer(credentials_path)
     
-    # Sanitize the filename
     original_filename = os.path.basename(file_path)
-    sanitized_filename = sanitize_filename(original_filename)
+    blob_path, folder_prefix = build_blob_path(file_path, folder_path)
     
-    # Construct the full blob path including folder if specified
-    if folder_path:
-        # Remove leading/trailing slashes and sanitize folder path
-        folder_path = folder_path.strip('/')
-        folder_parts = [sanitize_filename(part) for part in folder_path.split('/')]
-        blob_path = '/'.join(folder_parts + [sanitized_filename])
-        
+    if folder_prefix:
         # Create an empty object to ensure folder exists (GCS doesn't have real folders)
-        folder_marker = bucket.blob(f"{'/'.join(folder_parts)}/")
-        if not folder_marker.exists():
-            folder_marker.upload_from_string('')
-    else:
-        blob_path = sanitized_filename
+        with span('folder_marker'):
+            ensure_folder_marker(bucket, folder_prefix)
     
     # Upload the file
     blob = bucket.blob(blob_path)
     
-    print(f"\nUploading {original_filename} to {blob_path}...")
-    
-    # Simple upload without progress tracking
-    blob.upload_from_filename(
-        file_path,
-        timeout=120,  # 2 minutes timeout
-        checksum='md5'
-    )
-    
-    print(f"File uploaded as: {blob_path}")
+    file_size = os.path.getsize(file_path)
+    if skip_unchanged is None:
+        skip_unchanged = skip_unchanged_enabled()
+    
+    # Re-sign without uploading when the bucket already holds the same bytes
+    unchanged = False
+    if skip_unchanged:
+        with span('unchanged_check'):
+            unchanged = is_unchanged(bucket.get_blob(blob_path, timeout=120), file_path)
+    if unchanged:
+        increment('gcs_uploads_total', help='Files handled by upload mode', mode='skipped')
+        tqdm.write(f"\n{original_filename} is unchanged in {blob_path}, skipping upload")
+        if progress:
+            progress(file_size)
+        if on_unchanged:
+            on_unchanged()
+    else:
+        tqdm.write(f"\nUploading {original_filename} to {blob_path}...")
+        with span('upload'):
+            upload_file(blob, file_path, progress, compression)
+        if blob.content_encoding:
+            tqdm.write(f"File uploaded as: {blob_path} ({blob.content_encoding}, "
+                       f"{file_size / 1024:.0f} KiB compressed to {blob.size / 1024:.0f} KiB)")
+        else:
+            tqdm.write(f"File uploaded as: {blob_path}")
     
     # Calculate expiration date (7 days from now)
-    expiration_date = datetime.now() + timedelta(days=7)
+    expiration_date = datetime.now() + URL_LIFETIME
     
-    # Generate signed URL (7 days is the maximum allowed time)
-    signed_url = blob.generate_signed_url(
-        version="v4",
-        expiration=timedelta(days=7),
-        method="GET"
-    )
+    # Generate signed URL locally (7 days is the maximum allowed time)
+    signed_url = signer.sign(bucket_name, blob_path, expiration=URL_LIFETIME)
     
     # Save URL record
-    save_url_record(blob_path, signed_url, expiration_date)
+    with span('record'):
+        save_url_record(blob_path, signed_url, expiration_date)
     
     return signed_url, blob_path
 
+def collect_files(patterns):
+    """
+    Expand files, directories and glob patterns into (file_path, sub_folder) pairs.
+    Files found below a directory keep their relative sub folder so the tree
+    layout is mirrored in the bucket.
+    """
+    files = []
+    seen = set()
+
+    def add(file_path, sub_folder):
+        key = os.path.abspath(file_path)
+        if key not in seen:
+            seen.add(key)
+            files.append((file_path, sub_folder))
+
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            print(f"Warning: No files match {pattern}")
+        for match in matches:
+            if os.path.isdir(match):
+                root_dir = match.rstrip(os.sep) or match
+                for dirpath, dirnames, filenames in os.walk(root_dir):
+                    dirnames.sort()
+                    relative_dir = os.path.relpath(dirpath, root_dir)
+                    sub_folder = None if relative_dir == '.' else relative_dir.replace(os.sep, '/')
+                    for name in sorted(filenames):
+                        add(os.path.join(dirpath, name), sub_folder)
+            elif os.path.isfile(match):
+                add(match, None)
+            else:
+                print(f"Warning: File {match} does not exist")
+    return files
+
+def split_colliding_entries(entries):
+    """
+    Separate the (file_path, folder_path) entries whose files sanitize to the same
+    blob path (e.g. 'My File.txt' and 'My_File.txt'): uploading them would overwrite
+    one object with the other. Returns (entries, failures) with the remaining entries
+    and a (file_path, error message) failure for every colliding file.
+    """
+    paths = {}
+    for entry in entries:
+        paths.setdefault(build_blob_path(*entry)[0], []).append(entry)
+
+    remaining = []
+    failures = []
+    for blob_path, colliding in paths.items():
+        if len(colliding) == 1:
+            remaining.append(colliding[0])
+            continue
+        file_paths = [file_path for file_path, _ in colliding]
+        print(f"Error: {', '.join(file_paths)} would all be uploaded as {blob_path}, skipping them")
+        for file_path in file_paths:
+            others = ', '.join(other for other in file_paths if other != file_path)
+            failures.append((file_path, f"Same blob path {blob_path} as {others}"))
+    return remaining, failures
+
+def upload_batch(patterns, bucket_name, credentials_path, folder_path=None, max_workers=8, skip_unchanged=None,
+                 failed_items_file=None, compression=None):
+    """
+    Upload many files concurrently and sign each one
+    Args:
+        patterns: File paths, directories or glob patterns to upload
+        bucket_name: Name of the GCS bucket
+        credentials_path: Path to the service account credentials file
+        folder_path: Optional folder path within the bucket used as the root of the batch
+        max_workers: Maximum number of concurrent uploads
+        skip_unchanged: Skip files whose content is already in the bucket (GCS_SKIP_UNCHANGED by default)
+        failed_items_file: File the failed uploads are written to for --resume (GCS_FAILED_ITEMS_FILE by default)
+        compression: 'gzip', 'zstd' or 'off' for compressible files (GCS_COMPRESSION by default)
+    Returns:
+        (results, failures) where results is a list of (file_path, blob_path, signed_url)
+        and failures a list of (file_path, error message)
+    """
+    entries = [
+        (file_path, '/'.join(part for part in (folder_path, sub_folder) if part) or None)
+        for file_path, sub_folder in collect_files(patterns)
+    ]
+    return upload_entries(entries, bucket_name, credentials_path, max_workers, skip_unchanged, failed_items_file,
+                          compression)
+
+def upload_entries(entries, bucket_name, credentials_path, max_workers=8, skip_unchanged=None, failed_items_file=None,
+                   compression=None):
+    """
+    Upload (file_path, folder_path) pairs with the adaptive retry scheduler: transient
+    errors are retried with backoff and the number of concurrent uploads is reduced
+    while the service throttles. Uploads that still fail are written to the failed
+    items file. Files that would share a blob path are reported as failures without
+    being uploaded. Arguments and return value are those of upload_batch().
+    """
+    from tqdm import tqdm
+    from retry_scheduler import AdaptiveScheduler, FailedItems
+
+    results = []
+    requested = len(entries)
+    entries, failures = split_colliding_entries(entries)
+    if not entries:
+        return results, failures
+
+    total_bytes = sum(os.path.getsize(file_path) for file_path, _ in entries if os.path.isfile(file_path))
+    print(f"\nUploading {len(entries)} files ({total_bytes / 1024 / 1024:.1f} MiB) with up to {max_workers} workers...")
+    start = time.monotonic()
+    scheduler = AdaptiveScheduler(max_workers, operation='upload')
+
+    with tqdm(total=total_bytes, unit='B', unit_scale=True, unit_divisor=1024, desc='Total') as total_progress, \
+            FailedItems(failed_items_file) as failed_items:
+
+        def upload(entry):
+            file_path, target_folder = entry
+            sent = 0
+            unchanged = False
+
+            def progress(size):
+                nonlocal sent
+                sent += size
+                total_progress.update(size)
+
+            def on_unchanged():
+                nonlocal unchanged
+                unchanged = True
+
+            try:
+                result = upload_and_sign(file_path, bucket_name, credentials_path, target_folder,
+                                         progress=progress, skip_unchanged=skip_unchanged, compression=compression,
+                                         on_unchanged=on_unchanged)
+                return result, unchanged
+            except Exception:
+                # A retried upload starts over; its bytes are counted again
+                total_progress.update(-sent)
+                raise
+
+        skipped = 0
+        uploaded_bytes = 0
+        for (file_path, target_folder), result, error in scheduler.run(upload, entries):
+            if error is None:
+                (signed_url, blob_path), unchanged = result
+                results.append((file_path, blob_path, signed_url))
+                # Files already in the bucket are only re-signed and do not count towards the throughput
+                if unchanged:
+                    skipped += 1
+                else:
+                    uploaded_bytes += os.path.getsize(file_path)
+            else:
+                failures.append((file_path, str(error)))
+                failed_items.add([file_path, target_folder], error)
+                tqdm.write(f"Error uploading {file_path}: {str(error)}")
+
+    elapsed = time.monotonic() - start
+    uploaded = len(results) - skipped
+    throughput = uploaded_bytes / elapsed if elapsed > 0 else 0
+    print(f"\nUploaded {uploaded}/{requested} files in {elapsed:.1f}s "
+          f"({throughput / 1024 / 1024:.2f} MiB/s, {uploaded / elapsed if elapsed > 0 else 0:.1f} files/s)")
+    if skipped:
+        print(f"{skipped} unchanged files skipped and only re-signed")
+    if scheduler.retried:
+        print(f"{scheduler.retried} retries, {scheduler.throttled} throttled responses, "
+              f"finished with {scheduler.concurrency} concurrent uploads")
+    if failed_items.count:
+        print(f"Failed uploads written to {failed_items.path}; rerun with --batch --resume to retry them")
+
+    return results, failures
+
 def show_active_url(filename):
     """Display active URL for a file"""
-    records_file = os.getenv('SIGNED_URLS_FILE', 'signed_urls.json')
-    records = load_url_records(records_file)
+    record = open_record_store().get(filename)
     
-    if filename not in records:
+    if record is None:
         print(f"No active URL found for: {filename}")
         return False
     
-    record = records[filename]
     status, days_left = check_url_expiration(filename)
     
     print(f"\nActive URL for {filename}:")
@@ -190,36 +440,87 @@ def show_active_url(filename):
     
     # Copy URL to clipboard if it's still valid
     if status:
+        import pyperclip
         pyperclip.copy(record['url'])
         print("\nURL has been copied to clipboard!")
     
     return True
 
+def check_compression(compression=None):
+    """Exit with an error message when the compression setting is invalid or zstandard is missing"""
+    from compressed_upload import get_compression
+    try:
+        get_compression(compression)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+def parse_batch_args(args):
+    """Parse the arguments of the --batch mode"""
+    parser = argparse.ArgumentParser(
+        prog='upload_and_sign.py --batch',
+        description='Upload many files, globs or directory trees concurrently and sign each one'
+    )
+    parser.add_argument('paths', nargs='*', help='Files, directories or glob patterns (quote globs to use ** recursion)')
+    parser.add_argument('--folder', dest='folder_path', help='Folder path within the bucket used as the batch root')
+    parser.add_argument('--workers', type=int, default=int(os.getenv('GCS_UPLOAD_WORKERS', '8')),
+                        help='Number of concurrent uploads (default: GCS_UPLOAD_WORKERS or 8)')
+    parser.add_argument('--force', action='store_true', help='Upload files even if the bucket already has the same content')
+    parser.add_argument('--compress', choices=('gzip', 'zstd', 'off'), default=None,
+                        help='Compress text, JSON, CSV and log files while uploading (default: GCS_COMPRESSION or off)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Upload again the files that failed in the last batch (see GCS_FAILED_ITEMS_FILE)')
+    parser.add_argument('--failed-file', default=None,
+                        help='File listing the failed uploads (default: GCS_FAILED_ITEMS_FILE or failed_items.ndjson)')
+    batch_args = parser.parse_args(args)
+    if not batch_args.paths and not batch_args.resume:
+        parser.error('at least one path is required unless --resume is given')
+    return batch_args
+
 def main():
     if len(sys.argv) < 2:
         print("Usage:")
         print("  python upload_and_sign.py <file_path> [folder_path]")
+        print("  python upload_and_sign.py --batch <path|dir|glob>... [--folder folder_path] [--workers N] [--force]"
+              " [--compress gzip|zstd|off]")
+        print("  python upload_and_sign.py --batch --resume")
         print("Example:")
         print("  python upload_and_sign.py myfile.pdf")
         print("  python upload_and_sign.py myfile.pdf folder1/subfolder2")
+        print("  python upload_and_sign.py --batch ./release --folder releases/v1.2 --workers 16")
         sys.exit(1)
     
-    # Get configuration from environment variables
-    bucket_name = os.getenv('GCS_BUCKET_NAME')
-    credentials_path = os.getenv('GCS_CREDENTIALS_PATH', './gcs_storage_key.json')
-    
-    # Validate required environment variables
-    if not bucket_name:
-        print("Error: GCS_BUCKET_NAME environment variable is required")
-        print("Make sure to copy .env.template to .env and configure it")
-        sys.exit(1)
-    
-    if not os.path.exists(credentials_path):
-        print(f"Error: Credentials file not found at {credentials_path}")
-        sys.exit(1)
+    bucket_name, credentials_path = load_config()
+    
+    if sys.argv[1] == '--batch':
+        batch_args = parse_batch_args(sys.argv[2:])
+        check_compression(batch_args.compress)
+        skip_unchanged = False if batch_args.force else None
+        if batch_args.resume:
+            from retry_scheduler import load_failed_items
+            entries = [tuple(item) for item in load_failed_items(batch_args.failed_file)]
+            if not entries:
+                print("No failed uploads to resume")
+                return
+            results, failures = upload_entries(entries, bucket_name, credentials_path, max(1, batch_args.workers),
+                                               skip_unchanged, batch_args.failed_file, batch_args.compress)
+        else:
+            results, failures = upload_batch(batch_args.paths, bucket_name, credentials_path,
+                                             batch_args.folder_path, max(1, batch_args.workers),
+                                             skip_unchanged, batch_args.failed_file, batch_args.compress)
+        print("\nSigned URLs (valid for 7 days):")
+        for file_path, blob_path, signed_url in sorted(results, key=lambda result: result[1]):
+            print(f"{blob_path}\t{signed_url}")
+        if failures:
+            print(f"\n{len(failures)} file(s) failed:")
+            for file_path, error in failures:
+                print(f"- {file_path}: {error}")
+            sys.exit(1)
+        return
     
     file_path = sys.argv[1]
     folder_path = sys.argv[2] if len(sys.argv) > 2 else None
+    check_compression()
     
     try:
         signed_url, blob_path = upload_and_sign(file_path, bucket_name, credentials_path, folder_path)
@@ -234,4 +535,5 @@ def main():
         sys.exit(1)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    with profile_run():
+        main() 
\ No newline at end of file
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+import os
+import base64
+import hashlib
+import sqlite3
+import threading
+import google_crc32c
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+def skip_unchanged_enabled():
+    """Whether uploads whose bytes are already in the bucket are skipped (GCS_SKIP_UNCHANGED)"""
+    return os.getenv('GCS_SKIP_UNCHANGED', '1').lower() not in ('0', 'false', 'no', 'off')
+
+def compute_digests(file_path, chunk_size=8 * 1024 * 1024):
+    """MD5 and CRC32C of a file in one pass, base64 encoded like blob.md5_hash and blob.crc32c"""
+    md5 = hashlib.md5()
+    crc32c = google_crc32c.Checksum()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            md5.update(chunk)
+            crc32c.update(chunk)
+    return (base64.b64encode(md5.digest()).decode('ascii'),
+            base64.b64encode(crc32c.digest()).decode('ascii'))
+
+class HashCache:
+    """
+    Local cache of file digests keyed by (path, size, mtime), so unchanged
+    files are never read twice to find out whether they need uploading.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS digests ('
+            'path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, '
+            'md5 TEXT NOT NULL, crc32c TEXT NOT NULL)'
+        )
+
+    def get_digests(self, file_path):
+        """Return (md5, crc32c) of a file, computing them only if the file changed"""
+        path = os.path.abspath(file_path)
+        stat = os.stat(path)
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT md5, crc32c FROM digests WHERE path = ? AND size = ? AND mtime_ns = ?',
+                (path, stat.st_size, stat.st_mtime_ns)
+            ).fetchone()
+        if row:
+            return row
+
+        md5, crc32c = compute_digests(path)
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO digests (path, size, mtime_ns, md5, crc32c) VALUES (?, ?, ?, ?, ?)',
+                (path, stat.st_size, stat.st_mtime_ns, md5, crc32c)
+            )
+        return md5, crc32c
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def get_hash_cache(path=None):
+    """Return the shared hash cache (GCS_HASH_CACHE_FILE, .gcs_hash_cache.db by default)"""
+    path = path or os.getenv('GCS_HASH_CACHE_FILE', '.gcs_hash_cache.db')
+    key = os.path.abspath(path)
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None:
+            cache = HashCache(path)
+            _caches[key] = cache
+        return cache
+
+def source_metadata(file_path, cache=None):
+    """
+    Custom metadata recording the size and digests of a file uploaded compressed,
+    whose stored size and hashes are those of the compressed bytes
+    """
+    md5, crc32c = (cache or get_hash_cache()).get_digests(file_path)
+    return {'source-size': str(os.path.getsize(file_path)), 'source-md5': md5, 'source-crc32c': crc32c}
+
+def is_unchanged(blob, file_path, cache=None):
+    """
+    Whether the remote blob already holds the bytes of the local file.
+    blob must have been loaded (bucket.get_blob) or be None when it does not exist.
+    """
+    if blob is None:
+        return False
+    metadata = blob.metadata or {}
+    if blob.content_encoding and 'source-crc32c' in metadata:
+        # Uploaded compressed: compare the file with the source digests recorded at upload
+        if metadata.get('source-size') != str(os.path.getsize(file_path)):
+            return False
+        md5, crc32c = (cache or get_hash_cache()).get_digests(file_path)
+        return metadata['source-crc32c'] == crc32c and metadata.get('source-md5') == md5
+    if blob.size != os.path.getsize(file_path):
+        return False
+    md5, crc32c = (cache or get_hash_cache()).get_digests(file_path)
+    if blob.crc32c != crc32c:
+        return False
+    # Composite objects have no MD5 hash; the CRC32C and size then decide
+    return blob.md5_hash is None or blob.md5_hash == md5
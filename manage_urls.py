@@ -1,63 +1,231 @@
 #!/usr/bin/env python3
 
-import json
 import os
+import re
+from bisect import bisect_left
 from datetime import datetime
-import pyperclip
-
-def load_url_records(records_file='signed_urls.json'):
-    """Load existing URL records from JSON file"""
-    try:
-        with open(records_file, 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        print("No URL records found")
-        return {}
+from fnmatch import fnmatchcase
+from dotenv import load_dotenv
+from url_store import open_record_store, default_records_file
+
+SORT_FIELDS = ('name', 'expiration', 'created', 'history')
 
-def save_url_records(records, records_file='signed_urls.json'):
-    """Save URL records to JSON file"""
-    with open(records_file, 'w') as f:
-        json.dump(records, f, indent=2)
+def get_page_size():
+    """Records shown per page (MANAGE_URLS_PAGE_SIZE)"""
+    return max(1, int(os.getenv('MANAGE_URLS_PAGE_SIZE', '20')))
 
-def get_url_status(expiration_str):
+def get_url_status(expiration_str, current_time=None):
     """Get status and remaining days for a URL"""
     expiration = datetime.fromisoformat(expiration_str)
-    current_time = datetime.now()
-    
+    current_time = current_time or datetime.now()
+
     if current_time > expiration:
         return "EXPIRED", 0
     else:
         days_left = (expiration - current_time).days
         return "VALID", days_left
 
-def display_urls(records):
-    """Display all URLs with their status"""
-    if not records:
-        print("\nNo URLs found in the records.")
-        return False
+class RecordIndex:
+    """
+    In-memory index of a record store for browsing it. Only the expiration,
+    creation time and number of previous URLs of each file are kept; URLs are
+    read from the store when a record is opened.
+
+    The index is read once and kept up to date in place: deleted records are
+    removed from it and from the current view with a binary search, and it is
+    only read again when another process changed the store. The view (filtered
+    and sorted file names) is rebuilt only when the sort or filter changes.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.entries = {}
+        self.sort_field = 'name'
+        self.descending = False
+        self.status = None
+        self.prefix = ''
+        self.max_days = None
+        self.min_days = None
+        self._view = []  # Sort keys of the files shown, ascending, each ending with the file name
+        self.reload()
+
+    def reload(self):
+        """Read the summaries of all records from the store"""
+        self._version = self.store.version()
+        self.entries = {
+            filename: (expiration, created_at, history_count)
+            for filename, expiration, created_at, history_count in self.store.summaries()
+        }
+        self.rebuild_view()
+
+    def refresh(self):
+        """Read the store again if another process changed it since it was last read. Returns True if so."""
+        if self.store.version() == self._version:
+            return False
+        self.reload()
+        return True
+
+    def _key(self, filename, entry):
+        expiration, created_at, history_count = entry
+        if self.sort_field == 'expiration':
+            return (expiration, filename)
+        if self.sort_field == 'created':
+            return (created_at, filename)
+        if self.sort_field == 'history':
+            return (history_count, filename)
+        return (filename,)
+
+    def _matches(self, filename, entry, now):
+        if not filename.startswith(self.prefix):
+            return False
+        if self.status is None and self.max_days is None and self.min_days is None:
+            return True
+        status, days_left = get_url_status(entry[0], now)
+        if self.status is not None and status != self.status:
+            return False
+        if self.max_days is not None and days_left > self.max_days:
+            return False
+        return self.min_days is None or days_left >= self.min_days
+
+    def rebuild_view(self):
+        now = datetime.now()
+        self._view = sorted(
+            self._key(filename, entry) for filename, entry in self.entries.items()
+            if self._matches(filename, entry, now)
+        )
+
+    def __len__(self):
+        return len(self._view)
 
-    print("\nStored URLs:")
+    def name_at(self, position):
+        """File name at a 0-based position of the view"""
+        return self._view[-1 - position if self.descending else position][-1]
+
+    def names(self, start=0, stop=None):
+        """File names of the view between two positions, in display order"""
+        stop = len(self._view) if stop is None else min(stop, len(self._view))
+        return [self.name_at(position) for position in range(start, stop)]
+
+    def set_sort(self, field, descending=False):
+        if field not in SORT_FIELDS:
+            raise ValueError(f"Unknown sort field {field!r}, expected one of: {', '.join(SORT_FIELDS)}")
+        if field != self.sort_field:
+            self.sort_field = field
+            self.rebuild_view()
+        self.descending = descending
+
+    def set_filter(self, spec):
+        """
+        Apply a filter: 'valid', 'expired', 'all' (any status), 'prefix=PATH',
+        'days<N' (less than N days left), 'days>N' (more than N days left) or
+        'clear' (no filter). Several can be given, separated by spaces.
+        """
+        for term in spec.split():
+            if term == 'clear':
+                self.status, self.prefix, self.max_days, self.min_days = None, '', None, None
+            elif term in ('valid', 'expired'):
+                self.status = term.upper()
+            elif term == 'all':
+                self.status = None
+            elif term.startswith('prefix='):
+                self.prefix = term[len('prefix='):]
+            elif re.fullmatch(r'days<\d+', term):
+                self.max_days = int(term[5:]) - 1
+            elif re.fullmatch(r'days>\d+', term):
+                self.min_days = int(term[5:]) + 1
+            else:
+                raise ValueError(f"Unknown filter {term!r}")
+        self.rebuild_view()
+
+    def describe(self):
+        """One line summary of the view"""
+        parts = [f"{len(self._view)} of {len(self.entries)} records"]
+        if self.status:
+            parts.append(f"status: {self.status.lower()}")
+        if self.prefix:
+            parts.append(f"prefix: {self.prefix}")
+        if self.max_days is not None:
+            parts.append(f"days < {self.max_days + 1}")
+        if self.min_days is not None:
+            parts.append(f"days > {self.min_days - 1}")
+        parts.append(f"sort: {self.sort_field}{' (descending)' if self.descending else ''}")
+        return ' | '.join(parts)
+
+    def select(self, spec, page_start=0, page_size=None):
+        """
+        File names selected by a comma separated list of view numbers (1-based)
+        and ranges ('1-20,25'), glob patterns on the file name ('*.pdf',
+        'folder1/*'), 'page' for the current page or 'all' for the whole view
+        """
+        selected = {}
+        for term in (term.strip() for term in spec.split(',')):
+            if not term:
+                continue
+            if term == 'all':
+                selected.update(dict.fromkeys(self.names()))
+            elif term == 'page':
+                selected.update(dict.fromkeys(self.names(page_start, page_start + (page_size or get_page_size()))))
+            elif re.fullmatch(r'\d+(\s*-\s*\d+)?', term):
+                first, _, last = term.partition('-')
+                first = int(first)
+                last = int(last) if last else first
+                if not 1 <= first <= last <= len(self._view):
+                    raise ValueError(f"{term} is outside 1-{len(self._view)}")
+                selected.update(dict.fromkeys(self.names(first - 1, last)))
+            else:
+                selected.update(dict.fromkeys(name for name in self.names() if fnmatchcase(name, term)))
+        return list(selected)
+
+    def expired(self):
+        """Names of all expired records, whatever the filter"""
+        now = datetime.now()
+        return [filename for filename, entry in self.entries.items() if get_url_status(entry[0], now)[0] == "EXPIRED"]
+
+    def remove(self, filenames):
+        """Drop records from the index and the view after they were deleted from the store"""
+        for filename in filenames:
+            entry = self.entries.pop(filename, None)
+            if entry is None:
+                continue
+            key = self._key(filename, entry)
+            position = bisect_left(self._view, key)
+            if position < len(self._view) and self._view[position] == key:
+                del self._view[position]
+
+    def delete(self, filenames):
+        """Delete records from the store and the index. Returns the number deleted."""
+        filenames = list(filenames)
+        deleted = self.store.delete(filenames)
+        self.remove(filenames)
+        # Our own write is already reflected; only later changes by others should trigger a reload
+        self._version = self.store.version()
+        return deleted
+
+def page_count(index, page_size):
+    return max(1, -(-len(index) // page_size))
+
+def display_page(index, page, page_size):
+    """Display one page of the index view"""
+    start = page * page_size
+
+    print(f"\nStored URLs ({index.describe()})")
     print("-" * 100)
-    print(f"{'Index':<6} {'Status':<8} {'Days Left':<10} {'Filename':<30} {'Previous URLs':<10}")
+    print(f"{'Index':<8} {'Status':<8} {'Days Left':<10} {'Filename':<50} {'Previous URLs':<10}")
     print("-" * 100)
-
-    for idx, (filename, record) in enumerate(records.items(), 1):
-        status, days_left = get_url_status(record['expiration'])
+    if not len(index):
+        print("No URLs match." if index.entries else "No URLs found in the records.")
+    for position, filename in enumerate(index.names(start, start + page_size), start + 1):
+        expiration, _, history_count = index.entries[filename]
+        status, days_left = get_url_status(expiration)
         status_color = '\033[92m' if status == "VALID" else '\033[91m'  # Green for valid, Red for expired
-        history_count = len(record.get('history', []))
-        print(f"{idx:<6} {status_color}{status}\033[0m{'':<2} {days_left:<10} {filename:<30} {history_count} previous")
-    
-    return True
-
-def show_url_history(records, filename):
-    """Display history of URLs for a specific file"""
-    if filename not in records:
-        print(f"\nNo record found for {filename}")
-        return
+        print(f"{position:<8} {status_color}{status:<8}\033[0m {days_left:<10} {filename:<50} {history_count} previous")
+    print("-" * 100)
+    print(f"Page {page + 1}/{page_count(index, page_size)}")
 
-    record = records[filename]
+def show_url_history(record, filename):
+    """Display the current and previous URLs of a record"""
     history = record.get('history', [])
-    
+
     print(f"\nURL History for {filename}:")
     print("-" * 80)
     print("Current URL:")
@@ -65,7 +233,7 @@ def show_url_history(records, filename):
     print(f"Status: {status} (Days left: {days_left})")
     print(f"Created: {record['created_at']}")
     print(f"URL: {record['url']}")
-    
+
     if history:
         print("\nPrevious URLs:")
         for i, old_url in enumerate(reversed(history), 1):
@@ -76,148 +244,109 @@ def show_url_history(records, filename):
     else:
         print("\nNo previous URLs")
 
-def show_active_url(records, filename):
-    """Display active URL information for a specific file"""
-    if filename not in records:
+def show_record(store, filename):
+    """Display a record read from the store and offer to copy its URL"""
+    record = store.get(filename)
+    if record is None:
         print(f"\nNo record found for {filename}")
         return
 
-    record = records[filename]
-    status, days_left = get_url_status(record['expiration'])
-    
-    print(f"\nActive URL for {filename}:")
-    print("-" * 80)
-    print(f"Status: {status} (Days left: {days_left})")
-    print(f"Created: {record['created_at']}")
-    print(f"URL: {record['url']}")
-    
+    show_url_history(record, filename)
+
     # Add option to copy URL to clipboard
-    copy_choice = input("\nWould you like to copy the URL to clipboard? (y/n): ").lower()
+    copy_choice = input("\nWould you like to copy the current URL to clipboard? (y/n): ").lower()
     if copy_choice == 'y':
+        import pyperclip
         pyperclip.copy(record['url'])
         print("URL copied to clipboard!")
 
-def delete_urls(records):
-    """Interactive URL deletion"""
-    while True:
-        os.system('clear' if os.name == 'posix' else 'cls')
-        
-        if not display_urls(records):
-            return records
-
-        print("\nOptions:")
-        print("1. Delete specific URL(s)")
-        print("2. Delete all expired URLs")
-        print("3. Delete all URLs")
-        print("4. Show URL history")
-        print("5. Back to main menu")
-
-        choice = input("\nEnter your choice (1-5): ").strip()
-
-        if choice == '1':
-            indices = input("\nEnter URL numbers to delete (comma-separated, e.g., 1,3,4): ").strip()
-            try:
-                # Convert input to list of integers
-                to_delete = [int(i.strip()) for i in indices.split(',')]
-                # Get list of filenames
-                filenames = list(records.keys())
-                # Delete selected URLs
-                for idx in sorted(to_delete, reverse=True):
-                    if 1 <= idx <= len(filenames):
-                        filename = filenames[idx-1]
-                        del records[filename]
-                        print(f"\nDeleted URL for: {filename}")
-                input("\nPress Enter to continue...")
-            except ValueError:
-                print("\nInvalid input. Please enter numbers separated by commas.")
-                input("Press Enter to continue...")
-
-        elif choice == '2':
-            # Delete expired URLs
-            initial_count = len(records)
-            records = {
-                filename: record
-                for filename, record in records.items()
-                if get_url_status(record['expiration'])[0] == "VALID"
-            }
-            deleted_count = initial_count - len(records)
-            print(f"\nDeleted {deleted_count} expired URL(s)")
-            input("Press Enter to continue...")
-
-        elif choice == '3':
-            confirm = input("\nAre you sure you want to delete ALL URLs? (yes/no): ").lower()
-            if confirm == 'yes':
-                records.clear()
-                print("\nAll URLs have been deleted.")
-            input("Press Enter to continue...")
-
-        elif choice == '4':
-            idx = input("\nEnter URL number to show history: ").strip()
-            try:
-                idx = int(idx)
-                if 1 <= idx <= len(records):
-                    filename = list(records.keys())[idx-1]
-                    show_url_history(records, filename)
-                    input("\nPress Enter to continue...")
-                else:
-                    print("\nInvalid URL number")
-                    input("Press Enter to continue...")
-            except ValueError:
-                print("\nInvalid input. Please enter a number.")
-                input("Press Enter to continue...")
-
-        elif choice == '5':
-            break
-
-        else:
-            print("\nInvalid choice. Please try again.")
-            input("Press Enter to continue...")
-
-    return records
+def confirm_delete(filenames):
+    """Ask before deleting records, listing a few of them"""
+    if not filenames:
+        print("\nNo records selected.")
+        return False
+    print(f"\n{len(filenames)} record(s) selected:")
+    for filename in filenames[:10]:
+        print(f"- {filename}")
+    if len(filenames) > 10:
+        print(f"... and {len(filenames) - 10} more")
+    return input("\nDelete them? (yes/no): ").lower() == 'yes'
+
+HELP = """Commands:
+  n / p              Next / previous page         g N          Go to page N
+  s FIELD [desc]     Sort by name, expiration, created or history
+  f FILTER           valid, expired, all, prefix=PATH, days<N, days>N, clear
+  v N                View URL N with its history (copy to clipboard)
+  d SELECTION        Delete: numbers and ranges (1-20,25), patterns (*.pdf), page, all
+  x                  Delete all expired URLs
+  r                  Reload from the store          q            Quit"""
 
 def main():
-    records_file = 'signed_urls.json'
-    
+    load_dotenv()
+    records_file = default_records_file()
+    if not os.path.exists(records_file):
+        print("No URL records found")
+        return
+
+    store = open_record_store(records_file)
+    index = RecordIndex(store)
+    page_size = get_page_size()
+    page = 0
+    message = ''
+
     while True:
         os.system('clear' if os.name == 'posix' else 'cls')
-        
-        records = load_url_records(records_file)
-        
-        print("\nURL Management Tool")
-        print("=" * 20)
-        print("1. Manage/Delete URLs")
-        print("2. View Active URL")
-        print("3. Exit")
-
-        choice = input("\nEnter your choice (1-3): ").strip()
-
-        if choice == '1':
-            updated_records = delete_urls(records)
-            save_url_records(updated_records, records_file)
-
-        elif choice == '2':
-            if display_urls(records):
-                idx = input("\nEnter URL number to show active URL: ").strip()
-                try:
-                    idx = int(idx)
-                    if 1 <= idx <= len(records):
-                        filename = list(records.keys())[idx-1]
-                        show_active_url(records, filename)
-                        input("\nPress Enter to continue...")
-                    else:
-                        print("\nInvalid URL number")
-                        input("Press Enter to continue...")
-                except ValueError:
-                    print("\nInvalid input. Please enter a number.")
-                    input("Press Enter to continue...")
-
-        elif choice == '3':
-            print("\nGoodbye!")
-            break
-
-        else:
-            print("\nInvalid choice. Please try again.")
-            input("Press Enter to continue...")
+        if index.refresh():
+            message = message or 'The records changed on disk and were reloaded.'
+
+        pages = page_count(index, page_size)
+        page = min(page, pages - 1)
+        display_page(index, page, page_size)
+        print(HELP)
+        if message:
+            print(f"\n{message}")
+            message = ''
+
+        command, _, argument = input("\n> ").strip().partition(' ')
+        argument = argument.strip()
+        try:
+            if command in ('n', ''):
+                page = min(page + 1, pages - 1)
+            elif command == 'p':
+                page = max(page - 1, 0)
+            elif command == 'g':
+                page = min(max(int(argument) - 1, 0), pages - 1)
+            elif command == 's':
+                field, _, order = argument.partition(' ')
+                index.set_sort(field or 'name', order.strip() == 'desc')
+                page = 0
+            elif command == 'f':
+                index.set_filter(argument or 'clear')
+                page = 0
+            elif command == 'v':
+                number = int(argument)
+                if not 1 <= number <= len(index):
+                    raise ValueError(f"{number} is outside 1-{len(index)}")
+                show_record(store, index.name_at(number - 1))
+                input("\nPress Enter to continue...")
+            elif command == 'd':
+                filenames = index.select(argument, page * page_size, page_size)
+                if confirm_delete(filenames):
+                    message = f"Deleted {index.delete(filenames)} URL(s)"
+            elif command == 'x':
+                filenames = index.expired()
+                if confirm_delete(filenames):
+                    message = f"Deleted {index.delete(filenames)} expired URL(s)"
+            elif command == 'r':
+                index.reload()
+                message = 'Reloaded.'
+            elif command == 'q':
+                print("\nGoodbye!")
+                break
+            else:
+                message = f"Unknown command {command!r}"
+        except ValueError as e:
+            message = f"Invalid input: {e}"
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+from contextlib import contextmanager
+
+# Histogram bucket bounds in seconds (the Prometheus defaults, extended for long uploads)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_metrics_file():
+    """File the metrics are written to when the process exits (GCS_METRICS_FILE)"""
+    return os.getenv('GCS_METRICS_FILE')
+
+def get_metrics_endpoint():
+    """URL the metrics are POSTed to when the process exits (GCS_METRICS_ENDPOINT)"""
+    return os.getenv('GCS_METRICS_ENDPOINT')
+
+def get_metrics_format(target=None):
+    """'prometheus' or 'otlp' (GCS_METRICS_FORMAT), else guessed from the file or endpoint"""
+    metrics_format = os.getenv('GCS_METRICS_FORMAT', '').lower()
+    if metrics_format in ('prometheus', 'otlp'):
+        return metrics_format
+    if target and (target.endswith('.json') or '/v1/metrics' in target):
+        return 'otlp'
+    return 'prometheus'
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+def _escape(value):
+    """Escape a label value for the Prometheus text format"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class MetricsRegistry:
+    """
+    Process-wide counters and duration histograms. Recording is a dict update
+    under a lock, cheap enough for the upload and signing hot paths.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+
+    def increment(self, name, value=1, help=None, **labels):
+        """Add value to the counter name{labels}"""
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+            if help:
+                self._help.setdefault(name, help)
+
+    def observe(self, name, seconds, help=None, **labels):
+        """Record a duration in the histogram name{labels}"""
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {'count': 0, 'sum': 0.0, 'buckets': [0] * len(DURATION_BUCKETS)}
+                if help:
+                    self._help.setdefault(name, help)
+            histogram['count'] += 1
+            histogram['sum'] += seconds
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if seconds <= bound:
+                    histogram['buckets'][index] += 1
+                    break
+
+    @contextmanager
+    def span(self, phase, **labels):
+        """Time the enclosed block as one phase of gcs_phase_duration_seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('gcs_phase_duration_seconds', time.perf_counter() - start,
+                         help='Duration of each phase of the upload and signing operations', phase=phase, **labels)
+
+    def snapshot(self):
+        """Copy of (counters, histograms) as {(name, labels): value} dicts"""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: {'count': value['count'], 'sum': value['sum'], 'buckets': list(value['buckets'])}
+                          for key, value in self._histograms.items()}
+        return counters, histograms
+
+    def _throughput(self, counters, histograms):
+        """Bytes per second of upload time, derived from the byte counter and the upload phase"""
+        uploaded = sum(value for (name, _), value in counters.items() if name == 'gcs_upload_bytes_total')
+        seconds = sum(value['sum'] for (name, labels), value in histograms.items()
+                      if name == 'gcs_phase_duration_seconds' and ('phase', 'upload') in labels)
+        return uploaded / seconds if seconds > 0 else 0.0
+
+    def to_prometheus(self):
+        """Metrics in the Prometheus text exposition format"""
+        counters, histograms = self.snapshot()
+
+        def format_labels(labels):
+            if not labels:
+                return ''
+            pairs = (f'{name}="{_escape(value)}"' for name, value in labels)
+            return '{' + ','.join(pairs) + '}'
+
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# HELP {name} {self._help.get(name, name)}")
+            lines.append(f"# TYPE {name} counter")
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+        for name in sorted({name for name, _ in histograms}):
+            lines.append(f"# HELP {name} {self._help.get(name, name)}")
+            lines.append(f"# TYPE {name} histogram")
+            for (metric, labels), value in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(DURATION_BUCKETS, value['buckets']):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{format_labels(labels + (('le', str(bound)),))} {cumulative}")
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', '+Inf'),))} {value['count']}")
+                lines.append(f"{name}_sum{format_labels(labels)} {value['sum']}")
+                lines.append(f"{name}_count{format_labels(labels)} {value['count']}")
+        lines.append("# HELP gcs_upload_throughput_bytes_per_second Uploaded bytes per second of upload time")
+        lines.append("# TYPE gcs_upload_throughput_bytes_per_second gauge")
+        lines.append(f"gcs_upload_throughput_bytes_per_second {self._throughput(counters, histograms)}")
+        return '\n'.join(lines) + '\n'
+
+    def to_otlp(self):
+        """Metrics as an OpenTelemetry (OTLP/HTTP JSON) ExportMetricsServiceRequest"""
+        counters, histograms = self.snapshot()
+        start_ns = str(int(self.started * 1e9))
+        now_ns = str(time.time_ns())
+
+        def attributes(labels):
+            return [{'key': name, 'value': {'stringValue': str(value)}} for name, value in labels]
+
+        metrics = []
+        for name in sorted({name for name, _ in counters}):
+            metrics.append({
+                'name': name,
+                'description': self._help.get(name, ''),
+                'sum': {
+                    'aggregationTemporality': 2,  # cumulative
+                    'isMonotonic': True,
+                    'dataPoints': [
+                        {'attributes': attributes(labels), 'startTimeUnixNano': start_ns,
+                         'timeUnixNano': now_ns, 'asDouble': float(value)}
+                        for (metric, labels), value in sorted(counters.items()) if metric == name
+                    ],
+                },
+            })
+        for name in sorted({name for name, _ in histograms}):
+            metrics.append({
+                'name': name,
+                'description': self._help.get(name, ''),
+                'unit': 's',
+                'histogram': {
+                    'aggregationTemporality': 2,
+                    'dataPoints': [
+                        {'attributes': attributes(labels), 'startTimeUnixNano': start_ns, 'timeUnixNano': now_ns,
+                         'count': str(value['count']), 'sum': value['sum'],
+                         'bucketCounts': [str(count) for count in value['buckets']]
+                                         + [str(value['count'] - sum(value['buckets']))],
+                         'explicitBounds': list(DURATION_BUCKETS)}
+                        for (metric, labels), value in sorted(histograms.items()) if metric == name
+                    ],
+                },
+            })
+        metrics.append({
+            'name': 'gcs_upload_throughput_bytes_per_second',
+            'description': 'Uploaded bytes per second of upload time',
+            'unit': 'By/s',
+            'gauge': {'dataPoints': [{'timeUnixNano': now_ns, 'asDouble': self._throughput(counters, histograms)}]},
+        })
+        return {
+            'resourceMetrics': [{
+                'resource': {'attributes': attributes([
+                    ('service.name', 'gcs_upload_and_sign'),
+                    ('process.command', os.path.basename(sys.argv[0]) if sys.argv and sys.argv[0] else 'python'),
+                    ('process.pid', os.getpid()),
+                ])},
+                'scopeMetrics': [{'scope': {'name': 'gcs_upload_and_sign'}, 'metrics': metrics}],
+            }]
+        }
+
+    def render(self, metrics_format):
+        if metrics_format == 'otlp':
+            return json.dumps(self.to_otlp()), 'application/json'
+        return self.to_prometheus(), 'text/plain; version=0.0.4'
+
+def get_registry():
+    """Return the process-wide registry; metrics are exported at exit when a sink is configured"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = MetricsRegistry()
+                if get_metrics_file() or get_metrics_endpoint():
+                    atexit.register(export_metrics)
+    return _registry
+
+def span(phase, **labels):
+    return get_registry().span(phase, **labels)
+
+def increment(name, value=1, help=None, **labels):
+    get_registry().increment(name, value, help, **labels)
+
+def export_metrics():
+    """Write the metrics to GCS_METRICS_FILE and POST them to GCS_METRICS_ENDPOINT"""
+    registry = get_registry()
+    metrics_file = get_metrics_file()
+    if metrics_file:
+        body, _ = registry.render(get_metrics_format(metrics_file))
+        from url_store import file_lock
+        # Several processes may share the file; the last run wins, whole
+        with file_lock(f"{metrics_file}.lock"):
+            with open(f"{metrics_file}.tmp", 'w') as f:
+                f.write(body)
+            os.replace(f"{metrics_file}.tmp", metrics_file)
+    endpoint = get_metrics_endpoint()
+    if endpoint:
+        import urllib.request
+        body, content_type = registry.render(get_metrics_format(endpoint))
+        request = urllib.request.Request(endpoint, data=body.encode('utf-8'), method='POST',
+                                         headers={'Content-Type': content_type})
+        try:
+            with urllib.request.urlopen(request, timeout=10) as response:
+                response.read()
+        except OSError as e:
+            print(f"Warning: Could not export metrics to {endpoint}: {e}", file=sys.stderr)
+
+@contextmanager
+def profile_run():
+    """
+    Profile the enclosed block with cProfile when GCS_PROFILE names an output file.
+    '{pid}' in the name is replaced by the process id; a .txt file gets the 40 most
+    expensive functions by cumulative time, any other name the raw pstats data.
+    """
+    # Commands load .env inside main(), which runs within this block: GCS_PROFILE may only be set there
+    from dotenv import load_dotenv
+    load_dotenv()
+    profile_path = os.getenv('GCS_PROFILE')
+    if not profile_path:
+        yield
+        return
+    import cProfile
+    import pstats
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profile_path = profile_path.replace('{pid}', str(os.getpid()))
+        if profile_path.endswith('.txt'):
+            with open(profile_path, 'w') as f:
+                pstats.Stats(profiler, stream=f).sort_stats('cumulative').print_stats(40)
+        else:
+            profiler.dump_stats(profile_path)
+        print(f"Profile written to {profile_path}", file=sys.stderr)
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import time
+import argparse
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from gcs_config import load_config
+from url_signer import get_url_signer, URL_LIFETIME
+from url_store import open_record_store, default_records_file, file_lock
+from metrics import profile_run
+
+def get_renew_window():
+    """Records expiring within this many hours are renewed (GCS_RENEW_WITHIN_HOURS)"""
+    return float(os.getenv('GCS_RENEW_WITHIN_HOURS', '24'))
+
+def renew_urls(bucket_name, credentials_path, within_hours=None, records_file=None,
+               batch_size=1000, max_workers=None):
+    """
+    Re-sign every record expiring within the given number of hours, expired ones included
+    Args:
+        bucket_name: Name of the GCS bucket the records point to
+        credentials_path: Path to the service account key used for signing
+        within_hours: Renewal window in hours (GCS_RENEW_WITHIN_HOURS by default)
+        records_file: Record store to renew (SIGNED_URLS_FILE by default)
+        batch_size: Number of records signed and committed together
+        max_workers: Number of threads signing each batch (one per CPU by default)
+    Returns:
+        Number of renewed records
+    """
+    if within_hours is None:
+        within_hours = get_renew_window()
+    store = open_record_store(records_file)
+    signer = get_url_signer(credentials_path)
+    max_workers = max_workers or os.cpu_count() or 1
+
+    # Candidates come from the expiration index, soonest expiring first
+    due = store.expiring_names_before(datetime.now() + timedelta(hours=within_hours))
+    renewed = 0
+    for start in range(0, len(due), batch_size):
+        batch = due[start:start + batch_size]
+        expiration_date = datetime.now() + URL_LIFETIME
+        urls = signer.sign_many(bucket_name, batch, URL_LIFETIME, max_workers=max_workers)
+        # save_many moves each current URL to the history, like save_url_record()
+        renewed += store.save_many(list(zip(batch, urls, [expiration_date] * len(batch))))
+    return renewed
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description='Re-sign stored URLs that are expiring or already expired')
+    parser.add_argument('--hours', type=float, default=None,
+                        help='Renew records expiring within this many hours (default: GCS_RENEW_WITHIN_HOURS or 24)')
+    parser.add_argument('--batch-size', type=int, default=1000, help='Records signed and committed together')
+    parser.add_argument('--workers', type=int, default=None, help='Signing threads (default: one per CPU)')
+    args = parser.parse_args()
+
+    bucket_name, credentials_path = load_config()
+    records_file = default_records_file()
+
+    # Overlapping cron runs would only repeat the same work, so a second run exits at once
+    try:
+        with file_lock(f"{records_file}.renew.lock", blocking=False):
+            start = time.monotonic()
+            renewed = renew_urls(bucket_name, credentials_path, args.hours, records_file,
+                                 args.batch_size, args.workers)
+            print(f"Renewed {renewed} URLs in {time.monotonic() - start:.1f}s")
+    except BlockingIOError:
+        print("Another renewal is already running")
+
+if __name__ == "__main__":
+    with profile_run():
+        main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+import os
+import json
+import mimetypes
+import http.client
+from datetime import datetime
+from google.resumable_media import common
+from google.resumable_media.requests import ResumableUpload
+from url_store import file_lock, atomic_write_json
+from hash_cache import get_hash_cache
+from metrics import increment
+
+# GCS requires resumable chunks to be a multiple of 256 KiB
+CHUNK_ALIGNMENT = 256 * 1024
+
+def get_chunk_size(chunk_size=None):
+    """Chunk size in bytes (GCS_UPLOAD_CHUNK_SIZE, 8 MiB by default) rounded up to 256 KiB"""
+    if chunk_size is None:
+        chunk_size = int(os.getenv('GCS_UPLOAD_CHUNK_SIZE', str(8 * 1024 * 1024)))
+    chunk_size = max(CHUNK_ALIGNMENT, int(chunk_size))
+    return -(-chunk_size // CHUNK_ALIGNMENT) * CHUNK_ALIGNMENT
+
+def get_resumable_threshold():
+    """Files larger than this many bytes use a chunked resumable upload"""
+    return int(os.getenv('GCS_RESUMABLE_THRESHOLD', str(8 * 1024 * 1024)))
+
+class UploadSessions:
+    """
+    Resumable session URLs of unfinished uploads, kept in a small JSON file so an
+    interrupted upload restarts from the last committed chunk instead of from zero.
+    A session is only reused for the same source file, size and modification time.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv('GCS_UPLOAD_SESSIONS_FILE', '.gcs_upload_sessions.json')
+        self.lock_path = f"{self.path}.lock"
+
+    def _load(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def get(self, key, file_path):
+        with file_lock(self.lock_path, shared=True):
+            session = self._load().get(key)
+        if session is None:
+            return None
+        stat = os.stat(file_path)
+        if (session['source'] != os.path.abspath(file_path) or session['size'] != stat.st_size
+                or session['mtime_ns'] != stat.st_mtime_ns):
+            return None
+        return session['session_url']
+
+    def put(self, key, file_path, session_url):
+        stat = os.stat(file_path)
+        with file_lock(self.lock_path):
+            sessions = self._load()
+            sessions[key] = {
+                'session_url': session_url,
+                'source': os.path.abspath(file_path),
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'created_at': datetime.now().isoformat()
+            }
+            atomic_write_json(self.path, sessions)
+
+    def remove(self, key):
+        with file_lock(self.lock_path):
+            sessions = self._load()
+            if sessions.pop(key, None) is not None:
+                atomic_write_json(self.path, sessions)
+
+def open_session_upload(session_url, stream, chunk_size, content_type, total_bytes=None, checksum='crc32c'):
+    """
+    ResumableUpload sending a stream to a session created beforehand with
+    blob.create_resumable_upload_session, which carries the blob metadata and
+    can be stored to resume later. google-resumable-media only attaches a stream
+    to a session in initiate(), so the attributes it sets are set here (the way
+    the library's own examples do), and nowhere else.
+    Args:
+        session_url: Resumable session URL
+        stream: Readable stream positioned at its start
+        chunk_size: Bytes per request, a multiple of 256 KiB
+        content_type: Content type of the object
+        total_bytes: Size of the stream, or None if unknown until it ends
+        checksum: 'crc32c', 'md5' or None; checked against the object when the upload completes
+    """
+    upload = ResumableUpload(session_url, chunk_size, checksum=checksum)
+    upload._resumable_url = session_url
+    upload._stream = stream
+    upload._total_bytes = total_bytes
+    upload._content_type = content_type
+    return upload
+
+def _recover(upload, transport):
+    """
+    Ask GCS how many bytes of the session it already has and seek the stream there.
+    Returns the final response if the session turns out to be complete already.
+    """
+    upload._invalid = True
+    try:
+        upload.recover(transport)
+    except common.InvalidResponse as e:
+        status = e.response.status_code
+        if status in (http.client.OK, http.client.CREATED):
+            upload._finished = True
+            return e.response
+        raise
+    return None
+
+def resumable_upload(blob, file_path, chunk_size=None, progress=None, timeout=120, sessions=None):
+    """
+    Stream a file to a blob in chunks through a resumable session. The content
+    type is guessed from the file name when the blob has none, and the upload
+    is checked with CRC32C: as it completes for a new session, or against the
+    digest of the whole file when an interrupted session was resumed (the bytes
+    sent before the interruption were never summed by this process).
+    Args:
+        blob: Destination blob (its content type and metadata are sent with the session)
+        file_path: Local file to upload, read one chunk at a time
+        chunk_size: Bytes per request, rounded up to a multiple of 256 KiB
+        progress: Optional callable receiving the number of bytes sent by each chunk
+        timeout: Timeout in seconds of each chunk request
+        sessions: UploadSessions used to resume interrupted uploads
+    """
+    chunk_size = get_chunk_size(chunk_size)
+    sessions = sessions or UploadSessions()
+    transport = blob.bucket.client._http
+    total_bytes = os.path.getsize(file_path)
+    key = f"{blob.bucket.name}/{blob.name}"
+    blob.content_type = blob.content_type or mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+
+    session_url = sessions.get(key, file_path)
+    resumed = session_url is not None
+
+    with open(file_path, 'rb') as stream:
+        while True:
+            if session_url is None:
+                session_url = blob.create_resumable_upload_session(
+                    content_type=blob.content_type, size=total_bytes, timeout=timeout)
+                sessions.put(key, file_path, session_url)
+
+            upload = open_session_upload(session_url, stream, chunk_size, blob.content_type, total_bytes,
+                                         checksum=None if resumed else 'crc32c')
+
+            if not resumed:
+                response = None
+                break
+            try:
+                response = _recover(upload, transport)
+                increment('gcs_retries_total', help='Operations resumed or retried', operation='resume_upload')
+                break
+            except common.InvalidResponse as e:
+                # The session expired or was cancelled: start a new one
+                if not resumed or e.response.status_code not in (http.client.NOT_FOUND, http.client.GONE):
+                    raise
+                sessions.remove(key)
+                session_url = None
+                resumed = False
+
+        if progress and upload.bytes_uploaded:
+            progress(upload.bytes_uploaded)
+
+        while not upload.finished:
+            before = upload.bytes_uploaded
+            response = upload.transmit_next_chunk(transport, timeout=timeout)
+            if progress:
+                progress(upload.bytes_uploaded - before)
+
+    sessions.remove(key)
+    blob._set_properties(response.json())
+    if resumed:
+        _, crc32c = get_hash_cache().get_digests(file_path)
+        if blob.crc32c != crc32c:
+            raise common.DataCorruption(
+                response, f"CRC32C of {blob.name} is {blob.crc32c}, expected {crc32c} from {file_path}")
+    return blob
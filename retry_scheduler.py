@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import heapq
+import random
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+from metrics import increment
+
+# HTTP statuses worth retrying; 429 and 503 also mean the service wants fewer requests
+RETRYABLE_STATUSES = frozenset((408, 429, 500, 502, 503, 504))
+THROTTLE_STATUSES = frozenset((429, 503))
+
+_DONE = object()
+
+def get_max_attempts():
+    """Attempts per item before it is recorded as failed (GCS_RETRY_ATTEMPTS)"""
+    return max(1, int(os.getenv('GCS_RETRY_ATTEMPTS', '6')))
+
+def get_base_delay():
+    """Backoff before the first retry in seconds, doubled at each attempt (GCS_RETRY_BASE_DELAY)"""
+    return float(os.getenv('GCS_RETRY_BASE_DELAY', '1'))
+
+def get_max_delay():
+    """Upper bound of the backoff in seconds (GCS_RETRY_MAX_DELAY)"""
+    return float(os.getenv('GCS_RETRY_MAX_DELAY', '60'))
+
+def get_failed_items_file():
+    """File listing the items of the last bulk run that failed (GCS_FAILED_ITEMS_FILE)"""
+    return os.getenv('GCS_FAILED_ITEMS_FILE', 'failed_items.ndjson')
+
+def http_status(error):
+    """HTTP status of an error raised by the storage client, resumable media or requests, else None"""
+    code = getattr(error, 'code', None)
+    if isinstance(code, int):
+        return code
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None) or getattr(response, 'status', None)
+    return status if isinstance(status, int) else None
+
+def is_throttled(error):
+    """True for rate limiting (429) and overload (503) responses"""
+    return http_status(error) in THROTTLE_STATUSES
+
+def is_retryable(error):
+    """True for transient errors: throttling, server errors, timeouts and dropped connections"""
+    status = http_status(error)
+    if status is not None:
+        return status in RETRYABLE_STATUSES
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    # Only checked when the caller already imported them
+    requests = sys.modules.get('requests')
+    if requests is not None and isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    aiohttp = sys.modules.get('aiohttp')
+    return aiohttp is not None and isinstance(error, aiohttp.ClientConnectionError)
+
+def retry_after(error):
+    """Seconds asked for by a Retry-After header of the error's response, else None"""
+    headers = getattr(getattr(error, 'response', None), 'headers', None) or {}
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+def backoff_delay(attempt, error=None, base_delay=None, max_delay=None):
+    """
+    Seconds to wait before retrying after the given failed attempt (1 for the
+    first): a random duration up to base_delay * 2 ** (attempt - 1), so clients
+    throttled at the same moment do not retry at the same moment. A Retry-After
+    header of the response is honoured as the minimum.
+    """
+    base_delay = get_base_delay() if base_delay is None else base_delay
+    max_delay = get_max_delay() if max_delay is None else max_delay
+    delay = random.uniform(0, min(max_delay, base_delay * 2 ** (attempt - 1)))
+    requested = retry_after(error) if error is not None else None
+    return max(delay, min(requested, max_delay)) if requested is not None else delay
+
+def call_with_retry(function, *args, operation='call', max_attempts=None, **kwargs):
+    """Call function, retrying transient errors with jittered exponential backoff"""
+    max_attempts = max_attempts or get_max_attempts()
+    for attempt in itertools.count(1):
+        try:
+            return function(*args, **kwargs)
+        except Exception as e:
+            if attempt >= max_attempts or not is_retryable(e):
+                raise
+            increment('gcs_retries_total', help='Operations resumed or retried', operation=operation,
+                      reason='throttled' if is_throttled(e) else 'error')
+            time.sleep(backoff_delay(attempt, e))
+
+class AdaptiveScheduler:
+    """
+    Runs a function over many items in a thread pool, retrying each failed item
+    with jittered exponential backoff. The number of calls in flight adapts to
+    the service (AIMD): it grows by one per window of successful calls and is
+    halved when a call is throttled, at most once per backoff period so that a
+    burst of 429s from the calls already in flight counts once.
+
+        scheduler = AdaptiveScheduler(max_workers=16, operation='upload')
+        for item, result, error in scheduler.run(upload, items):
+            ...
+    """
+
+    def __init__(self, max_workers, min_workers=1, max_attempts=None, base_delay=None, max_delay=None,
+                 operation='call'):
+        self.max_workers = max(1, max_workers)
+        self.min_workers = max(1, min(min_workers, self.max_workers))
+        self.max_attempts = max_attempts or get_max_attempts()
+        self.base_delay = get_base_delay() if base_delay is None else base_delay
+        self.max_delay = get_max_delay() if max_delay is None else max_delay
+        self.operation = operation
+        self.limit = float(self.max_workers)
+        self.throttled = 0
+        self.retried = 0
+        self._last_decrease = float('-inf')
+        self._lock = threading.Lock()
+
+    @property
+    def concurrency(self):
+        """Number of calls currently allowed in flight"""
+        return int(self.limit)
+
+    def _on_success(self):
+        with self._lock:
+            self.limit = min(self.max_workers, self.limit + 1 / self.limit)
+
+    def _on_throttled(self):
+        now = time.monotonic()
+        with self._lock:
+            self.throttled += 1
+            if now - self._last_decrease >= self.base_delay:
+                self.limit = max(self.min_workers, self.limit / 2)
+                self._last_decrease = now
+        increment('gcs_throttled_total', help='Requests rejected with 429 or 503', operation=self.operation)
+
+    def run(self, function, items):
+        """
+        Yield (item, result, error) once per item: error is None on success, or
+        the last exception once the item is not retryable or out of attempts
+        """
+        items = iter(items)
+        exhausted = False
+        retries = []  # (ready_at, sequence, item, next attempt)
+        sequence = itertools.count()
+        pending = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                now = time.monotonic()
+                # Due retries go first, then new items, up to the current limit
+                while len(pending) < self.concurrency:
+                    if retries and retries[0][0] <= now:
+                        _, _, item, attempt = heapq.heappop(retries)
+                    elif not exhausted:
+                        item = next(items, _DONE)
+                        if item is _DONE:
+                            exhausted = True
+                            continue
+                        attempt = 1
+                    else:
+                        break
+                    pending[executor.submit(function, item)] = (item, attempt)
+
+                if not pending:
+                    if not retries:
+                        return
+                    time.sleep(max(0, retries[0][0] - time.monotonic()))
+                    continue
+
+                timeout = max(0, retries[0][0] - now) if retries else None
+                done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    item, attempt = pending.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        throttled = is_throttled(e)
+                        if throttled:
+                            self._on_throttled()
+                        if attempt < self.max_attempts and (throttled or is_retryable(e)):
+                            self.retried += 1
+                            increment('gcs_retries_total', help='Operations resumed or retried',
+                                      operation=self.operation, reason='throttled' if throttled else 'error')
+                            delay = backoff_delay(attempt, e, self.base_delay, self.max_delay)
+                            heapq.heappush(retries, (time.monotonic() + delay, next(sequence), item, attempt + 1))
+                        else:
+                            yield item, None, e
+                        continue
+                    self._on_success()
+                    yield item, result, None
+
+class FailedItems:
+    """
+    NDJSON file of the items a bulk run gave up on, one {"item", "error",
+    "status", "failed_at"} object per line. Failures are written to a temporary
+    file that replaces the previous list when the run ends, so an interrupted
+    run keeps the list it was resuming from; a run without failures removes it.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or get_failed_items_file()
+        self.count = 0
+        self._lock = threading.Lock()
+        self._file = open(f"{self.path}.tmp", 'w', encoding='utf-8')
+
+    def add(self, item, error):
+        line = json.dumps({
+            'item': item,
+            'error': str(error),
+            'status': http_status(error),
+            'failed_at': datetime.now().isoformat(timespec='seconds'),
+        }, separators=(',', ':'))
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+            self.count += 1
+
+    def close(self, interrupted=False):
+        self._file.close()
+        if interrupted:
+            os.remove(f"{self.path}.tmp")
+        elif self.count:
+            os.replace(f"{self.path}.tmp", self.path)
+        else:
+            os.remove(f"{self.path}.tmp")
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(interrupted=exc_type is not None)
+
+def load_failed_items(path=None):
+    """Items recorded by the last run in the failed items file, [] when there is none"""
+    path = path or get_failed_items_file()
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return [json.loads(line)['item'] for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from urllib.parse import urlparse, parse_qs
+from dotenv import load_dotenv
+from gcs_config import load_config
+from url_store import open_record_store, default_records_file
+from url_signer import URL_LIFETIME
+from metrics import get_registry
+
+# Signed URLs are valid for 7 days, like the ones created at upload time
+
+def get_server_address():
+    """Listening address: 'host:port' or 'unix:/path/to/socket' (GCS_SIGN_SERVER_ADDRESS)"""
+    return os.getenv('GCS_SIGN_SERVER_ADDRESS', '127.0.0.1:8765')
+
+def get_cache_size():
+    """Maximum number of signed URLs kept in memory (GCS_SIGN_SERVER_CACHE_SIZE)"""
+    return int(os.getenv('GCS_SIGN_SERVER_CACHE_SIZE', '100000'))
+
+def get_upload_root():
+    """Directory /upload may read files from, None disables uploads (GCS_SIGN_SERVER_UPLOAD_ROOT)"""
+    return os.getenv('GCS_SIGN_SERVER_UPLOAD_ROOT') or None
+
+def get_allowed_hosts():
+    """Host header values accepted besides the listening address (GCS_SIGN_SERVER_ALLOWED_HOSTS)"""
+    return [host.strip().lower() for host in os.getenv('GCS_SIGN_SERVER_ALLOWED_HOSTS', '').split(',') if host.strip()]
+
+def get_min_ttl():
+    """Seconds a returned URL must still be valid for; older ones are re-signed (GCS_SIGN_SERVER_MIN_TTL)"""
+    return int(os.getenv('GCS_SIGN_SERVER_MIN_TTL', '3600'))
+
+class URLCache:
+    """
+    Thread-safe LRU cache of signed URLs per blob. Entries stop being returned
+    once they have less than min_ttl seconds of validity left.
+    """
+
+    def __init__(self, max_entries, min_ttl):
+        self.max_entries = max_entries
+        self.min_ttl = timedelta(seconds=min_ttl)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, name, now=None):
+        """Return (url, expiration) if a URL valid long enough is cached, else None"""
+        now = now or datetime.now()
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                return None
+            if entry[1] - now < self.min_ttl:
+                del self._entries[name]
+                return None
+            self._entries.move_to_end(name)
+            return entry
+
+    def put(self, name, url, expiration):
+        with self._lock:
+            self._entries[name] = (url, expiration)
+            self._entries.move_to_end(name)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+class Metrics:
+    """Request counters and latency percentiles over the last samples of each endpoint"""
+
+    def __init__(self, samples=4096):
+        self.started = time.monotonic()
+        self.counters = {}
+        self._latencies = {}
+        self._samples = samples
+        self._lock = threading.Lock()
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, endpoint, seconds):
+        with self._lock:
+            self.counters[f"requests.{endpoint}"] = self.counters.get(f"requests.{endpoint}", 0) + 1
+            self._latencies.setdefault(endpoint, deque(maxlen=self._samples)).append(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            uptime = time.monotonic() - self.started
+            latencies = {}
+            for endpoint, samples in self._latencies.items():
+                ordered = sorted(samples)
+                latencies[endpoint] = {
+                    'p50_ms': ordered[len(ordered) // 2] * 1000,
+                    'p99_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000,
+                    'max_ms': ordered[-1] * 1000,
+                }
+            requests = sum(value for name, value in self.counters.items() if name.startswith('requests.'))
+            return {
+                'uptime_seconds': uptime,
+                'requests_per_second': requests / uptime if uptime > 0 else 0,
+                'counters': dict(self.counters),
+                'latency': latencies,
+            }
+
+class SigningService:
+    """
+    Signing and upload operations shared by all requests: the signer, the bucket
+    client and the record store are created once, and signed URLs are served
+    from the cache, then from the record store, and only then signed anew, for
+    objects that exist in the bucket. Uploads only read files below upload_root.
+    """
+
+    def __init__(self, bucket_name, credentials_path, records_file=None, cache_size=None, min_ttl=None,
+                 upload_root=None):
+        from url_signer import get_url_signer
+        self.bucket_name = bucket_name
+        self.credentials_path = credentials_path
+        self.upload_root = os.path.realpath(upload_root) if upload_root else None
+        self.signer = get_url_signer(credentials_path)
+        self.store = open_record_store(records_file)
+        self.cache = URLCache(cache_size or get_cache_size(), get_min_ttl() if min_ttl is None else min_ttl)
+        self.metrics = Metrics()
+
+    def _existing(self, names):
+        """The names that are objects of the bucket"""
+        from concurrent.futures import ThreadPoolExecutor
+        from gcs_client import get_bucket
+        bucket = get_bucket(self.bucket_name, self.credentials_path)
+        with ThreadPoolExecutor(max_workers=min(16, len(names))) as executor:
+            exists = list(executor.map(lambda name: bucket.blob(name).exists(timeout=30), names))
+        return {name for name, found in zip(names, exists) if found}
+
+    def sign(self, names):
+        """
+        Return one {'name', 'url', 'expiration', 'source'} dict per blob name, or
+        {'name', 'error'} for names that are not objects of the bucket
+        """
+        now = datetime.now()
+        results = {}
+        missing = []
+        for name in names:
+            cached = self.cache.get(name, now)
+            if cached is not None:
+                results[name] = (cached, 'cache')
+            else:
+                missing.append(name)
+        self.metrics.increment('cache.hits', len(names) - len(missing))
+
+        if missing:
+            # URLs signed earlier (by uploads, renewals or another instance) are reused
+            for name, record in self.store.get_many(missing).items():
+                expiration = datetime.fromisoformat(record['expiration'])
+                if expiration - now >= self.cache.min_ttl:
+                    self.cache.put(name, record['url'], expiration)
+                    results[name] = ((record['url'], expiration), 'store')
+            to_sign = [name for name in missing if name not in results]
+            self.metrics.increment('store.hits', len(missing) - len(to_sign))
+
+            if to_sign:
+                # Only objects of the bucket are signed and saved, so unknown names do not fill the store
+                existing = self._existing(to_sign)
+                for name in to_sign:
+                    if name not in existing:
+                        results[name] = (None, 'missing')
+                self.metrics.increment('missing', len(to_sign) - len(existing))
+                to_sign = [name for name in to_sign if name in existing]
+
+            if to_sign:
+                expiration = now + URL_LIFETIME
+                urls = self.signer.sign_many(self.bucket_name, to_sign, URL_LIFETIME)
+                self.store.save_many([(name, url, expiration) for name, url in zip(to_sign, urls)])
+                for name, url in zip(to_sign, urls):
+                    self.cache.put(name, url, expiration)
+                    results[name] = ((url, expiration), 'signed')
+                self.metrics.increment('signed', len(to_sign))
+
+        signed = []
+        for name in names:
+            entry, source = results[name]
+            if entry is None:
+                signed.append({'name': name, 'error': f"No such object: {name}"})
+                continue
+            url, expiration = entry
+            signed.append({'name': name, 'url': url, 'expiration': expiration.isoformat(), 'source': source})
+        return signed
+
+    def upload_path(self, path):
+        """
+        Real path of a file to upload, relative paths being taken from upload_root.
+        Raises PermissionError when uploads are disabled or the path leaves upload_root.
+        """
+        if self.upload_root is None:
+            raise PermissionError("Uploads are disabled; set GCS_SIGN_SERVER_UPLOAD_ROOT to enable them")
+        real_path = os.path.realpath(os.path.join(self.upload_root, path))
+        if os.path.commonpath([real_path, self.upload_root]) != self.upload_root:
+            raise PermissionError(f"{path} is outside the upload root")
+        return real_path
+
+    def upload(self, file_path, folder_path=None, force=False):
+        """Upload a local file below upload_root, sign it and cache the new URL"""
+        from gcs_upload_and_sign import upload_and_sign
+        file_path = self.upload_path(file_path)
+        if not os.path.isfile(file_path):
+            raise FileNotFoundError(f"File {file_path} does not exist")
+        signed_url, blob_path = upload_and_sign(file_path, self.bucket_name, self.credentials_path, folder_path,
+                                                skip_unchanged=False if force else None)
+        expiration = datetime.now() + URL_LIFETIME
+        self.cache.put(blob_path, signed_url, expiration)
+        self.metrics.increment('uploads')
+        return {'name': blob_path, 'url': signed_url, 'expiration': expiration.isoformat(), 'source': 'upload'}
+
+class UnsupportedMediaType(Exception):
+    pass
+
+class SignRequestHandler(BaseHTTPRequestHandler):
+    """
+    GET  /sign?name=<blob>[&name=<blob>...]   signed URLs, from the cache when possible
+    POST /sign      {"names": [...]}          the same for many blobs
+    POST /upload    {"path": ..., "folder": ..., "force": false}   a file below the upload root
+    GET  /metrics                             counters and latency percentiles
+    GET  /metrics?format=prometheus|otlp      upload, signing and store metrics of the process
+    GET  /healthz
+
+    POST bodies must be sent as application/json, and over TCP the Host header
+    must name the listening address, so that web pages cannot drive the
+    service from a browser (cross-origin form posts, DNS rebinding).
+    """
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'gcs-sign-server'
+
+    def setup(self):
+        # Headers and body are separate writes; without TCP_NODELAY each response waits for a delayed ACK
+        self.disable_nagle_algorithm = isinstance(self.client_address, tuple)
+        super().setup()
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else 'unix'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, body):
+        data = json.dumps(body, separators=(',', ':')).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_text(self, status, text, content_type):
+        data = text.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_json(self):
+        """JSON object of the request body; ValueError (400) for anything else"""
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length)
+        if self.headers.get_content_type() != 'application/json':
+            # Browsers send text/plain and form bodies cross-origin without a preflight request
+            raise UnsupportedMediaType('Content-Type must be application/json')
+        body = json.loads(body or b'{}')
+        if not isinstance(body, dict):
+            raise ValueError('Request body must be a JSON object')
+        return body
+
+    def _host_allowed(self):
+        allowed_hosts = self.server.allowed_hosts
+        return allowed_hosts is None or (self.headers.get('Host') or '').lower() in allowed_hosts
+
+    def _handle(self, method):
+        service = self.server.service
+        url = urlparse(self.path)
+        endpoint = url.path.strip('/') or 'root'
+        start = time.perf_counter()
+        try:
+            if not self._host_allowed():
+                endpoint = 'rejected'
+                service.metrics.increment('rejected')
+                return self._send_json(403, {'error': f"Host {self.headers.get('Host')!r} is not allowed"})
+            if method == 'GET' and endpoint == 'sign':
+                names = parse_qs(url.query).get('name', [])
+                if not names:
+                    return self._send_json(400, {'error': 'name parameter is required'})
+                results = service.sign(names)
+                if len(results) == 1:
+                    self._send_json(404 if 'error' in results[0] else 200, results[0])
+                else:
+                    self._send_json(200, results)
+            elif method == 'POST' and endpoint == 'sign':
+                names = self._read_json().get('names')
+                if not isinstance(names, list) or not names or not all(isinstance(name, str) and name for name in names):
+                    return self._send_json(400, {'error': 'names must be a non-empty list of object names'})
+                self._send_json(200, service.sign(names))
+            elif method == 'POST' and endpoint == 'upload':
+                body = self._read_json()
+                if not isinstance(body.get('path'), str) or not body['path']:
+                    return self._send_json(400, {'error': 'path is required'})
+                if not isinstance(body.get('folder'), (str, type(None))):
+                    return self._send_json(400, {'error': 'folder must be a string'})
+                if not isinstance(body.get('force', False), bool):
+                    return self._send_json(400, {'error': 'force must be true or false'})
+                self._send_json(200, service.upload(body['path'], body.get('folder'), body.get('force', False)))
+            elif method == 'GET' and endpoint == 'metrics' and 'format' in parse_qs(url.query):
+                metrics_format = parse_qs(url.query)['format'][0]
+                if metrics_format not in ('prometheus', 'otlp'):
+                    return self._send_json(400, {'error': 'format must be prometheus or otlp'})
+                self._send_text(200, *get_registry().render(metrics_format))
+            elif method == 'GET' and endpoint == 'metrics':
+                snapshot = service.metrics.snapshot()
+                snapshot['cache_entries'] = len(service.cache)
+                self._send_json(200, snapshot)
+            elif method == 'GET' and endpoint == 'healthz':
+                self._send_json(200, {'status': 'ok'})
+            else:
+                endpoint = 'unknown'
+                self._send_json(404, {'error': f"No such endpoint: {method} {url.path}"})
+        except UnsupportedMediaType as e:
+            service.metrics.increment('errors')
+            self._send_json(415, {'error': str(e)})
+        except PermissionError as e:
+            service.metrics.increment('errors')
+            self._send_json(403, {'error': str(e)})
+        except FileNotFoundError as e:
+            service.metrics.increment('errors')
+            self._send_json(404, {'error': str(e)})
+        except (ValueError, KeyError) as e:
+            service.metrics.increment('errors')
+            self._send_json(400, {'error': str(e)})
+        except Exception as e:
+            service.metrics.increment('errors')
+            self._send_json(500, {'error': str(e)})
+        finally:
+            service.metrics.observe(endpoint, time.perf_counter() - start)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        super().server_bind()
+        # Same attributes HTTPServer sets for TCP sockets
+        self.server_name = socket.gethostname()
+        self.server_port = 0
+
+def create_server(service, address, verbose=False):
+    """Create an HTTP server for the service on 'host:port' or 'unix:/path'"""
+    if address.startswith('unix:'):
+        server = ThreadingUnixHTTPServer(address[len('unix:'):], SignRequestHandler)
+        # Only local processes with access to the socket file can connect
+        server.allowed_hosts = None
+    else:
+        host, _, port = address.rpartition(':')
+        host = (host or '127.0.0.1').strip('[]')
+        server = ThreadingHTTPServer((host, int(port)), SignRequestHandler)
+        port = server.server_address[1]
+        names = [host]
+        if host in ('127.0.0.1', '::1', 'localhost'):
+            names += ['localhost', '127.0.0.1', '[::1]']
+        # A wildcard address matches no Host header; the names clients use go in GCS_SIGN_SERVER_ALLOWED_HOSTS
+        server.allowed_hosts = {f"{name}:{port}".lower() for name in names if name not in ('0.0.0.0', '::')}
+        server.allowed_hosts.update(get_allowed_hosts())
+    server.service = service
+    server.verbose = verbose
+    return server
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description='Local HTTP service that signs and uploads with cached URLs')
+    parser.add_argument('--address', default=None,
+                        help="host:port or unix:/path/to/socket (default: GCS_SIGN_SERVER_ADDRESS or 127.0.0.1:8765)")
+    parser.add_argument('--upload-root', default=None,
+                        help='Directory /upload may read files from (default: GCS_SIGN_SERVER_UPLOAD_ROOT, '
+                             'uploads are disabled without it)')
+    parser.add_argument('--verbose', action='store_true', help='Log every request')
+    args = parser.parse_args()
+
+    bucket_name, credentials_path = load_config()
+
+    address = args.address or get_server_address()
+    upload_root = args.upload_root or get_upload_root()
+    if upload_root and not os.path.isdir(upload_root):
+        sys.exit(f"Error: Upload root {upload_root} is not a directory")
+    service = SigningService(bucket_name, credentials_path, default_records_file(), upload_root=upload_root)
+    server = create_server(service, address, args.verbose)
+    print(f"Signing service listening on {address}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if address.startswith('unix:') and os.path.exists(address[len('unix:'):]):
+            os.remove(address[len('unix:'):])
+
+if __name__ == "__main__":
+    main()
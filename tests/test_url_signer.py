@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from url_signer import URLSigner, split_signed_url, build_signed_url
+
+BUCKET = 'test-bucket'
+FROZEN = datetime(2026, 3, 14, 15, 9, 26)
+NAMES = [
+    'report.pdf',
+    'folder1/sub folder/My Report (final).pdf',
+    'données/été 2026/résumé €.csv',
+    '日本語/ファイル.txt',
+    'odd/a+b&c=d?e#f;g,h@i.txt',
+    '~user/100%/tab\tname.txt',
+]
+
+@pytest.fixture(scope='module')
+def service_account_info():
+    """Throwaway service account key generated for the tests"""
+    pytest.importorskip('cryptography')
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return {
+        'type': 'service_account',
+        'project_id': 'test-project',
+        'private_key_id': 'test-key',
+        'private_key': key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption()
+        ).decode('ascii'),
+        'client_email': 'signer@test-project.iam.gserviceaccount.com',
+        'client_id': '0',
+        'token_uri': 'https://oauth2.googleapis.com/token',
+    }
+
+@pytest.fixture
+def bucket(service_account_info, monkeypatch):
+    """Bucket of a client using the test key, with the clock of the library frozen at FROZEN"""
+    from google.cloud import storage
+    from google.cloud.storage import _signing
+    from google.oauth2 import service_account
+
+    monkeypatch.delenv('STORAGE_EMULATOR_HOST', raising=False)
+    monkeypatch.setattr(_signing, 'NOW', lambda: FROZEN)
+    credentials = service_account.Credentials.from_service_account_info(service_account_info)
+    return storage.Client(project='test-project', credentials=credentials).bucket(BUCKET)
+
+def library_url(bucket, name, expiration=timedelta(days=7), method='GET', api_access_endpoint=None):
+    kwargs = {'api_access_endpoint': api_access_endpoint} if api_access_endpoint else {}
+    return bucket.blob(name).generate_signed_url(version='v4', expiration=expiration, method=method, **kwargs)
+
+@pytest.mark.parametrize('name', NAMES)
+def test_sign_matches_library(bucket, service_account_info, name):
+    signer = URLSigner.from_service_account_info(service_account_info)
+    assert signer.sign(BUCKET, name, now=FROZEN) == library_url(bucket, name)
+
+def test_sign_many_matches_library(bucket, service_account_info):
+    signer = URLSigner.from_service_account_info(service_account_info)
+    expected = [library_url(bucket, name) for name in NAMES]
+    assert signer.sign_many(BUCKET, NAMES, now=FROZEN) == expected
+    # Threads and many names keep the input order
+    names = NAMES * 20
+    assert signer.sign_many(BUCKET, names, now=FROZEN, max_workers=4) == expected * 20
+
+def test_expiration_method_and_endpoint(bucket, service_account_info):
+    endpoint = 'http://localhost:4443'
+    signer = URLSigner.from_service_account_info(service_account_info, endpoint)
+    name = NAMES[1]
+    assert signer.sign(BUCKET, name, expiration=3600, method='put', now=FROZEN) == \
+        library_url(bucket, name, timedelta(hours=1), 'PUT', endpoint)
+
+def test_aware_time_is_converted_to_utc(bucket, service_account_info):
+    signer = URLSigner.from_service_account_info(service_account_info)
+    now = FROZEN.replace(tzinfo=timezone.utc).astimezone(timezone(timedelta(hours=-5)))
+    assert signer.sign(BUCKET, NAMES[0], now=now) == library_url(bucket, NAMES[0])
+
+def test_expiration_limit(service_account_info):
+    signer = URLSigner.from_service_account_info(service_account_info)
+    with pytest.raises(ValueError):
+        signer.sign(BUCKET, NAMES[0], expiration=timedelta(days=8), now=FROZEN)
+
+@pytest.mark.parametrize('name', NAMES)
+def test_split_and_build_round_trip(service_account_info, name):
+    signer = URLSigner.from_service_account_info(service_account_info)
+    url = signer.sign(BUCKET, name, now=FROZEN)
+    parts = split_signed_url(name, url)
+    assert parts is not None
+    assert build_signed_url(name, *parts) == url
+    assert split_signed_url(name, url.replace('X-Goog-Expires=604800', 'X-Goog-Expires=0604800')) is None
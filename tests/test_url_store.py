@@ -0,0 +1,117 @@
+import os
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import url_store
+from url_store import JsonRecordStore, SqliteRecordStore, import_json
+
+EXPIRATION = datetime(2030, 1, 1)
+URLS = ['https://example.test/u1', 'https://example.test/u2', 'https://example.test/u3',
+        'https://example.test/u1', 'https://example.test/u2']
+
+class SimulatedCrash(BaseException):
+    pass
+
+def save_all(store, urls, filename='report.pdf'):
+    for index, url in enumerate(urls):
+        store.save(filename, url, EXPIRATION, created_at=datetime(2026, 1, 1) + timedelta(minutes=index))
+
+def crash_before_journal_reset(monkeypatch):
+    """Make compaction die after the new snapshot is in place but before the journal is reset"""
+    write = url_store.atomic_write_bytes
+
+    def atomic_write_bytes(path, data):
+        if path.endswith('.journal') and data.count(b'\n') == 1:
+            raise SimulatedCrash()
+        write(path, data)
+
+    monkeypatch.setattr(url_store, 'atomic_write_bytes', atomic_write_bytes)
+
+def test_interrupted_compaction_is_not_replayed(tmp_path, monkeypatch):
+    path = str(tmp_path / 'signed_urls.json')
+    store = JsonRecordStore(path)
+    save_all(store, URLS)
+    expected = store.load_all()
+
+    crash_before_journal_reset(monkeypatch)
+    with pytest.raises(SimulatedCrash):
+        store.compact()
+    monkeypatch.undo()
+
+    # The snapshot already holds the journal, which still lists every save
+    with open(path) as f:
+        assert json.load(f) == expected
+    assert len(list(url_store.read_journal(f"{path}.journal"))) == len(URLS)
+
+    reopened = JsonRecordStore(path)
+    assert reopened.load_all() == expected
+    assert [entry['url'] for entry in expected['report.pdf']['history']] == URLS[:4]
+
+def test_append_after_interrupted_compaction(tmp_path, monkeypatch):
+    path = str(tmp_path / 'signed_urls.json')
+    store = JsonRecordStore(path)
+    save_all(store, URLS)
+
+    crash_before_journal_reset(monkeypatch)
+    with pytest.raises(SimulatedCrash):
+        store.compact()
+    monkeypatch.undo()
+
+    reopened = JsonRecordStore(path)
+    reopened.save('report.pdf', 'https://example.test/u4', EXPIRATION)
+    record = reopened.get('report.pdf')
+    assert record['url'] == 'https://example.test/u4'
+    assert [entry['url'] for entry in record['history']] == URLS
+
+    reopened.compact()
+    assert JsonRecordStore(path).get('report.pdf') == record
+
+def test_interrupted_compaction_of_journal_without_header(tmp_path, monkeypatch):
+    # Journals written before they had a header line
+    path = str(tmp_path / 'signed_urls.json')
+    with open(path, 'w') as f:
+        json.dump({}, f)
+    with open(f"{path}.journal", 'w') as f:
+        for index, url in enumerate(URLS):
+            f.write(json.dumps({'op': 'save', 'filename': 'report.pdf', 'url': url,
+                                'expiration': EXPIRATION.isoformat(),
+                                'created_at': datetime(2026, 1, 1, 0, index).isoformat()}) + '\n')
+    store = JsonRecordStore(path)
+    expected = store.load_all()
+
+    crash_before_journal_reset(monkeypatch)
+    with pytest.raises(SimulatedCrash):
+        store.compact()
+    monkeypatch.undo()
+
+    assert JsonRecordStore(path).load_all() == expected
+
+def test_import_after_interrupted_compaction(tmp_path, monkeypatch):
+    path = str(tmp_path / 'signed_urls.json')
+    store = JsonRecordStore(path)
+    save_all(store, URLS)
+    expected = store.load_all()
+
+    crash_before_journal_reset(monkeypatch)
+    with pytest.raises(SimulatedCrash):
+        store.compact()
+    monkeypatch.undo()
+
+    target = SqliteRecordStore(str(tmp_path / 'signed_urls.db'))
+    import_json(target, path)
+    assert dict(target.items()) == expected
+
+def test_compaction_keeps_records(tmp_path):
+    path = str(tmp_path / 'signed_urls.json')
+    store = JsonRecordStore(path)
+    save_all(store, URLS)
+    store.save('other.pdf', 'https://example.test/o1', EXPIRATION)
+    store.delete(['other.pdf'])
+    expected = store.load_all()
+
+    store.compact()
+    assert list(url_store.read_journal(f"{path}.journal")) == []
+    assert JsonRecordStore(path).load_all() == expected
+    assert os.path.getsize(f"{path}.journal") > 0
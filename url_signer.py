@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import hashlib
+import binascii
+import threading
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote, urlparse
+from metrics import span, increment
+
+DEFAULT_ENDPOINT = 'https://storage.googleapis.com'
+MAX_EXPIRATION_SECONDS = 7 * 24 * 60 * 60
+# Lifetime of the URLs signed and stored by the scripts: the V4 maximum
+URL_LIFETIME = timedelta(seconds=MAX_EXPIRATION_SECONDS)
+
+_signers = {}
+_lock = threading.Lock()
+
+def _quote_param(value):
+    """Quote a query parameter the same way google-cloud-storage does"""
+    return quote(str(value), safe='~')
+
+def quote_blob_name(blob_name):
+    """Quote a blob name for use in a signed URL path"""
+    return quote(blob_name.encode('utf-8'), safe=b'/~')
+
+def expiration_seconds(expiration):
+    """Convert a timedelta or a number of seconds into a valid V4 expiration"""
+    if isinstance(expiration, timedelta):
+        seconds = int(expiration.total_seconds())
+    else:
+        seconds = int(expiration)
+    if seconds < 0 or seconds > MAX_EXPIRATION_SECONDS:
+        raise ValueError(f"Expiration must be between 0 and {MAX_EXPIRATION_SECONDS} seconds, got {seconds}")
+    return seconds
+
+_QUERY_PREFIX = '?X-Goog-Algorithm=GOOG4-RSA-SHA256&X-Goog-Credential='
+_CREDENTIAL_SUFFIX = '%2Fauto%2Fstorage%2Fgoog4_request&X-Goog-Date='
+
+def split_signed_url(blob_name, url):
+    """
+    Split a V4 signed URL created by URLSigner into the parts that differ between
+    URLs: (prefix, credential, timestamp, seconds, signature). prefix is the
+    endpoint and bucket, credential the quoted client email, timestamp the
+    request time as a YYYYMMDDHHMMSS integer and signature the raw bytes.
+    Returns None for URLs that build_signed_url() would not reproduce exactly.
+    """
+    try:
+        head, _, query = url.partition('?')
+        quoted = quote_blob_name(blob_name)
+        if not head.endswith('/' + quoted):
+            return None
+        prefix = head[:len(head) - len(quoted)]
+        credential, _, rest = ('?' + query)[len(_QUERY_PREFIX):].partition('%2F')
+        # The date of the credential scope is the one of the timestamp; the round trip below checks it
+        _, _, rest = rest.partition(_CREDENTIAL_SUFFIX)
+        timestamp, _, rest = rest.partition('&X-Goog-Expires=')
+        seconds, _, signature = rest.partition('&X-Goog-SignedHeaders=host&X-Goog-Signature=')
+        parts = (prefix, credential, int(timestamp[:8] + timestamp[9:15]), int(seconds),
+                 binascii.unhexlify(signature))
+    except (ValueError, binascii.Error):
+        return None
+    return parts if build_signed_url(blob_name, *parts) == url else None
+
+def build_signed_url(blob_name, prefix, credential, timestamp, seconds, signature):
+    """Rebuild a signed URL from the parts returned by split_signed_url()"""
+    date = f"{timestamp // 1000000:08d}"
+    return (f"{prefix}{quote_blob_name(blob_name)}{_QUERY_PREFIX}{credential}%2F{date}{_CREDENTIAL_SUFFIX}"
+            f"{date}T{timestamp % 1000000:06d}Z&X-Goog-Expires={seconds}"
+            f"&X-Goog-SignedHeaders=host&X-Goog-Signature={binascii.hexlify(signature).decode('ascii')}")
+
+class URLSigner:
+    """
+    Offline V4 signed URL generator.
+    The service account private key is loaded once and everything that does not
+    depend on the blob name (credential scope, query string, headers) is computed
+    once per request timestamp, so signing only hashes and signs one string per blob.
+    The output is identical to blob.generate_signed_url(version="v4").
+    """
+
+    def __init__(self, client_email, signer, api_access_endpoint=None):
+        self.client_email = client_email
+        self.key_id = signer.key_id
+        self._signer = signer
+        self.api_access_endpoint = (api_access_endpoint or DEFAULT_ENDPOINT).rstrip('/')
+        self._host = urlparse(self.api_access_endpoint).netloc
+        self._template_key = None
+        self._template = None
+
+    @classmethod
+    def from_service_account_info(cls, info, api_access_endpoint=None):
+        """Create a signer from a parsed service account key"""
+        # google.auth is only loaded when a key is, keeping this module cheap to import
+        from google.auth import crypt
+        return cls(info['client_email'], crypt.RSASigner.from_service_account_info(info), api_access_endpoint)
+
+    @classmethod
+    def from_service_account_file(cls, credentials_path, api_access_endpoint=None):
+        """Create a signer from a service account key file"""
+        with open(credentials_path, 'r') as f:
+            info = json.load(f)
+        return cls.from_service_account_info(info, api_access_endpoint)
+
+    def _get_template(self, request_timestamp, seconds, method):
+        """Return the blob independent parts of the canonical request and string to sign"""
+        key = (request_timestamp, seconds, method)
+        if self._template_key == key:
+            return self._template
+
+        credential_scope = f"{request_timestamp[:8]}/auto/storage/goog4_request"
+        query_parameters = {
+            'X-Goog-Algorithm': 'GOOG4-RSA-SHA256',
+            'X-Goog-Credential': f"{self.client_email}/{credential_scope}",
+            'X-Goog-Date': request_timestamp,
+            'X-Goog-Expires': seconds,
+            'X-Goog-SignedHeaders': 'host',
+        }
+        canonical_query_string = '&'.join(sorted(
+            f"{_quote_param(name)}={_quote_param(value)}" for name, value in query_parameters.items()
+        ))
+        request_prefix = f"{method}\n"
+        request_suffix = f"\n{canonical_query_string}\nhost:{self._host}\n\nhost\nUNSIGNED-PAYLOAD"
+        string_prefix = f"GOOG4-RSA-SHA256\n{request_timestamp}\n{credential_scope}\n"
+
+        template = (canonical_query_string, request_prefix, request_suffix, string_prefix)
+        self._template_key, self._template = key, template
+        return template
+
+    @staticmethod
+    def _request_timestamp(now):
+        if now is None:
+            now = datetime.now(timezone.utc)
+        elif now.tzinfo is not None:
+            now = now.astimezone(timezone.utc)
+        return now.strftime('%Y%m%dT%H%M%SZ')
+
+    def _sign_resource(self, resource, template):
+        canonical_query_string, request_prefix, request_suffix, string_prefix = template
+        canonical_request = f"{request_prefix}{resource}{request_suffix}"
+        request_hash = hashlib.sha256(canonical_request.encode('ascii')).hexdigest()
+        signature = self._signer.sign(f"{string_prefix}{request_hash}".encode('ascii'))
+        signature = binascii.hexlify(signature).decode('ascii')
+        return f"{self.api_access_endpoint}{resource}?{canonical_query_string}&X-Goog-Signature={signature}"
+
+    def sign(self, bucket_name, blob_name, expiration=URL_LIFETIME, method='GET', now=None):
+        """
+        Generate a V4 signed URL for one blob
+        Args:
+            bucket_name: Name of the GCS bucket
+            blob_name: Full blob path within the bucket
+            expiration: timedelta or number of seconds (7 days maximum)
+            method: HTTP method the URL is valid for
+            now: Optional signing time (UTC), mainly for reproducible output
+        """
+        return self.sign_many(bucket_name, [blob_name], expiration, method, now)[0]
+
+    def sign_many(self, bucket_name, blob_names, expiration=URL_LIFETIME, method='GET', now=None, max_workers=1):
+        """
+        Generate V4 signed URLs for a list of blobs in one bucket.
+        All URLs share the same request timestamp. Returns the URLs in input order.
+        """
+        template = self._get_template(self._request_timestamp(now), expiration_seconds(expiration), method.upper())
+        bucket_prefix = f"/{bucket_name}/"
+
+        def sign_one(blob_name):
+            return self._sign_resource(bucket_prefix + quote_blob_name(blob_name), template)
+
+        increment('gcs_signed_urls_total', len(blob_names), help='Signed URLs generated')
+        with span('sign'):
+            if max_workers > 1 and len(blob_names) > max_workers:
+                from concurrent.futures import ThreadPoolExecutor
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    return list(executor.map(sign_one, blob_names, chunksize=256))
+            return [sign_one(blob_name) for blob_name in blob_names]
+
+def get_url_signer(credentials_path, api_access_endpoint=None):
+    """Return the shared signer for a credentials file, loading the key on first use"""
+    if api_access_endpoint is None:
+        api_access_endpoint = os.getenv('GCS_SIGNED_URL_ENDPOINT', DEFAULT_ENDPOINT)
+    key = (os.path.abspath(credentials_path), api_access_endpoint)
+    with _lock:
+        signer = _signers.get(key)
+        if signer is None:
+            signer = URLSigner.from_service_account_file(credentials_path, api_access_endpoint)
+            _signers[key] = signer
+        return signer
+
+def main():
+    """Sign every blob name read from stdin and print '<blob>\\t<url>' lines"""
+    from dotenv import load_dotenv
+    from gcs_config import load_config
+    load_dotenv()
+
+    bucket_name, credentials_path = load_config()
+
+    blob_names = [line.rstrip('\n') for line in sys.stdin if line.strip()]
+    signer = get_url_signer(credentials_path)
+    urls = signer.sign_many(bucket_name, blob_names, max_workers=os.cpu_count() or 1)
+    for blob_name, url in zip(blob_names, urls):
+        print(f"{blob_name}\t{url}")
+
+if __name__ == "__main__":
+    main()
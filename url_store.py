@@ -0,0 +1,914 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import stat
+import zlib
+import sqlite3
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# Number of previous URLs kept per file, unless URL_STORE_HISTORY_LIMIT is set
+HISTORY_LIMIT = 5
+
+SQLITE_EXTENSIONS = ('.db', '.sqlite', '.sqlite3')
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+@contextmanager
+def file_lock(lock_path, shared=False, blocking=True):
+    """
+    Hold an advisory lock on lock_path shared between processes.
+    With blocking=False, BlockingIOError is raised when the lock is already held.
+    """
+    with open(lock_path, 'a+') as f:
+        if fcntl is not None:
+            flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+            fcntl.flock(f, flags if blocking else flags | fcntl.LOCK_NB)
+        else:
+            # msvcrt only offers exclusive locks
+            f.seek(0)
+            try:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+            except OSError as e:
+                if blocking:
+                    raise
+                raise BlockingIOError(str(e)) from e
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+def replacement_mode(path):
+    """
+    Permissions for a file renamed over path: those of the current file, or
+    0666 minus the umask for a new one (mkstemp creates temporary files 0600)
+    """
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+def snapshot_fingerprint(data):
+    """Size and CRC32 of the bytes of a JSON store snapshot, recorded by its journal"""
+    return f"{len(data)}-{zlib.crc32(data):08x}"
+
+def file_fingerprint(path, chunk_size=1024 * 1024):
+    """snapshot_fingerprint() of a file read in chunks, None if it does not exist"""
+    size = crc = 0
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                size += len(chunk)
+                crc = zlib.crc32(chunk, crc)
+    except FileNotFoundError:
+        return None
+    return f"{size}-{crc:08x}"
+
+def atomic_write_bytes(path, data):
+    """Write bytes to a temporary file in the same directory and rename it over path, keeping its permissions"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(path)}.", suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            os.chmod(temp_path, replacement_mode(path))
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def atomic_write_json(path, data, indent=2):
+    """Write JSON with atomic_write_bytes(). Returns the snapshot_fingerprint() of the bytes written."""
+    encoded = json.dumps(data, indent=indent).encode('utf-8')
+    atomic_write_bytes(path, encoded)
+    return snapshot_fingerprint(encoded)
+
+def get_history_limit():
+    """Number of previous URLs kept per file (URL_STORE_HISTORY_LIMIT, 0 keeps none)"""
+    return max(0, int(os.getenv('URL_STORE_HISTORY_LIMIT', str(HISTORY_LIMIT))))
+
+def default_records_file():
+    """Path of the record store configured in the environment"""
+    return os.getenv('SIGNED_URLS_FILE', 'signed_urls.json')
+
+def rotate_record(current_record, signed_url, expiration_date, created_at=None):
+    """
+    Build the new record for a file: the current URL moves to the history,
+    which keeps only the last get_history_limit() entries.
+    """
+    history = []
+    if current_record:
+        history = list(current_record.get('history', []))
+        history.append({
+            'url': current_record['url'],
+            'created_at': current_record['created_at'],
+            'expiration': current_record['expiration']
+        })
+        limit = get_history_limit()
+        history = history[-limit:] if limit else []
+
+    return {
+        'url': signed_url,
+        'expiration': expiration_date.isoformat(),
+        'created_at': (created_at or datetime.now()).isoformat(),
+        'history': history
+    }
+
+def apply_journal_entry(records, entry):
+    """Apply one journal entry to a records dict"""
+    filename = entry['filename']
+    op = entry['op']
+    if op == 'save':
+        current = records.get(filename)
+        # The signed URL identifies the entry, so replaying it after a compaction is a no-op
+        if current and current['url'] == entry['url']:
+            return
+        record = rotate_record(current, entry['url'], datetime.fromisoformat(entry['expiration']),
+                               datetime.fromisoformat(entry['created_at']))
+        records[filename] = record
+    elif op == 'put':
+        records[filename] = entry['record']
+    elif op == 'delete':
+        records.pop(filename, None)
+
+def journal_header(fingerprint):
+    """First line of a journal: the fingerprint of the snapshot its entries apply to"""
+    return json.dumps({'op': 'base', 'snapshot': fingerprint}, separators=(',', ':')) + '\n'
+
+class JsonRecordStore:
+    """
+    Record store kept in a JSON file (the historical format) plus an append-only
+    journal next to it. Writers append one line per change while holding an
+    exclusive file lock, so parallel uploaders never overwrite each other and a
+    crash can at worst leave a truncated last journal line, which is ignored.
+    The journal is periodically compacted into the JSON file with
+    write-to-temp-then-rename.
+
+    The first line of the journal names the snapshot it applies to (its size
+    and CRC32). Compaction renames the new snapshot into place before it resets
+    the journal, so if it is interrupted in between, the old journal no longer
+    matches the snapshot and is ignored rather than applied a second time.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.journal_path = f"{path}.journal"
+        self.lock_path = f"{path}.lock"
+        self._lock = threading.Lock()
+        self._checked = None  # Stat of the snapshot the journal was last checked against
+
+    def _load_snapshot(self):
+        """Records of the JSON file and the fingerprint of its bytes (None without a file)"""
+        try:
+            with open(self.path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return {}, None
+        return json.loads(data), snapshot_fingerprint(data)
+
+    def _replay(self, records, fingerprint):
+        """Apply the journal to the snapshot it was written for"""
+        for entry in read_journal(self.journal_path, fingerprint):
+            apply_journal_entry(records, entry)
+        return records
+
+    def load_all(self):
+        with file_lock(self.lock_path, shared=True):
+            return self._replay(*self._load_snapshot())
+
+    def _append(self, entries):
+        """Append entries to the journal and compact it when it has grown too large"""
+        with self._lock, file_lock(self.lock_path):
+            if not os.path.exists(self.path):
+                # The JSON file exists as soon as a record does, as it did before the journal
+                atomic_write_json(self.path, {})
+            self._check_journal()
+            with open(self.journal_path, 'a') as f:
+                if f.tell() == 0:
+                    f.write(journal_header(file_fingerprint(self.path)))
+                f.write(''.join(json.dumps(entry, separators=(',', ':')) + '\n' for entry in entries))
+                f.flush()
+                journal_size = f.tell()
+            if journal_size > self._compact_threshold():
+                self._compact()
+
+    def _snapshot_stat(self):
+        stat = os.stat(self.path)
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def _check_journal(self):
+        """
+        Reset a journal left behind by an interrupted compaction, so new entries
+        are not appended to a journal that is ignored. The snapshot is only read
+        again when it changed since the last check.
+        """
+        snapshot_stat = self._snapshot_stat()
+        if snapshot_stat == self._checked:
+            return
+        base = read_journal_base(self.journal_path)
+        if base is not None:
+            fingerprint = file_fingerprint(self.path)
+            if base != fingerprint:
+                atomic_write_bytes(self.journal_path, journal_header(fingerprint).encode('utf-8'))
+        self._checked = snapshot_stat
+
+    def _compact_threshold(self):
+        """Compact once the journal is a quarter of the snapshot (at least URL_STORE_COMPACT_BYTES)"""
+        minimum = int(os.getenv('URL_STORE_COMPACT_BYTES', str(1024 * 1024)))
+        try:
+            snapshot_size = os.path.getsize(self.path)
+        except OSError:
+            snapshot_size = 0
+        return max(minimum, snapshot_size // 4)
+
+    def _compact(self):
+        """Fold the journal into the JSON file. Must be called with the exclusive lock held."""
+        records, fingerprint = self._load_snapshot()
+        entries = list(read_journal(self.journal_path, fingerprint))
+        if fingerprint is not None and read_journal_base(self.journal_path) is None:
+            # A journal written before headers existed is given one first, or an
+            # interruption below would leave it to be applied to the new snapshot
+            atomic_write_bytes(self.journal_path, (journal_header(fingerprint) + ''.join(
+                json.dumps(entry, separators=(',', ':')) + '\n' for entry in entries)).encode('utf-8'))
+        for entry in entries:
+            apply_journal_entry(records, entry)
+        fingerprint = atomic_write_json(self.path, records)
+        atomic_write_bytes(self.journal_path, journal_header(fingerprint).encode('utf-8'))
+        self._checked = self._snapshot_stat()
+
+    def compact(self):
+        with self._lock, file_lock(self.lock_path):
+            self._compact()
+
+    def replace_all(self, records):
+        """Journal the differences between the store and the given records"""
+        current = self.load_all()
+        entries = [{'op': 'delete', 'filename': filename} for filename in current if filename not in records]
+        entries += [
+            {'op': 'put', 'filename': filename, 'record': record}
+            for filename, record in records.items() if current.get(filename) != record
+        ]
+        if entries:
+            self._append(entries)
+
+    def get(self, filename):
+        return self.load_all().get(filename)
+
+    def get_many(self, filenames):
+        """Records of the given files that exist, as a dict, from a single read of the store"""
+        records = self.load_all()
+        return {filename: records[filename] for filename in filenames if filename in records}
+
+    def save(self, filename, signed_url, expiration_date, created_at=None):
+        entry = {
+            'op': 'save',
+            'filename': filename,
+            'url': signed_url,
+            'expiration': expiration_date.isoformat(),
+            'created_at': (created_at or datetime.now()).isoformat()
+        }
+        self._append([entry])
+        return {key: entry[key] for key in ('url', 'expiration', 'created_at')}
+
+    def save_many(self, items):
+        """Save (filename, signed_url, expiration_date) tuples with one journal append"""
+        created_at = datetime.now().isoformat()
+        entries = [
+            {'op': 'save', 'filename': filename, 'url': signed_url,
+             'expiration': expiration_date.isoformat(), 'created_at': created_at}
+            for filename, signed_url, expiration_date in items
+        ]
+        if entries:
+            self._append(entries)
+        return len(entries)
+
+    def put_many(self, items):
+        """Write (filename, record) pairs as they are, history included, with one journal append"""
+        entries = [{'op': 'put', 'filename': filename, 'record': record} for filename, record in items]
+        if entries:
+            self._append(entries)
+        return len(entries)
+
+    def apply_entries(self, entries):
+        """Append journal entries of another JSON store"""
+        if entries:
+            self._append(list(entries))
+        return len(entries)
+
+    def delete(self, filenames):
+        records = self.load_all()
+        deleted = [filename for filename in filenames if filename in records]
+        if deleted:
+            self._append([{'op': 'delete', 'filename': filename} for filename in deleted])
+        return len(deleted)
+
+    def items(self, history=True):
+        for filename, record in self.load_all().items():
+            if not history:
+                record = {key: value for key, value in record.items() if key != 'history'}
+            yield filename, record
+
+    def summaries(self):
+        """(filename, expiration, created_at, history count) of every record"""
+        return [
+            (filename, record['expiration'], record['created_at'], len(record.get('history', [])))
+            for filename, record in self.load_all().items()
+        ]
+
+    def version(self):
+        """Value that changes whenever the store is written to"""
+        versions = []
+        for path in (self.path, self.journal_path):
+            try:
+                stat = os.stat(path)
+                versions.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                versions.append(None)
+        return tuple(versions)
+
+    def expiring_before(self, moment):
+        return [
+            (filename, record) for filename, record in self.load_all().items()
+            if datetime.fromisoformat(record['expiration']) < moment
+        ]
+
+    def expiring_names_before(self, moment):
+        return [filename for filename, _ in self.expiring_before(moment)]
+
+    def count(self):
+        return len(self.load_all())
+
+    def close(self):
+        pass
+
+class SqliteRecordStore:
+    """
+    Record store kept in SQLite (WAL mode). Records are indexed by blob path
+    and expiration, so saving or looking up one file does not depend on the
+    size of the store.
+
+    Signed URLs are stored compactly: the endpoint, bucket and client email are
+    kept once in the signers table and each URL only keeps its request time,
+    lifetime and raw signature, from which it is rebuilt when read (a tenth of
+    the signed URL text). URLs that cannot be rebuilt exactly are kept as is.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS records (
+            filename TEXT PRIMARY KEY,
+            url TEXT NOT NULL,
+            expiration TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            signer_id INTEGER,
+            signed_at INTEGER,
+            expires INTEGER,
+            signature BLOB
+        );
+        CREATE INDEX IF NOT EXISTS records_expiration ON records (expiration);
+        CREATE TABLE IF NOT EXISTS history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            filename TEXT NOT NULL,
+            url TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            expiration TEXT NOT NULL,
+            signer_id INTEGER,
+            signed_at INTEGER,
+            expires INTEGER,
+            signature BLOB
+        );
+        CREATE INDEX IF NOT EXISTS history_filename ON history (filename, id);
+        CREATE TABLE IF NOT EXISTS signers (
+            id INTEGER PRIMARY KEY,
+            prefix TEXT NOT NULL,
+            credential TEXT NOT NULL,
+            UNIQUE (prefix, credential)
+        );
+    """
+
+    # Columns holding a compact signed URL, added to stores created before them
+    URL_COLUMNS = (('signer_id', 'INTEGER'), ('signed_at', 'INTEGER'), ('expires', 'INTEGER'), ('signature', 'BLOB'))
+
+    RECORD_SELECT = ('SELECT filename, url, expiration, created_at, signer_id, signed_at, expires, signature '
+                     'FROM records')
+    HISTORY_SELECT = ('SELECT filename, url, created_at, expiration, signer_id, signed_at, expires, signature '
+                      'FROM history')
+
+    # Host parameters per IN (...) query, below the SQLite limit of old versions
+    BATCH_SIZE = 500
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(self.SCHEMA)
+        for table in ('records', 'history'):
+            columns = {row[1] for row in self._conn.execute(f'PRAGMA table_info({table})')}
+            for name, column_type in self.URL_COLUMNS:
+                if name not in columns:
+                    self._conn.execute(f'ALTER TABLE {table} ADD COLUMN {name} {column_type}')
+        self._signer_ids = {}
+        self._signers = {}
+        # Only the SQLite store needs the URL format, and JSON store users do not pay for its imports
+        from url_signer import split_signed_url, build_signed_url
+        self._split_signed_url = split_signed_url
+        self._build_signed_url = build_signed_url
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                # Signers inserted by the transaction are gone with it
+                self._signer_ids.clear()
+                raise
+
+    def _signer_id(self, prefix, credential):
+        """Id of a (prefix, credential) pair, inserted inside the open transaction when new"""
+        key = (prefix, credential)
+        signer_id = self._signer_ids.get(key)
+        if signer_id is None:
+            self._conn.execute('INSERT OR IGNORE INTO signers (prefix, credential) VALUES (?, ?)', key)
+            signer_id = self._conn.execute(
+                'SELECT id FROM signers WHERE prefix = ? AND credential = ?', key
+            ).fetchone()[0]
+            self._signer_ids[key] = signer_id
+            self._signers[signer_id] = key
+        return signer_id
+
+    def _encode(self, filename, url):
+        """(url, signer_id, signed_at, expires, signature) column values of a signed URL"""
+        parts = self._split_signed_url(filename, url)
+        if parts is None:
+            return url, None, None, None, None
+        prefix, credential, signed_at, expires, signature = parts
+        return '', self._signer_id(prefix, credential), signed_at, expires, signature
+
+    def _decode(self, filename, url, signer_id, signed_at, expires, signature):
+        """Signed URL of a row, rebuilt from its compact columns when it has them"""
+        if signer_id is None:
+            return url
+        signer = self._signers.get(signer_id)
+        if signer is None:
+            signer = self._signers[signer_id] = self._conn.execute(
+                'SELECT prefix, credential FROM signers WHERE id = ?', (signer_id,)
+            ).fetchone()
+        return self._build_signed_url(filename, *signer, signed_at, expires, signature)
+
+    def _histories(self, filenames):
+        """History lists of the given files, with one query per BATCH_SIZE files"""
+        histories = {filename: [] for filename in filenames}
+        filenames = list(histories)
+        for start in range(0, len(filenames), self.BATCH_SIZE):
+            batch = filenames[start:start + self.BATCH_SIZE]
+            rows = self._conn.execute(
+                f"{self.HISTORY_SELECT} WHERE filename IN ({','.join('?' * len(batch))}) ORDER BY filename, id",
+                batch
+            )
+            for filename, url, created_at, expiration, *compact in rows:
+                histories[filename].append({
+                    'url': self._decode(filename, url, *compact),
+                    'created_at': created_at,
+                    'expiration': expiration
+                })
+        return histories
+
+    def _records(self, rows, history=True):
+        """(filename, record) pairs of record rows, their histories read together"""
+        histories = self._histories([row[0] for row in rows]) if history else {}
+        records = []
+        for filename, url, expiration, created_at, *compact in rows:
+            record = {'url': self._decode(filename, url, *compact), 'expiration': expiration, 'created_at': created_at}
+            if history:
+                record['history'] = histories[filename]
+            records.append((filename, record))
+        return records
+
+    def get(self, filename):
+        with self._lock:
+            row = self._conn.execute(f'{self.RECORD_SELECT} WHERE filename = ?', (filename,)).fetchone()
+            return self._records([row])[0][1] if row else None
+
+    def get_many(self, filenames):
+        """Records of the given files that exist, as a dict"""
+        filenames = list(dict.fromkeys(filenames))
+        records = {}
+        with self._lock:
+            for start in range(0, len(filenames), self.BATCH_SIZE):
+                batch = filenames[start:start + self.BATCH_SIZE]
+                rows = self._conn.execute(
+                    f"{self.RECORD_SELECT} WHERE filename IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                records.update(self._records(rows))
+        return records
+
+    def _write(self, filename, record):
+        """Write a full record (current URL and history) inside an open transaction"""
+        self._conn.execute(
+            'INSERT OR REPLACE INTO records (filename, expiration, created_at, '
+            'url, signer_id, signed_at, expires, signature) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (filename, record['expiration'], record['created_at'], *self._encode(filename, record['url']))
+        )
+        self._conn.execute('DELETE FROM history WHERE filename = ?', (filename,))
+        limit = get_history_limit()
+        history = record.get('history', [])[-limit:] if limit else []
+        self._conn.executemany(
+            'INSERT INTO history (filename, created_at, expiration, '
+            'url, signer_id, signed_at, expires, signature) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            [(filename, old['created_at'], old['expiration'], *self._encode(filename, old['url']))
+             for old in history]
+        )
+
+    def _save(self, filename, signed_url, expiration_date, created_at):
+        """Rotate the current URL into the history and write the new one inside an open transaction"""
+        limit = get_history_limit()
+        if limit:
+            # The current row moves to the history as it is stored, without rebuilding its URL
+            self._conn.execute(
+                'INSERT INTO history (filename, url, created_at, expiration, signer_id, signed_at, expires, signature) '
+                'SELECT filename, url, created_at, expiration, signer_id, signed_at, expires, signature '
+                'FROM records WHERE filename = ?',
+                (filename,)
+            )
+            # Keep only the last get_history_limit() historical URLs
+            self._conn.execute(
+                'DELETE FROM history WHERE filename = ? AND id NOT IN '
+                '(SELECT id FROM history WHERE filename = ? ORDER BY id DESC LIMIT ?)',
+                (filename, filename, limit)
+            )
+        else:
+            self._conn.execute('DELETE FROM history WHERE filename = ?', (filename,))
+        record = {
+            'url': signed_url,
+            'expiration': expiration_date.isoformat(),
+            'created_at': created_at.isoformat()
+        }
+        self._conn.execute(
+            'INSERT OR REPLACE INTO records (filename, expiration, created_at, '
+            'url, signer_id, signed_at, expires, signature) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (filename, record['expiration'], record['created_at'], *self._encode(filename, signed_url))
+        )
+        return record
+
+    def save(self, filename, signed_url, expiration_date, created_at=None):
+        with self._transaction():
+            record = self._save(filename, signed_url, expiration_date, created_at or datetime.now())
+        with self._lock:
+            record['history'] = self._histories([filename])[filename]
+        return record
+
+    def save_many(self, items):
+        """Save (filename, signed_url, expiration_date) tuples in a single transaction"""
+        created_at = datetime.now()
+        with self._transaction():
+            for filename, signed_url, expiration_date in items:
+                self._save(filename, signed_url, expiration_date, created_at)
+        return len(items)
+
+    def put_many(self, items):
+        """Write (filename, record) pairs as they are, history included, in a single transaction"""
+        with self._transaction():
+            for filename, record in items:
+                self._write(filename, record)
+        return len(items)
+
+    def apply_entries(self, entries):
+        """Apply JSON store journal entries in a single transaction"""
+        with self._transaction():
+            for entry in entries:
+                filename = entry['filename']
+                if entry['op'] == 'save':
+                    row = self._conn.execute(f'{self.RECORD_SELECT} WHERE filename = ?', (filename,)).fetchone()
+                    # Same rule as the journal replay: saving the current URL again is a no-op
+                    if row is None or self._decode(filename, row[1], *row[4:]) != entry['url']:
+                        self._save(filename, entry['url'], datetime.fromisoformat(entry['expiration']),
+                                   datetime.fromisoformat(entry['created_at']))
+                elif entry['op'] == 'put':
+                    self._write(filename, entry['record'])
+                elif entry['op'] == 'delete':
+                    self._conn.execute('DELETE FROM records WHERE filename = ?', (filename,))
+                    self._conn.execute('DELETE FROM history WHERE filename = ?', (filename,))
+        return len(entries)
+
+    def delete(self, filenames):
+        deleted = 0
+        with self._transaction():
+            for filename in filenames:
+                deleted += self._conn.execute('DELETE FROM records WHERE filename = ?', (filename,)).rowcount
+                self._conn.execute('DELETE FROM history WHERE filename = ?', (filename,))
+        return deleted
+
+    def replace_all(self, records):
+        with self._transaction():
+            self._conn.execute('DELETE FROM records')
+            self._conn.execute('DELETE FROM history')
+            for filename, record in records.items():
+                self._write(filename, record)
+
+    def items(self, history=True, page_size=1000):
+        """
+        Stream (filename, record) pairs ordered by filename, reading page_size
+        records at a time; without history the records have no 'history' key
+        """
+        last = ''
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    f'{self.RECORD_SELECT} WHERE filename > ? ORDER BY filename LIMIT ?', (last, page_size)
+                ).fetchall()
+                records = self._records(rows, history)
+            yield from records
+            if len(rows) < page_size:
+                return
+            last = rows[-1][0]
+
+    def load_all(self):
+        return dict(self.items())
+
+    def summaries(self):
+        """(filename, expiration, created_at, history count) of every record, without building URLs"""
+        with self._lock:
+            return self._conn.execute(
+                'SELECT filename, expiration, created_at, '
+                '(SELECT COUNT(*) FROM history WHERE history.filename = records.filename) FROM records'
+            ).fetchall()
+
+    def version(self):
+        """Value that changes whenever another connection writes to the store"""
+        with self._lock:
+            return self._conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def expiring_before(self, moment):
+        """Records whose expiration is before the given time, found through the expiration index"""
+        with self._lock:
+            rows = self._conn.execute(
+                f'{self.RECORD_SELECT} WHERE expiration < ? ORDER BY expiration', (moment.isoformat(),)
+            ).fetchall()
+            return self._records(rows)
+
+    def expiring_names_before(self, moment):
+        """Names of the records expiring before the given time, without reading their URLs"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                'SELECT filename FROM records WHERE expiration < ? ORDER BY expiration', (moment.isoformat(),)
+            )]
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM records').fetchone()[0]
+
+    def compact(self):
+        """Store the URLs saved before the compact columns existed compactly and reclaim the space"""
+        converted = 0
+        for table, key in (('records', 'filename'), ('history', 'id')):
+            with self._transaction():
+                rows = self._conn.execute(
+                    f"SELECT {key}, filename, url FROM {table} WHERE signer_id IS NULL"
+                ).fetchall()
+                for row_key, filename, url in rows:
+                    encoded = self._encode(filename, url)
+                    if encoded[1] is not None:
+                        self._conn.execute(
+                            f'UPDATE {table} SET url = ?, signer_id = ?, signed_at = ?, expires = ?, signature = ? '
+                            f'WHERE {key} = ?',
+                            (*encoded, row_key)
+                        )
+                        converted += 1
+        with self._lock:
+            self._conn.execute('VACUUM')
+            # VACUUM goes through the WAL; fold it back so the file size reflects the result
+            self._conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        return converted
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+def store_backend(records_file):
+    """Backend name for a records file: URL_STORE_BACKEND, else the file extension"""
+    backend = os.getenv('URL_STORE_BACKEND', '').lower()
+    if backend in ('json', 'sqlite'):
+        return backend
+    return 'sqlite' if records_file.lower().endswith(SQLITE_EXTENSIONS) else 'json'
+
+def open_record_store(records_file=None):
+    """Return the shared record store for a records file"""
+    if records_file is None:
+        records_file = default_records_file()
+    key = os.path.abspath(records_file)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            if store_backend(records_file) == 'sqlite':
+                store = SqliteRecordStore(records_file)
+            else:
+                store = JsonRecordStore(records_file)
+            _stores[key] = store
+        return store
+
+def iter_json_object(path, chunk_size=1024 * 1024):
+    """
+    Stream the (key, value) pairs of a JSON file holding one object, such as
+    signed_urls.json, reading chunk_size characters at a time instead of the whole file
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r') as f:
+        buffer = ''
+        position = 0
+        eof = False
+
+        def read_more():
+            nonlocal buffer, position, eof
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+
+        def next_char():
+            nonlocal position
+            while True:
+                while position < len(buffer) and buffer[position].isspace():
+                    position += 1
+                if position < len(buffer):
+                    return buffer[position]
+                if eof:
+                    raise ValueError(f"Unexpected end of {path}")
+                read_more()
+
+        def next_value():
+            nonlocal position
+            next_char()
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, position)
+                    # A value ending the buffer (a number) may continue in the next chunk
+                    if end < len(buffer) or eof:
+                        position = end
+                        return value
+                except ValueError:
+                    if eof:
+                        raise
+                read_more()
+
+        if next_char() != '{':
+            raise ValueError(f"{path} does not hold a JSON object")
+        position += 1
+        if next_char() == '}':
+            return
+        while True:
+            key = next_value()
+            if next_char() != ':':
+                raise ValueError(f"Expected ':' after {key!r} in {path}")
+            position += 1
+            yield key, next_value()
+            separator = next_char()
+            position += 1
+            if separator == '}':
+                return
+            if separator != ',':
+                raise ValueError(f"Expected ',' or '}}' after {key!r} in {path}")
+
+def read_journal_base(journal_path):
+    """Fingerprint of the snapshot named by the first line of a journal, None for a journal without one"""
+    try:
+        with open(journal_path, 'r') as f:
+            entry = json.loads(f.readline())
+    except (FileNotFoundError, ValueError):
+        return None
+    return entry.get('snapshot') if entry.get('op') == 'base' else None
+
+def read_journal(journal_path, fingerprint=None):
+    """
+    Entries of a JSON store journal, skipping a truncated last line. When the
+    fingerprint of the current snapshot is given and the journal names another
+    snapshot, its entries were already folded into the current one by an
+    interrupted compaction and none are returned.
+    """
+    try:
+        with open(journal_path, 'r') as f:
+            for line_number, line in enumerate(f):
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry.get('op') == 'base':
+                    if line_number == 0 and fingerprint is not None and entry['snapshot'] != fingerprint:
+                        return
+                    continue
+                yield entry
+    except FileNotFoundError:
+        return
+
+def chunked(items, size=1000):
+    """Group an iterable into lists of at most size items"""
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def import_json(store, json_path):
+    """
+    Import records from a signed_urls.json file (and its journal) into a store,
+    streaming them in batches so the file is never loaded whole. Records of the
+    same files already in the store are replaced.
+    Returns the number of records and journal entries applied.
+    """
+    count = 0
+    with file_lock(f"{json_path}.lock", shared=True):
+        for batch in chunked(iter_json_object(json_path)):
+            count += store.put_many(batch)
+        for entries in chunked(read_journal(f"{json_path}.journal", file_fingerprint(json_path))):
+            count += store.apply_entries(entries)
+    return count
+
+def export_json(store, json_path):
+    """Export all records of a store to a signed_urls.json file, streaming them in filename order"""
+    directory = os.path.dirname(os.path.abspath(json_path))
+    fd, temp_path = tempfile.mkstemp(prefix=f".{os.path.basename(json_path)}.", suffix='.tmp', dir=directory)
+    count = 0
+    try:
+        with os.fdopen(fd, 'w') as f:
+            os.chmod(temp_path, replacement_mode(json_path))
+            # Same layout as json.dump(records, f, indent=2)
+            f.write('{')
+            for filename, record in store.items():
+                record_json = json.dumps(record, indent=2).replace('\n', '\n  ')
+                f.write(f"{',' if count else ''}\n  {json.dumps(filename)}: {record_json}")
+                count += 1
+            f.write('\n}' if count else '}')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, json_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return count
+
+def store_size(records_file):
+    """Bytes used by a record store on disk, journal and SQLite WAL included"""
+    return sum(os.path.getsize(path) for path in (records_file, f"{records_file}.journal", f"{records_file}-wal")
+               if os.path.exists(path))
+
+def main():
+    commands = {'import': 4, 'export': 4, 'compact': 3}
+    if len(sys.argv) < 2 or commands.get(sys.argv[1]) != len(sys.argv):
+        print("Usage:")
+        print("  python url_store.py import <signed_urls.json> <store_file>")
+        print("  python url_store.py export <store_file> <signed_urls.json>")
+        print("  python url_store.py compact <store_file>")
+        print("Example:")
+        print("  python url_store.py import signed_urls.json signed_urls.db")
+        sys.exit(1)
+
+    command, source = sys.argv[1:3]
+    if not os.path.exists(source):
+        sys.exit(f"Error: {'File' if command == 'import' else 'Record store'} {source} does not exist")
+    if command == 'import':
+        target = sys.argv[3]
+        count = import_json(open_record_store(target), source)
+        print(f"Imported {count} records and journal entries from {source} into {target} "
+              f"({store_size(source) / 1024 / 1024:.1f} MiB -> {store_size(target) / 1024 / 1024:.1f} MiB)")
+    elif command == 'export':
+        target = sys.argv[3]
+        count = export_json(open_record_store(source), target)
+        print(f"Exported {count} records from {source} to {target}")
+    else:
+        before = store_size(source)
+        store = open_record_store(source)
+        converted = store.compact()
+        if isinstance(store, SqliteRecordStore):
+            print(f"Stored {converted} URLs compactly")
+        print(f"Compacted {source} ({before / 1024 / 1024:.1f} MiB -> {store_size(source) / 1024 / 1024:.1f} MiB)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import sys
+import json
+import time
+import asyncio
+import argparse
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from dotenv import load_dotenv
+from url_store import open_record_store, default_records_file
+from metrics import span, increment, profile_run
+
+# Objects modified this long after a URL was created are reported as modified (clock skew allowance)
+CLOCK_SKEW = timedelta(seconds=5)
+
+# Statuses of a stored URL after verification
+STATUSES = ('live', 'modified', 'missing', 'expired', 'denied', 'error')
+
+def get_verify_concurrency():
+    """Number of URLs probed at the same time (GCS_VERIFY_CONCURRENCY)"""
+    return max(1, int(os.getenv('GCS_VERIFY_CONCURRENCY', '64')))
+
+def get_verify_timeout():
+    """Seconds allowed for one probe (GCS_VERIFY_TIMEOUT)"""
+    return float(os.getenv('GCS_VERIFY_TIMEOUT', '30'))
+
+def iter_targets(records, history=True):
+    """
+    Expand (filename, record) pairs into one target dict per URL to probe: the
+    current URL, then the previous ones from the most recent, with history=True
+    """
+    for filename, record in records:
+        yield {'name': filename, 'kind': 'current', 'url': record['url'],
+               'created_at': record['created_at'], 'expiration': record['expiration']}
+        if history:
+            for index, old in enumerate(reversed(record.get('history', [])), 1):
+                yield {'name': filename, 'kind': f"history.{index}", 'url': old['url'],
+                       'created_at': old['created_at'], 'expiration': old['expiration']}
+
+def classify(target, http_status, last_modified=None, error_code=None):
+    """
+    Status of a probed URL:
+        live      the object is served and was not modified after the URL was created
+        modified  the URL works but the object was overwritten after it was created
+        missing   the object was deleted (404)
+        expired   the URL is past its expiration (not probed) or GCS says so
+        denied    GCS rejects the signature (key deleted or disabled, wrong bucket)
+        error     any other response or a network failure
+    """
+    if http_status in (200, 206):
+        if last_modified is not None:
+            created_at = datetime.fromisoformat(target['created_at']).astimezone(timezone.utc)
+            if last_modified > created_at + CLOCK_SKEW:
+                return 'modified'
+        return 'live'
+    if http_status == 404:
+        return 'missing'
+    if error_code == 'ExpiredToken':
+        return 'expired'
+    if http_status == 403 or error_code in ('SignatureDoesNotMatch', 'AccessDenied', 'InvalidToken'):
+        return 'denied'
+    return 'error'
+
+def _parse_response(status, headers, body):
+    """(last_modified, error_code) of a probe response"""
+    last_modified = None
+    if headers.get('Last-Modified'):
+        try:
+            last_modified = parsedate_to_datetime(headers['Last-Modified'])
+        except (TypeError, ValueError):
+            pass
+    error_code = None
+    if status >= 400 and body:
+        match = re.search(rb'<Code>([^<]+)</Code>', body)
+        error_code = match.group(1).decode('ascii', 'replace') if match else None
+    return last_modified, error_code
+
+def _result(target, http_status=None, last_modified=None, error_code=None, error=None):
+    if error is not None:
+        status = 'error'
+    elif http_status is None:
+        status = 'expired'
+    else:
+        status = classify(target, http_status, last_modified, error_code)
+    result = {
+        'name': target['name'],
+        'kind': target['kind'],
+        'status': status,
+        'http_status': http_status,
+        'created_at': target['created_at'],
+        'expiration': target['expiration'],
+    }
+    if last_modified is not None:
+        result['last_modified'] = last_modified.isoformat()
+    if error_code:
+        result['error_code'] = error_code
+    if error is not None:
+        result['error'] = error
+    increment('gcs_verified_urls_total', help='Stored URLs verified by status', status=status)
+    return result
+
+async def _verify_async(targets, concurrency, timeout, on_result):
+    """Probe the targets with a pooled aiohttp session, concurrency requests at a time"""
+    import aiohttp
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+
+        async def probe(target):
+            try:
+                async with session.get(target['url'], headers={'Range': 'bytes=0-0'}) as response:
+                    # A 206 carries one byte; reading it keeps the connection reusable
+                    body = await response.content.read(4096) if response.status != 200 else b''
+                    return _result(target, response.status, *_parse_response(response.status, response.headers, body))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                return _result(target, error=str(e) or type(e).__name__)
+
+        async def worker():
+            # Targets are pulled from the shared iterator, so at most concurrency probes are pending
+            for target in targets:
+                on_result(await probe(target))
+
+        await asyncio.gather(*[worker() for _ in range(concurrency)])
+
+def _verify_threaded(targets, concurrency, timeout, on_result):
+    """Probe the targets with a pooled requests session in a thread pool (without aiohttp)"""
+    import threading
+    import requests
+    from concurrent.futures import ThreadPoolExecutor
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=concurrency)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    # Expired targets are reported while the iterator is advanced, so one lock guards both
+    lock = threading.Lock()
+
+    def probe(target):
+        try:
+            with session.get(target['url'], headers={'Range': 'bytes=0-0'}, timeout=timeout, stream=True) as response:
+                body = response.raw.read(4096) if response.status_code != 200 else b''
+                return _result(target, response.status_code,
+                               *_parse_response(response.status_code, response.headers, body))
+        except requests.RequestException as e:
+            return _result(target, error=str(e))
+
+    def worker():
+        while True:
+            with lock:
+                target = next(targets, None)
+            if target is None:
+                return
+            result = probe(target)
+            with lock:
+                on_result(result)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(worker) for _ in range(concurrency)]:
+            future.result()
+
+def verify_urls(records, history=True, concurrency=None, timeout=None, on_result=None, now=None):
+    """
+    Probe stored signed URLs with a one-byte ranged GET each and report whether
+    they still serve their object. V4 URLs are signed for GET, so a HEAD request
+    would be rejected by GCS. Expired URLs are reported without a request.
+    Args:
+        records: Iterable of (filename, record) pairs, e.g. store.items()
+        history: Also probe the previous URLs of each record
+        concurrency: Probes in flight (GCS_VERIFY_CONCURRENCY by default)
+        timeout: Seconds allowed per probe (GCS_VERIFY_TIMEOUT by default)
+        on_result: Callable receiving one result dict per URL, as probes complete
+        now: Time used to decide which URLs are already expired
+    Returns:
+        Counter of URLs per status
+    """
+    concurrency = concurrency or get_verify_concurrency()
+    timeout = timeout or get_verify_timeout()
+    now = now or datetime.now()
+    counts = Counter()
+
+    def report(result):
+        counts[result['status']] += 1
+        if on_result:
+            on_result(result)
+
+    def to_probe():
+        for target in iter_targets(records, history):
+            if datetime.fromisoformat(target['expiration']) < now:
+                report(_result(target))
+            else:
+                yield target
+
+    targets = to_probe()
+    try:
+        import aiohttp  # noqa: F401
+    except ImportError:
+        aiohttp = None
+    with span('verify'):
+        if aiohttp is not None:
+            asyncio.run(_verify_async(targets, concurrency, timeout, report))
+        else:
+            _verify_threaded(targets, concurrency, timeout, report)
+    return counts
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(
+        description='Check that stored signed URLs still serve their object (deleted, overwritten, revoked)'
+    )
+    parser.add_argument('--prefix', default='', help='Only records whose blob path starts with this prefix')
+    parser.add_argument('--current-only', action='store_true', help='Skip the previous URLs of each record')
+    parser.add_argument('--concurrency', type=int, default=None,
+                        help='Probes in flight (default: GCS_VERIFY_CONCURRENCY or 64)')
+    parser.add_argument('--timeout', type=float, default=None,
+                        help='Seconds allowed per probe (default: GCS_VERIFY_TIMEOUT or 30)')
+    parser.add_argument('--output', metavar='FILE', help='Write every result to FILE as NDJSON')
+    args = parser.parse_args()
+    if args.concurrency is not None and args.concurrency < 1:
+        parser.error('--concurrency must be at least 1')
+
+    records_file = default_records_file()
+    if not os.path.exists(records_file):
+        print("No URL records found")
+        return
+    store = open_record_store(records_file)
+    records = ((filename, record) for filename, record in store.items()
+               if filename.startswith(args.prefix))
+
+    output = open(args.output, 'w') if args.output else None
+    problems = []
+    start = time.monotonic()
+
+    def on_result(result):
+        if output:
+            output.write(json.dumps(result, separators=(',', ':')) + '\n')
+        if result['kind'] == 'current' and result['status'] in ('modified', 'missing', 'denied', 'error'):
+            problems.append(result)
+
+    try:
+        counts = verify_urls(records, not args.current_only, args.concurrency, args.timeout, on_result)
+    finally:
+        if output:
+            output.close()
+    elapsed = time.monotonic() - start
+
+    print("\nURL Verification Report:")
+    print("------------------------")
+    for result in sorted(problems, key=lambda result: result['name']):
+        detail = result.get('error') or result.get('error_code') or result.get('last_modified') or ''
+        print(f"- {result['name']}: {result['status'].upper()} {result['http_status'] or ''} {detail}".rstrip())
+    total = sum(counts.values())
+    print(f"\nChecked {total} URLs in {elapsed:.1f}s ({total / elapsed if elapsed > 0 else 0:.0f} URLs/s): "
+          + ', '.join(f"{counts[status]} {status}" for status in STATUSES if counts[status]))
+    if problems:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    with profile_run():
+        main()
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import json
+import time
+import queue
+import signal
+import argparse
+import threading
+import contextlib
+from fnmatch import fnmatch
+from dotenv import load_dotenv
+from gcs_config import load_config
+from metrics import increment, get_registry, profile_run
+
+# Files still being written by editors, browsers and copy tools, and hidden files and directories
+IGNORED_PATTERNS = ('.*', '*~', '*.tmp', '*.part', '*.partial', '*.crdownload', '*.download', '*.swp')
+
+def get_settle_seconds():
+    """Seconds a file must stay unchanged before it is uploaded (GCS_WATCH_SETTLE_SECONDS)"""
+    return float(os.getenv('GCS_WATCH_SETTLE_SECONDS', '2'))
+
+def get_poll_interval():
+    """Seconds between two scans when watchdog is not installed (GCS_WATCH_POLL_INTERVAL)"""
+    return float(os.getenv('GCS_WATCH_POLL_INTERVAL', '2'))
+
+def parse_mapping(spec):
+    """(local directory, bucket folder or None) of a 'DIR' or 'DIR=bucket/folder' argument"""
+    directory, _, folder = spec.partition('=')
+    return os.path.abspath(directory), folder.strip('/') or None
+
+def _stat_key(path):
+    """(size, mtime_ns) of a regular file, None when it is gone or not a file"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    if not os.path.isfile(path):
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+class FolderWatcher:
+    """
+    Uploads and signs the files created or changed in local directories.
+
+    Change notifications (inotify through watchdog when it is installed, else
+    a periodic scan) only mark a file as pending. A file is queued once it has
+    had no event for settle_seconds and its size and modification time still
+    match, so files being written or copied are not uploaded half way. Queued
+    files are uploaded by a fixed number of worker threads, retrying transient
+    errors. The queue is bounded, so a burst of files waits on disk rather than
+    in memory. When idle, every thread is blocked and no CPU is used.
+
+    Files keep their sub directory below the watched directory, under the
+    bucket folder mapped to it, as with --batch.
+
+        watcher = FolderWatcher([('/data/drop', 'incoming')], bucket_name, credentials_path,
+                                on_result=print)
+        watcher.run()  # until watcher.stop()
+    """
+
+    def __init__(self, mappings, bucket_name, credentials_path, workers=8, settle_seconds=None,
+                 poll_interval=None, ignore=IGNORED_PATTERNS, compression=None, on_result=None):
+        # The most specific directory wins when watched directories are nested
+        self.mappings = sorted(mappings, key=lambda mapping: len(mapping[0]), reverse=True)
+        self.bucket_name = bucket_name
+        self.credentials_path = credentials_path
+        self.workers = max(1, workers)
+        self.settle_seconds = get_settle_seconds() if settle_seconds is None else settle_seconds
+        self.poll_interval = get_poll_interval() if poll_interval is None else poll_interval
+        self.ignore = tuple(ignore)
+        self.compression = compression
+        self.on_result = on_result
+        self._pending = {}    # path -> (first event, last event, stat key at the last event)
+        self._uploaded = {}   # path -> stat key of the version last uploaded
+        self._snapshot = {}   # path -> stat key, for the polling scanner
+        self._condition = threading.Condition()
+        self._queue = queue.Queue(maxsize=self.workers * 4)
+        self._stopping = threading.Event()
+
+    def _mapping(self, path):
+        for directory, folder in self.mappings:
+            if path.startswith(directory + os.sep):
+                return directory, folder
+        return None
+
+    def _ignored(self, path, directory):
+        parts = os.path.relpath(path, directory).split(os.sep)
+        return any(fnmatch(part, pattern) for part in parts for pattern in self.ignore)
+
+    def target_folder(self, path):
+        """Bucket folder of a watched file: the mapped folder followed by its sub directories"""
+        directory, folder = self._mapping(path)
+        sub_folder = os.path.relpath(os.path.dirname(path), directory)
+        parts = [folder, None if sub_folder == '.' else sub_folder.replace(os.sep, '/')]
+        return '/'.join(part for part in parts if part) or None
+
+    def notify(self, path):
+        """Mark a file as changed; it is uploaded once it has settled"""
+        path = os.path.abspath(path)
+        mapping = self._mapping(path)
+        if mapping is None or self._ignored(path, mapping[0]):
+            return
+        now = time.monotonic()
+        key = _stat_key(path)
+        with self._condition:
+            first_event = self._pending[path][0] if path in self._pending else now
+            self._pending[path] = (first_event, now, key)
+            self._condition.notify()
+        increment('gcs_watch_events_total', help='File changes seen by the folder watcher')
+
+    def _walk(self, directory):
+        """Files below a directory, skipping ignored directories"""
+        mapping = self._mapping(os.path.join(directory, ''))
+        for dirpath, dirnames, filenames in os.walk(directory):
+            dirnames[:] = [name for name in dirnames if not any(fnmatch(name, pattern) for pattern in self.ignore)]
+            for name in filenames:
+                path = os.path.join(dirpath, name)
+                if mapping is None or not self._ignored(path, mapping[0]):
+                    yield path
+
+    def _on_event(self, event):
+        if event.event_type not in ('created', 'modified', 'moved', 'closed'):
+            return
+        path = event.dest_path if event.event_type == 'moved' else event.src_path
+        if event.is_directory:
+            if event.event_type in ('created', 'moved'):
+                # Files moved in with their directory raise no events of their own
+                for file_path in self._walk(path):
+                    self.notify(file_path)
+            return
+        self.notify(path)
+
+    def _observe(self):
+        """Start a watchdog observer on the watched directories, None without watchdog"""
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+        except ImportError:
+            return None
+        watcher = self
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                watcher._on_event(event)
+
+        observer = Observer()
+        for directory, _ in self.mappings:
+            observer.schedule(Handler(), directory, recursive=True)
+        observer.start()
+        return observer
+
+    def scan(self, notify=True):
+        """Walk the watched directories and notify the files whose size or modification time changed"""
+        snapshot = {}
+        for directory, _ in self.mappings:
+            for path in self._walk(directory):
+                key = _stat_key(path)
+                if key is None or path in snapshot:
+                    continue
+                snapshot[path] = key
+                if notify and self._snapshot.get(path) != key:
+                    self.notify(path)
+        self._snapshot = snapshot
+
+    def _settle(self):
+        """
+        Queue the pending files that had no event for settle_seconds and did not
+        change since. When stopping, every pending file that did not change
+        since its last event is queued without waiting, so none is dropped.
+        """
+        while True:
+            with self._condition:
+                while True:
+                    stopping = self._stopping.is_set()
+                    if stopping:
+                        due = list(self._pending)
+                        break
+                    now = time.monotonic()
+                    due = [path for path, (_, last_event, _) in self._pending.items()
+                           if now - last_event >= self.settle_seconds]
+                    if due:
+                        break
+                    # Without pending files this waits until the next event
+                    wait = (min(last_event for _, last_event, _ in self._pending.values()) + self.settle_seconds - now
+                            if self._pending else None)
+                    self._condition.wait(wait)
+                items = [(path, *self._pending.pop(path)) for path in due]
+
+            for path, first_event, _, key in items:
+                current = _stat_key(path)
+                if current is None or current == self._uploaded.get(path):
+                    continue
+                if current != key:
+                    if stopping:
+                        print(f"{path} is still being written, not uploaded", file=sys.stderr)
+                        continue
+                    # Written to without an event (or between the event and now): wait again
+                    with self._condition:
+                        self._pending.setdefault(path, (first_event, time.monotonic(), current))
+                    continue
+                # The workers keep running until this thread has returned, so this never blocks for good
+                self._queue.put((path, current, first_event))
+            if stopping:
+                return
+
+    def _work(self):
+        from gcs_upload_and_sign import upload_and_sign
+        from retry_scheduler import call_with_retry
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            path, key, first_event = item
+            if _stat_key(path) is None:
+                continue
+            try:
+                signed_url, blob_path = call_with_retry(
+                    upload_and_sign, path, self.bucket_name, self.credentials_path, self.target_folder(path),
+                    compression=self.compression, operation='watch_upload'
+                )
+            except Exception as e:
+                increment('gcs_watch_files_total', help='Files handled by the folder watcher', result='failed')
+                result = {'path': path, 'error': str(e)}
+            else:
+                self._uploaded[path] = key
+                latency = time.monotonic() - first_event
+                increment('gcs_watch_files_total', help='Files handled by the folder watcher', result='uploaded')
+                get_registry().observe('gcs_watch_latency_seconds', latency,
+                                       help='Time from the first change of a file to its signed URL')
+                result = {'path': path, 'name': blob_path, 'url': signed_url, 'latency': round(latency, 3)}
+            if self.on_result:
+                self.on_result(result)
+
+    def run(self, scan_existing=False, polling=False):
+        """
+        Watch the directories until stop() is called, then upload the pending
+        files that are no longer changing and finish the queued uploads
+        Args:
+            scan_existing: Also upload the files already present (unchanged ones are only re-signed)
+            polling: Scan every poll_interval seconds even when watchdog is installed
+                     (network file systems do not deliver inotify events)
+        """
+        threads = [threading.Thread(target=self._work, daemon=True) for _ in range(self.workers)]
+        threads.append(threading.Thread(target=self._settle, daemon=True))
+        for thread in threads:
+            thread.start()
+
+        observer = None if polling else self._observe()
+        if observer is None:
+            # The first scan is the reference the next ones are compared with
+            self.scan(notify=scan_existing)
+        elif scan_existing:
+            for directory, _ in self.mappings:
+                for path in self._walk(directory):
+                    self.notify(path)
+        mode = 'inotify' if observer is not None else f"a scan every {self.poll_interval:g}s"
+        print(f"Watching {', '.join(directory for directory, _ in self.mappings)} with {mode}", file=sys.stderr)
+
+        try:
+            if observer is not None:
+                self._stopping.wait()
+            else:
+                while not self._stopping.wait(self.poll_interval):
+                    self.scan()
+        finally:
+            self._stopping.set()
+            if observer is not None:
+                observer.stop()
+                observer.join()
+            with self._condition:
+                self._condition.notify_all()
+            threads[-1].join()
+            for _ in range(self.workers):
+                self._queue.put(None)
+            for thread in threads[:-1]:
+                thread.join()
+
+    def stop(self):
+        self._stopping.set()
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(
+        description='Watch local directories and upload and sign every file created or changed in them'
+    )
+    parser.add_argument('directories', nargs='+', metavar='DIR[=FOLDER]',
+                        help='Directory to watch, optionally mapped to a folder of the bucket (e.g. ./exports=reports)')
+    parser.add_argument('--workers', type=int, default=int(os.getenv('GCS_UPLOAD_WORKERS', '8')),
+                        help='Concurrent uploads (default: GCS_UPLOAD_WORKERS or 8)')
+    parser.add_argument('--settle', type=float, default=None,
+                        help='Seconds a file must stay unchanged before upload (default: GCS_WATCH_SETTLE_SECONDS or 2)')
+    parser.add_argument('--poll-interval', type=float, default=None,
+                        help='Seconds between scans without inotify (default: GCS_WATCH_POLL_INTERVAL or 2)')
+    parser.add_argument('--polling', action='store_true', help='Scan periodically instead of using inotify')
+    parser.add_argument('--scan-existing', action='store_true', help='Also upload the files already present')
+    parser.add_argument('--ignore', action='append', default=[], metavar='PATTERN',
+                        help='Additional file name pattern to ignore (repeatable)')
+    parser.add_argument('--compress', choices=('gzip', 'zstd', 'off'), default=None,
+                        help='Compress text, JSON, CSV and log files while uploading (default: GCS_COMPRESSION)')
+    parser.add_argument('--output', metavar='FILE', help='Append one NDJSON line per file to FILE instead of stdout')
+    args = parser.parse_args()
+
+    bucket_name, credentials_path = load_config()
+    mappings = [parse_mapping(spec) for spec in args.directories]
+    for directory, _ in mappings:
+        if not os.path.isdir(directory):
+            sys.exit(f"Error: {directory} is not a directory")
+    from compressed_upload import get_compression
+    try:
+        get_compression(args.compress)
+    except ValueError as e:
+        sys.exit(f"Error: {e}")
+
+    output = open(args.output, 'a', encoding='utf-8') if args.output else sys.stdout
+    output_lock = threading.Lock()
+
+    def on_result(result):
+        with output_lock:
+            output.write(json.dumps(result, separators=(',', ':')) + '\n')
+            output.flush()
+
+    watcher = FolderWatcher(mappings, bucket_name, credentials_path, args.workers, args.settle, args.poll_interval,
+                            IGNORED_PATTERNS + tuple(args.ignore), args.compress, on_result)
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: watcher.stop())
+    try:
+        # Messages of the upload functions go to stderr, keeping stdout for the results
+        with contextlib.redirect_stdout(sys.stderr):
+            watcher.run(args.scan_existing, args.polling)
+    finally:
+        if args.output:
+            output.close()
+
+if __name__ == "__main__":
+    with profile_run():
+        main()